@@ -0,0 +1,226 @@
+#
+# File: class_assignment.py
+# Brief: One-to-one assignment between invoices and ledger records, out of the candidate pairs
+#        accepted by the matchers
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 Note 2 corrected, clusters are not bounded by a buyer/date bucket
+#
+# Note:
+#   1. The matchers accept every pair of invoice and ledger record which meets the match criteria,
+#      so an invoice may match several records and a record may be matched by several invoices.
+#      With constant.ASSIGNMENT_ONE_TO_ONE, each invoice keeps one record at most and each record
+#      is kept by one invoice at most
+#   2. Accepted pairs are split into clusters, the connected components of the graph of invoices
+#      and records linked by the pairs. Clusters are usually small, but their size is not bounded:
+#      pairs of consecutive dates chain into one cluster, e.g. the invoices of a buyer billed daily
+#      over a month, and a ledger text including two buyer keys links the clusters of both buyers.
+#      The size of the cluster is what picks the solver, see Note 3
+#   3. A cluster of one invoice and one record is assigned as it is. Any other cluster is
+#      ambiguous, and is solved optimally, i.e. most pairs kept and then least total score, if it
+#      has no more than ASSIGNMENT_OPTIMAL_MAX invoices and records, or greedily by score otherwise
+#   4. The score of a pair is the amount difference relative to the allowed difference, 0 to 1,
+#      plus the difference of the invoice dates in days, 0 or 1; lower is better
+#
+import csv
+import os
+import constant
+
+SOLVER_OPTIMAL = "optimal"
+SOLVER_GREEDY = "greedy"
+# cost of leaving a row of the optimal solver unassigned, larger than any sum of pair scores of a
+# cluster the optimal solver takes
+UNASSIGNED_COST = 1e6
+AMBIGUOUS_REPORT_HEADER = ("群組", "解法", "發票號碼", "候選總帳列", "配對總帳列")
+AMBIGUOUS_REPORT_SUFFIX = "_ambiguous.csv"
+
+
+class AmbiguousCluster:
+    # Class AmbiguousCluster records a cluster of more than one invoice or ledger record
+    #   sources: indexes of the source transactions of the cluster
+    #   positions: ascending ledger positions of the cluster
+    #   solver: SOLVER_OPTIMAL or SOLVER_GREEDY
+    #   assigned: the ledger position assigned to each source transaction of the cluster, if any
+    #
+    def __init__(self, sources, positions, solver, assigned):
+        self.sources = sources
+        self.positions = positions
+        self.solver = solver
+        self.assigned = assigned
+
+
+#
+# Score of the pair of the source transaction and the ledger record at position i, see Note 4
+#
+def pair_score(ledger, i, source_transaction):
+    if source_transaction.function_currency == constant.FUNCTION_CURRENCY_NTD:
+        amount_in_source = source_transaction.invoice_amount_NT
+        amount_diff = ledger.amount_nt(i) - amount_in_source
+    else:
+        amount_in_source = source_transaction.invoice_amount_US
+        amount_diff = ledger.amount_us[i] - amount_in_source
+    amount_diff_threshold = abs(amount_in_source * constant.AMOUNT_DIFF_THRESHOLD_RATIO)
+    amount_score = abs(amount_diff) / amount_diff_threshold if amount_diff_threshold > 0 else 0.0
+    date_score = abs(source_transaction.invoice_date_object().toordinal() - ledger.date_ordinal[i])
+    return amount_score + date_score
+
+
+#
+# Assign invoices to ledger records one to one. match_results are the ledger positions each source
+# transaction matches, as returned by the matchers. Returns
+#   1. the assigned results, for each source transaction a list of one ledger position at most
+#   2. the ambiguous clusters(AmbiguousCluster), in the order of their first source transaction
+# The numbers of ambiguous clusters and of dropped pairs are counted in metrics if given
+#
+def assign_one_to_one(ledger, source_transactions, match_results, metrics=None):
+    # union the source transactions sharing a ledger position
+    parent = list(range(len(source_transactions)))
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    owner = {}
+    for k, positions in enumerate(match_results):
+        for i in positions:
+            if i in owner:
+                root_k, root_owner = find(k), find(owner[i])
+                if root_k != root_owner:
+                    parent[max(root_k, root_owner)] = min(root_k, root_owner)
+            else:
+                owner[i] = k
+    clusters = {}
+    for k, positions in enumerate(match_results):
+        if len(positions) > 0:
+            clusters.setdefault(find(k), []).append(k)
+    results = [[] for _ in source_transactions]
+    ambiguous_clusters = []
+    number_of_pairs = 0
+    for sources in clusters.values():
+        positions = sorted(set(i for k in sources for i in match_results[k]))
+        number_of_pairs += sum(len(match_results[k]) for k in sources)
+        if len(sources) == 1 and len(positions) == 1:
+            results[sources[0]] = positions
+            continue
+        pairs = [(pair_score(ledger, i, source_transactions[k]), k, i) for k in sources for i in match_results[k]]
+        if len(sources) <= constant.ASSIGNMENT_OPTIMAL_MAX and len(positions) <= constant.ASSIGNMENT_OPTIMAL_MAX:
+            solver = SOLVER_OPTIMAL
+            assigned = _solve_optimal(sources, positions, pairs)
+        else:
+            solver = SOLVER_GREEDY
+            assigned = _solve_greedy(pairs)
+        for k, i in assigned.items():
+            results[k] = [i]
+        ambiguous_clusters.append(AmbiguousCluster(sources, positions, solver, assigned))
+    if metrics is not None:
+        metrics.count("ambiguous_clusters", len(ambiguous_clusters))
+        metrics.count("ambiguous_clusters_greedy",
+                      sum(1 for cluster in ambiguous_clusters if cluster.solver == SOLVER_GREEDY))
+        metrics.count("pairs_dropped", number_of_pairs - sum(len(positions) for positions in results))
+    return results, ambiguous_clusters
+
+
+#
+# Greedy assignment: pairs of lower score first, ties broken by invoice order and then row order
+#
+def _solve_greedy(pairs):
+    assigned = {}
+    taken = set()
+    for score, k, i in sorted(pairs):
+        if k not in assigned and i not in taken:
+            assigned[k] = i
+            taken.add(i)
+    return assigned
+
+
+#
+# Optimal assignment of a small cluster with the Hungarian algorithm, over a square cost matrix of
+# the pair scores, padded with UNASSIGNED_COST for pairs not accepted
+#
+def _solve_optimal(sources, positions, pairs):
+    size = max(len(sources), len(positions))
+    source_index = {k: r for r, k in enumerate(sources)}
+    position_index = {i: c for c, i in enumerate(positions)}
+    cost = [[UNASSIGNED_COST] * size for _ in range(size)]
+    for score, k, i in pairs:
+        cost[source_index[k]][position_index[i]] = score
+    assigned = {}
+    for r, c in enumerate(hungarian(cost)):
+        if r < len(sources) and c < len(positions) and cost[r][c] < UNASSIGNED_COST:
+            assigned[sources[r]] = positions[c]
+    return assigned
+
+
+#
+# Minimum cost assignment of a square cost matrix, returns the column assigned to each row
+#
+def hungarian(cost):
+    n = len(cost)
+    u = [0.0] * (n + 1)
+    v = [0.0] * (n + 1)
+    # p[j]: row assigned to column j, 1-based, 0 if none; way[j]: previous column on the path
+    p = [0] * (n + 1)
+    way = [0] * (n + 1)
+    for r in range(1, n + 1):
+        p[0] = r
+        j0 = 0
+        min_v = [float("inf")] * (n + 1)
+        used = [False] * (n + 1)
+        while True:
+            used[j0] = True
+            r0 = p[j0]
+            delta = float("inf")
+            j1 = 0
+            for j in range(1, n + 1):
+                if not used[j]:
+                    reduced = cost[r0 - 1][j - 1] - u[r0] - v[j]
+                    if reduced < min_v[j]:
+                        min_v[j] = reduced
+                        way[j] = j0
+                    if min_v[j] < delta:
+                        delta = min_v[j]
+                        j1 = j
+            for j in range(n + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_v[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0 != 0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    columns = [0] * n
+    for j in range(1, n + 1):
+        columns[p[j] - 1] = j - 1
+    return columns
+
+
+#
+# Report file of the ambiguous clusters, named after the invoice details file
+#
+def ambiguous_cluster_file(invoice_excel):
+    return os.path.splitext(invoice_excel)[0] + AMBIGUOUS_REPORT_SUFFIX
+
+
+#
+# Save the ambiguous clusters, one line per invoice of a cluster with its candidate and assigned
+# rows in the external sales worksheet
+#
+def save_ambiguous_clusters(report_file, ambiguous_clusters, ledger, source_transactions):
+    with open(report_file, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(AMBIGUOUS_REPORT_HEADER)
+        for number, cluster in enumerate(ambiguous_clusters, start=1):
+            candidate_rows = ",".join(str(ledger.row[i]) for i in cluster.positions)
+            for k in cluster.sources:
+                assigned = cluster.assigned.get(k)
+                writer.writerow((number, cluster.solver, source_transactions[k].invoice_number, candidate_rows,
+                                 ledger.row[assigned] if assigned is not None else ""))
@@ -0,0 +1,174 @@
+#
+# File: class_buyer_resolver.py
+# Brief: Buyer's name resolution, i.e. normalization of buyer's names, the alias table and the
+#        n-gram inverted index over the buyer texts of the general ledger
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+# Note:
+#   1. Buyer's names of the invoices and buyer texts of the general ledger are compared after
+#      normalization: NFKC folds full-width characters to half-width ones, whitespaces are removed
+#      and letters are case folded. Company suffixes such as 股份有限公司 are removed from buyer's
+#      names of the invoices as well, see constant.BUYER_NAME_SUFFIXES
+#   2. Aliases are read from constant.BUYER_ALIAS_FILE, a CSV of which each line is
+#      "buyer's name in the invoices,buyer's name in the general ledger", instead of being hard
+#      coded, e.g. 志邦精密有限公司 which was created as 至邦精密有限公司 in the customer profile
+#   3. BuyerIndex resolves a buyer key to the ledger positions of which the normalized text
+#      includes the key once per run, with the postings of the key's n-grams intersected over the
+#      distinct buyer texts, instead of a str.find() per pair of invoice and ledger record
+#
+import csv
+import logging
+import os
+import unicodedata
+import constant
+
+#
+# Normalized buyer text of the general ledger: NFKC, whitespaces removed and case folded
+#
+def normalize_buyer_text(text):
+    return "".join(unicodedata.normalize("NFKC", text).split()).casefold()
+
+
+# longest suffix first, so that 股份有限公司 is removed rather than 有限公司 only
+NORMALIZED_SUFFIXES = sorted({normalize_buyer_text(suffix) for suffix in constant.BUYER_NAME_SUFFIXES},
+                             key=len, reverse=True)
+
+
+#
+# Normalized buyer's name of an invoice: normalize_buyer_text() and company suffix removed, unless
+# the name is nothing but the suffix
+#
+def normalize_buyer_name(name):
+    name = normalize_buyer_text(name)
+    for suffix in NORMALIZED_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+#
+# Read the alias table, returns a dict of {buyer's name in the invoices: buyer's name in the general
+# ledger}. Empty lines and lines starting with '#' are skipped, a missing file means no aliases
+#
+def load_buyer_aliases(alias_file):
+    aliases = {}
+    if not os.path.exists(alias_file):
+        logging.warning("找不到買方別名檔 %s，不使用別名", alias_file)
+        return aliases
+    with open(alias_file, newline="", encoding="utf-8-sig") as f:
+        for line_no, fields in enumerate(csv.reader(f), start=1):
+            if len(fields) == 0 or fields[0].strip() == "" or fields[0].lstrip().startswith("#"):
+                continue
+            if len(fields) < 2 or fields[1].strip() == "":
+                logging.warning("買方別名檔 %s 第 %d 行格式錯誤: %s", alias_file, line_no, ",".join(fields))
+                continue
+            aliases[fields[0].strip()] = fields[1].strip()
+    return aliases
+
+
+class BuyerResolver:
+    # Class BuyerResolver turns buyer's names of the invoices into buyer keys, i.e. the leading
+    # LENGTH_BUYER_NAME_KEY characters of the normalized name after aliasing, memoized per name.
+    # An alias applies to the whole normalized name, or else to the key, so that the alias of
+    # 志邦精密有限公司 applies to 志邦精密工業有限公司 as well
+    #
+    def __init__(self, aliases=None):
+        self.aliases = {}
+        self.key_aliases = {}
+        for invoice_name, ledger_name in (aliases or {}).items():
+            invoice_name = normalize_buyer_name(invoice_name)
+            ledger_name = normalize_buyer_name(ledger_name)
+            self.aliases[invoice_name] = ledger_name
+            self.key_aliases[invoice_name[:constant.LENGTH_BUYER_NAME_KEY]] = \
+                ledger_name[:constant.LENGTH_BUYER_NAME_KEY]
+        self.keys = {}
+
+    def buyer_key(self, buyer_name):
+        buyer_key = self.keys.get(buyer_name)
+        if buyer_key is None:
+            name = normalize_buyer_name(buyer_name)
+            if name in self.aliases:
+                buyer_key = self.aliases[name][:constant.LENGTH_BUYER_NAME_KEY]
+            else:
+                buyer_key = name[:constant.LENGTH_BUYER_NAME_KEY]
+                buyer_key = self.key_aliases.get(buyer_key, buyer_key)
+            self.keys[buyer_name] = buyer_key
+        return buyer_key
+
+
+_default_resolver = None
+
+
+#
+# Resolver of the alias table constant.BUYER_ALIAS_FILE, located in the directory of the program
+# and read on first use, in worker processes as well
+#
+def default_resolver():
+    global _default_resolver
+    if _default_resolver is None:
+        alias_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), constant.BUYER_ALIAS_FILE)
+        _default_resolver = BuyerResolver(load_buyer_aliases(alias_file))
+    return _default_resolver
+
+
+def buyer_key(buyer_name):
+    return default_resolver().buyer_key(buyer_name)
+
+
+class BuyerIndex:
+    # Class BuyerIndex keeps the distinct normalized buyer texts of a ledger snapshot
+    # (class_ledger.LedgerSnapshot), along with
+    #   1. text_positions: ascending ledger positions of each distinct text
+    #   2. postings: every BUYER_NGRAM_LENGTH-character n-gram mapped to the distinct texts
+    #      including it
+    #   3. resolved: ledger positions of every buyer key looked up so far
+    #
+    def __init__(self, ledger, ngram_length=constant.BUYER_NGRAM_LENGTH):
+        self.ngram_length = ngram_length
+        self.texts = []
+        self.text_positions = []
+        text_ids = {}
+        for i, buyer_text in enumerate(ledger.buyer_text):
+            text_id = text_ids.get(buyer_text)
+            if text_id is None:
+                text_id = text_ids[buyer_text] = len(self.texts)
+                self.texts.append(normalize_buyer_text(buyer_text))
+                self.text_positions.append([])
+            self.text_positions[text_id].append(i)
+        self.postings = {}
+        for text_id, text in enumerate(self.texts):
+            for ngram in self._ngrams(text):
+                self.postings.setdefault(ngram, []).append(text_id)
+        self.resolved = {}
+
+    def _ngrams(self, text):
+        n = self.ngram_length
+        return set(text[k:k+n] for k in range(len(text)-n+1))
+
+    #
+    # positions_of() returns the ascending ledger positions of which the buyer text includes the
+    # buyer key. A key shorter than an n-gram is looked up in every distinct text
+    #
+    def positions_of(self, buyer_key):
+        positions = self.resolved.get(buyer_key)
+        if positions is not None:
+            return positions
+        if len(buyer_key) < self.ngram_length:
+            text_ids = range(len(self.texts))
+        else:
+            postings = sorted((self.postings.get(ngram, ()) for ngram in self._ngrams(buyer_key)), key=len)
+            text_ids = set(postings[0])
+            for posting in postings[1:]:
+                if not text_ids:
+                    break
+                text_ids.intersection_update(posting)
+        positions = []
+        for text_id in text_ids:
+            if buyer_key in self.texts[text_id]:
+                positions.extend(self.text_positions[text_id])
+        positions.sort()
+        self.resolved[buyer_key] = positions
+        return positions
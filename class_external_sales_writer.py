@@ -0,0 +1,71 @@
+#
+# File: class_external_sales_writer.py
+# Brief: Streaming writer of the external sales Excel file
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+# Note:
+#   1. xlsxwriter in constant_memory mode flushes every row to disk once the next row is started,
+#      so rows have to be written in order, and memory stays flat no matter how large the ledger is
+#   2. xlsxwriter's default font is Calibri, which was set cell by cell in openpyxl before
+#
+import xlsxwriter
+import constant
+
+ES_HEADER_UNIFIED_INVOICE_NO = "統一發票號碼"
+ES_HEADER_UINV_AMT = "發票稅後\t台幣總金額\t(美金報價)"
+ES_HEADER_INVOICE_MATCHED = "比對"
+
+
+class ExternalSalesWriter:
+    # Class ExternalSalesWriter writes rows of the general ledger layout to the external sales
+    # worksheet, with the 3 matching result columns(統一發票號碼, amount, 比對) inserted in front
+    # of the 4th column on the fly. Formats are applied per column or shared by cells, instead of
+    # being created cell by cell
+    #
+    def __init__(self, ext_sales_excel):
+        self.workbook = xlsxwriter.Workbook(ext_sales_excel,
+                                            {"constant_memory": True,
+                                             "strings_to_formulas": False,
+                                             "strings_to_urls": False,
+                                             "default_date_format": "mm/dd/yyyy"})
+        self.worksheet = self.workbook.add_worksheet("Sheet0")
+        self.amount_format = self.workbook.add_format({"num_format": '"$"#,##0_-'})
+        wrap_format = self.workbook.add_format({"text_wrap": True})
+        self.worksheet.set_column(0, 25, 12)
+        self.worksheet.set_column("C:C", 16)
+        self.worksheet.set_column("D:D", 20)
+        self.worksheet.set_column("E:E", 12, wrap_format)
+        self.worksheet.set_column("O:O", 28)
+        self.worksheet.autofilter("A1:Z1")
+        self.worksheet.freeze_panes("E2")
+        self.next_row = 0
+
+    def write_header(self, header):
+        self._write_values(header)
+        self.worksheet.write_row(self.next_row, constant.COL_ES_UNIFIED_INVOICE_NO,
+                                 (ES_HEADER_UNIFIED_INVOICE_NO, ES_HEADER_UINV_AMT, ES_HEADER_INVOICE_MATCHED))
+        self.next_row += 1
+
+    #
+    # write_row() writes one row of the general ledger layout, annotation is either None or the
+    # matching result (unified invoice number, invoice amount) of this row
+    #
+    def write_row(self, values, annotation=None):
+        self._write_values(values)
+        if annotation is not None:
+            unified_invoice_no, invoice_amount_nt = annotation
+            self.worksheet.write(self.next_row, constant.COL_ES_UNIFIED_INVOICE_NO, unified_invoice_no)
+            self.worksheet.write(self.next_row, constant.COL_ES_UINV_AMT, invoice_amount_nt, self.amount_format)
+            self.worksheet.write(self.next_row, constant.COL_ES_INVOICE_MATCHED, "配對")
+        self.next_row += 1
+
+    def _write_values(self, values):
+        insert_at = constant.COL_ES_UNIFIED_INVOICE_NO
+        self.worksheet.write_row(self.next_row, 0, values[:insert_at])
+        self.worksheet.write_row(self.next_row, insert_at + constant.COL_GL_ES_OFFSET, values[insert_at:])
+
+    def close(self):
+        self.workbook.close()
@@ -0,0 +1,119 @@
+#
+# File: class_invoice_annotation.py
+# Brief: '發票配對' results of the invoice details, collected per row while matching and written
+#        out in one pass, as a sidecar file, a single-column patch or an annotated copy of the .xls
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 '期間外' result of invoices dated out of the date range
+#
+# Note:
+#   1. Results are kept as one byte per row of the invoice details, instead of an xlutils copy of
+#      the whole workbook along with its formatting
+#   2. Annotation modes, constant.ANNOTATION_*:
+#      - xlsx/csv: sidecar file of row, invoice number and '發票配對', keyed by invoice number
+#      - column: single-column CSV of '發票配對' in the row order of the invoice details, header
+#        included, to be pasted over the '發票配對' column
+#      - copy: the invoice details .xls rewritten through xlutils with the '發票配對' column, formatting
+#        preserved; the workbook is opened with formatting info only when it is saved
+#   3. Sidecar files are named after the invoice details file, see annotation_file()
+#
+import csv
+import os
+import xlrd
+import xlsxwriter
+from xlutils.copy import copy as xlutils_copy
+import constant
+
+# result codes of a row, the code of a row not annotated, e.g. the header row, is 0
+RESULTS = ("", "是", "否", "作廢", "期間外")
+RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}
+CHECKED_TITLE = "發票配對"
+SIDECAR_HEADER = ("列", "發票號碼", CHECKED_TITLE)
+ANNOTATION_FILE_SUFFIXES = {constant.ANNOTATION_XLSX: "_matches.xlsx",
+                            constant.ANNOTATION_CSV: "_matches.csv",
+                            constant.ANNOTATION_COLUMN: "_match_column.csv"}
+
+
+class InvoiceAnnotations:
+    # Class InvoiceAnnotations keeps the '發票配對' result of every row of the invoice details worksheet
+    #   invoice_excel: the invoice details Excel file
+    #   invoice_numbers: the invoice numbers of the rows below the header row
+    #   codes: result code of every row, header row included, see RESULTS
+    #
+    def __init__(self, invoice_excel, invoice_numbers):
+        self.invoice_excel = invoice_excel
+        self.invoice_numbers = invoice_numbers
+        self.codes = bytearray(len(invoice_numbers) + 1)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def mark(self, row, result):
+        self.codes[row] = RESULT_CODES[result]
+
+    def result(self, row):
+        return RESULTS[self.codes[row]]
+
+    #
+    # save() writes the results with the annotation mode, and returns the name of the file written
+    #
+    def save(self, mode=constant.ANNOTATION_XLSX):
+        output_file = annotation_file(self.invoice_excel, mode)
+        if mode == constant.ANNOTATION_COPY:
+            self._save_copy(output_file)
+        elif mode == constant.ANNOTATION_XLSX:
+            self._save_xlsx(output_file)
+        elif mode == constant.ANNOTATION_CSV:
+            self._save_csv(output_file)
+        elif mode == constant.ANNOTATION_COLUMN:
+            self._save_column(output_file)
+        else:
+            raise ValueError("Unknown annotation mode: %s" % mode)
+        return output_file
+
+    def _annotated_rows(self):
+        for row in range(1, len(self.codes)):
+            if self.codes[row] != 0:
+                yield row + 1, self.invoice_numbers[row - 1], RESULTS[self.codes[row]]
+
+    def _save_copy(self, output_file):
+        source_wb = xlrd.open_workbook(self.invoice_excel, formatting_info=True)
+        target_wb = xlutils_copy(source_wb)
+        target_ws = target_wb.get_sheet(0)
+        target_ws.write(0, constant.COL_INVOICE_CHECKED, CHECKED_TITLE)
+        for row in range(1, len(self.codes)):
+            if self.codes[row] != 0:
+                target_ws.write(row, constant.COL_INVOICE_CHECKED, RESULTS[self.codes[row]])
+        target_wb.save(output_file)
+
+    def _save_xlsx(self, output_file):
+        workbook = xlsxwriter.Workbook(output_file, {"constant_memory": True})
+        worksheet = workbook.add_worksheet(CHECKED_TITLE)
+        worksheet.write_row(0, 0, SIDECAR_HEADER)
+        for jt, annotated_row in enumerate(self._annotated_rows(), start=1):
+            worksheet.write_row(jt, 0, annotated_row)
+        workbook.close()
+
+    def _save_csv(self, output_file):
+        with open(output_file, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(SIDECAR_HEADER)
+            writer.writerows(self._annotated_rows())
+
+    def _save_column(self, output_file):
+        with open(output_file, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow((CHECKED_TITLE,))
+            writer.writerows((RESULTS[code],) for code in self.codes[1:])
+
+
+#
+# File the results of the invoice details are written to with the annotation mode, the invoice
+# details file itself for constant.ANNOTATION_COPY
+#
+def annotation_file(invoice_excel, mode):
+    if mode == constant.ANNOTATION_COPY:
+        return invoice_excel
+    return os.path.splitext(invoice_excel)[0] + ANNOTATION_FILE_SUFFIXES[mode]
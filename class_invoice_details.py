@@ -0,0 +1,92 @@
+#
+# File: class_invoice_details.py
+# Brief: Columnar snapshot of the invoice details .xls, only the columns the invoice matching needs,
+#        read with xlrd's on-demand sheet loading
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 totals and remarks parsed column-wise, rows which can not be parsed reported
+#   3. 2026/10/18: v. 0.3 invoice dates validated, void invoices counted
+#
+# Note:
+#   1. Only the invoice details sheet is loaded, without formatting info, and the columns of
+#      INVOICE_COLUMNS are taken out of it with col_values(); the sheet is released right after,
+#      so that extra columns of the worksheet are not kept while matching
+#   2. Totals, USD remarks and exchange rates are parsed, and invoice dates validated, column-wise
+#      by class_invoice_parser.py, void invoices are not parsed. Rows which can not be parsed are
+#      kept, marked invalid, along with the parse errors, and are never matched
+#
+import xlrd
+import constant
+import class_invoice_parser
+import class_transaction
+
+INVOICE_SHEET_NAME = "Sheet0"
+# Column positions of the fields taken into the snapshot, in the order of
+# (invoice no, remark, status, invoice date, buyer, total)
+INVOICE_COLUMNS = (constant.COL_INVOICE_NO, constant.COL_INVOICE_REMARK, constant.COL_INVOICE_STATUS,
+                   constant.COL_INVOICE_DATE, constant.COL_INVOICE_BUYER, constant.COL_INVOICE_TOTAL)
+VOID_STATUS = class_invoice_parser.VOID_STATUS
+
+
+class InvoiceDetails:
+    # Class InvoiceDetails keeps the rows below the header row of the invoice details worksheet in
+    # typed columns, position k being row k + 1 of the worksheet
+    #   1. invoice_no, remark, status, invoice_date, buyer_name: strings as in the worksheet
+    #   2. total, is_usd, exchange_rate, valid: typed columns of class_invoice_parser.ParsedInvoiceColumns
+    #   3. parse_errors: (position, field, value, reason) of the rows which can not be parsed
+    #   4. number_of_void: number of void invoices
+    #
+    def __init__(self, invoice_no, remark, status, invoice_date, buyer_name, total):
+        self.invoice_no = invoice_no
+        self.remark = remark
+        self.status = status
+        self.invoice_date = invoice_date
+        self.buyer_name = buyer_name
+        parsed = class_invoice_parser.parse_invoice_columns(status, remark, total, invoice_date)
+        self.total = parsed.total
+        self.is_usd = parsed.is_usd
+        self.exchange_rate = parsed.exchange_rate
+        self.valid = parsed.valid
+        self.parse_errors = parsed.errors
+        self.number_of_void = parsed.number_of_void
+
+    def __len__(self):
+        return len(self.invoice_no)
+
+    def is_void(self, k):
+        return self.status[k] == VOID_STATUS
+
+    def is_valid(self, k):
+        return self.valid[k] == 1
+
+    #
+    # transaction() returns the invoice at position k as a source transaction
+    #
+    def transaction(self, k):
+        if self.is_usd[k]:
+            function_currency = constant.FUNCTION_CURRENCY_USD
+        else:
+            function_currency = constant.FUNCTION_CURRENCY_NTD
+        return class_transaction.Transaction(self.invoice_no[k],
+                                             self.buyer_name[k],
+                                             self.invoice_date[k],
+                                             self.total[k],
+                                             0.0,
+                                             function_currency,
+                                             self.exchange_rate[k],
+                                             constant.DATA_SOURCE_INVOICE_DETAIL)
+
+
+#
+# Read the invoice details Excel file, which is of .xls format, into a snapshot
+#
+def read_invoice_details(invoice_excel, sheet_name=INVOICE_SHEET_NAME):
+    workbook = xlrd.open_workbook(invoice_excel, on_demand=True)
+    try:
+        sheet = workbook.sheet_by_name(sheet_name)
+        columns = [sheet.col_values(col, 1) for col in INVOICE_COLUMNS]
+    finally:
+        workbook.release_resources()
+    return InvoiceDetails(*columns)
@@ -0,0 +1,142 @@
+#
+# File: class_invoice_parser.py
+# Brief: Column-wise parsing of the totals and remarks of the invoice details into typed arrays of
+#        amounts, currencies and exchange rates, with a report of the rows which can not be parsed
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 invoice dates validated, void invoices counted
+#
+# Note:
+#   1. The columns are converted in one pass, instead of one call of utility.comma_separated_amount_to_float(),
+#      utility.is_usd_remark() and utility.exchange_rate_of_remark() per row, which scan the remark
+#      twice each and cut the rate out at fixed offsets from the markers
+#   2. A remark claims a USD transaction if it includes both constant.EXCHANGE_RATE_LEADING_CHRS and
+#      constant.USD_AMOUNT_CHRS, as it used to. The rate is the number following the former, found
+#      with the precompiled EXCHANGE_RATE_PATTERN, so that "匯率:29.85,美金未稅" is read as 29.85
+#      rather than cut short at a fixed offset
+#   3. Totals are text with thousands separators, or numbers; separators are removed with one
+#      str.replace() and the text converted by float(), both in C, which measures faster than
+#      matching a pattern first, see xlsrw_parse_benchmark.py
+#   4. A total which is not a number, the remark of a USD transaction without a positive rate, or
+#      an invoice date which is not of constant.DATE_FORMAT_INVOICE, makes the row invalid and is
+#      reported in errors, instead of raising ValueError in the middle of a run. Void invoices are
+#      not parsed, only counted
+#
+from array import array
+from itertools import repeat
+import csv
+import os
+import re
+import constant
+import utility
+
+VOID_STATUS = "作廢"
+# the rate following the exchange rate marker, thousands separators allowed
+EXCHANGE_RATE_PATTERN = re.compile(re.escape(constant.EXCHANGE_RATE_LEADING_CHRS) +
+                                   r"\s*([0-9][0-9,]*(?:\.[0-9]*)?|\.[0-9]+)")
+FIELD_TOTAL = "總計"
+FIELD_REMARK = "備註"
+FIELD_DATE = "發票日期"
+PARSE_ERROR_HEADER = ("列", "發票號碼", "欄位", "內容", "錯誤")
+PARSE_ERROR_SUFFIX = "_parse_errors.csv"
+
+
+class ParsedInvoiceColumns:
+    # Class ParsedInvoiceColumns keeps the typed columns parsed out of the invoice details, position
+    # k being row k + 2 of the worksheet
+    #   1. total: NTD total, 0.0 for void and invalid invoices
+    #   2. is_usd: 1 if the remark claims a USD transaction
+    #   3. exchange_rate: exchange rate in the remark of USD transactions, 1.0 otherwise
+    #   4. valid: 1 unless the total, the remark or the invoice date of the row can not be parsed
+    #   5. errors: tuples of (position, field, value, reason) of the rows which can not be parsed
+    #   6. number_of_void: number of void invoices
+    #
+    def __init__(self):
+        self.total = array('d')
+        self.is_usd = array('b')
+        self.exchange_rate = array('d')
+        self.valid = array('b')
+        self.errors = []
+        self.number_of_void = 0
+
+    def __len__(self):
+        return len(self.total)
+
+
+#
+# Parse the status, remark and total columns of the invoice details in one pass, and validate the
+# invoice dates if given
+#
+def parse_invoice_columns(statuses, remarks, totals, dates=None):
+    parsed = ParsedInvoiceColumns()
+    total_column = parsed.total
+    is_usd_column = parsed.is_usd
+    rate_column = parsed.exchange_rate
+    valid_column = parsed.valid
+    errors = parsed.errors
+    rate_leading = constant.EXCHANGE_RATE_LEADING_CHRS
+    usd_amount = constant.USD_AMOUNT_CHRS
+    search_rate = EXCHANGE_RATE_PATTERN.search
+    parse_date = utility.parse_date
+    date_format = constant.DATE_FORMAT_INVOICE
+    if dates is None:
+        dates = repeat(None)
+    for k, (status, remark, total, date) in enumerate(zip(statuses, remarks, totals, dates)):
+        if status == VOID_STATUS:
+            total_column.append(0.0)
+            is_usd_column.append(0)
+            rate_column.append(1.0)
+            valid_column.append(1)
+            parsed.number_of_void += 1
+            continue
+        valid = 1
+        if type(total) is not float:
+            try:
+                total = float(total.replace(",", ""))
+            except (ValueError, AttributeError):
+                errors.append((k, FIELD_TOTAL, total, "總計不是數字"))
+                total = 0.0
+                valid = 0
+        is_usd = 0
+        rate = 1.0
+        if type(remark) is str and rate_leading in remark and usd_amount in remark:
+            is_usd = 1
+            m = search_rate(remark)
+            if m is not None:
+                rate = float(m.group(1).replace(",", ""))
+            if m is None or rate <= 0.0:
+                errors.append((k, FIELD_REMARK, remark, "美金交易匯率無法辨識"))
+                rate = 1.0
+                valid = 0
+        if date is not None:
+            try:
+                parse_date(date, date_format)
+            except (TypeError, ValueError):
+                errors.append((k, FIELD_DATE, date, "發票日期無法辨識"))
+                valid = 0
+        total_column.append(total if valid else 0.0)
+        is_usd_column.append(is_usd)
+        rate_column.append(rate)
+        valid_column.append(valid)
+    return parsed
+
+
+#
+# Report file of the rows which can not be parsed, named after the invoice details file
+#
+def parse_error_file(invoice_excel):
+    return os.path.splitext(invoice_excel)[0] + PARSE_ERROR_SUFFIX
+
+
+#
+# Save the parse errors, one line per field which can not be parsed, with the row number in the
+# worksheet and the invoice number
+#
+def save_parse_errors(report_file, errors, invoice_numbers):
+    with open(report_file, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(PARSE_ERROR_HEADER)
+        for k, field, value, reason in errors:
+            writer.writerow((k + 2, invoice_numbers[k], field, value, reason))
@@ -0,0 +1,155 @@
+#
+# File: class_ledger.py
+# Brief: Columnar snapshot of the account receivable records in the filtered general ledger,
+#        loaded once for the invoice matching stage
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 match_resolved() for records resolved to the buyer
+#   3. 2026/10/18: v. 0.3 candidate index of the snapshot kept along with it
+#
+from array import array
+from datetime import datetime, date
+import logging
+import constant
+import class_transaction
+import utility
+
+# Column positions of the fields taken into the snapshot, in the order of
+# (invoice no, text, invoice date, account description, amount, exchange rate)
+GL_COLUMNS = (constant.COL_GL_INVOICE_NO, constant.COL_GL_TEXT, constant.COL_GL_INVOICE_DATE,
+              constant.COL_GL_ACCOUNT_DESCRIPTION, constant.COL_GL_AMOUNT, constant.COL_GL_EXCHANGE_RATE)
+
+
+class LedgerSnapshot:
+    # Class LedgerSnapshot keeps the account receivable records in compact typed columns
+    #   1. row: row number of the record in the external sales worksheet
+    #   2. invoice_no, buyer_text: strings
+    #   3. date_ordinal: invoice date as date.toordinal()
+    #   4. amount_cents: NTD amount in integer cents
+    #   5. exchange_rate, amount_us: exchange rate and USD amount, 1.0 and 0.0 for NTD records
+    #   6. ledger_index: candidate index of the records(class_ledger_index.LedgerIndex) once built,
+    #      kept for the next run against the same snapshot, e.g. by class_reconcile_service.py
+    # The account receivable filter and the USD/NTD conversion are applied once per record when
+    # the record is appended
+    #
+    def __init__(self):
+        self.row = array('q')
+        self.invoice_no = []
+        self.buyer_text = []
+        self.date_ordinal = array('q')
+        self.amount_cents = array('q')
+        self.exchange_rate = array('d')
+        self.amount_us = array('d')
+        self.ledger_index = None
+
+    def __len__(self):
+        return len(self.row)
+
+    #
+    # append_values() appends one record given the whole row of values, returns False if the
+    # record is not an account receivable one or can not be used for matching
+    #
+    def append_values(self, row, values, columns=GL_COLUMNS):
+        col_invoice_no, col_text, col_date, col_account, col_amount, col_rate = columns
+        account = values[col_account]
+        amount = values[col_amount]
+        if type(account) is not str or not utility.is_account_receivable(account, amount):
+            return False
+        buyer_text = values[col_text]
+        date_ordinal = ledger_date_ordinal(values[col_date])
+        if type(buyer_text) is not str or date_ordinal is None:
+            logging.warning("總帳第 %d 列買方或發票日期無法辨識，不列入比對", row)
+            return False
+        try:
+            is_usd = utility.is_usd_exchange_rate(values[col_rate])
+        except (ValueError, TypeError):
+            is_usd = False
+        if is_usd:
+            exchange_rate = float(values[col_rate])
+            amount_us = amount / exchange_rate
+        else:
+            exchange_rate = 1.0
+            amount_us = 0.0
+        self.append_record(row, values[col_invoice_no], buyer_text, date_ordinal, round(amount * 100),
+                           exchange_rate, amount_us)
+        return True
+
+    #
+    # append_record() appends one record of which the values are already parsed
+    #
+    def append_record(self, row, invoice_no, buyer_text, date_ordinal, amount_cents, exchange_rate, amount_us):
+        self.row.append(row)
+        self.invoice_no.append(invoice_no)
+        self.buyer_text.append(buyer_text)
+        self.date_ordinal.append(date_ordinal)
+        self.amount_cents.append(amount_cents)
+        self.exchange_rate.append(exchange_rate)
+        self.amount_us.append(amount_us)
+        self.ledger_index = None
+
+    #
+    # subset() returns a snapshot of the records at the given positions, row numbers are kept
+    #
+    def subset(self, positions):
+        ledger = LedgerSnapshot()
+        for i in positions:
+            ledger.append_record(self.row[i], self.invoice_no[i], self.buyer_text[i], self.date_ordinal[i],
+                                 self.amount_cents[i], self.exchange_rate[i], self.amount_us[i])
+        return ledger
+
+    def amount_nt(self, i):
+        return self.amount_cents[i] / 100
+
+    def match(self, i, source_transaction):
+        return source_transaction.match_ledger_values(self.buyer_text[i], self.date_ordinal[i],
+                                                      self.amount_nt(i), self.amount_us[i])
+
+    #
+    # match_resolved() checks the amount and the date only, for the record at a position resolved
+    # to the buyer of the source transaction through class_buyer_resolver.BuyerIndex
+    #
+    def match_resolved(self, i, source_transaction):
+        return source_transaction.match_amount_and_date(self.date_ordinal[i], self.amount_nt(i),
+                                                        self.amount_us[i])
+
+    #
+    # transaction() rebuilds the Transaction object of the i-th record, e.g. for logging a match
+    #
+    def transaction(self, i):
+        if self.exchange_rate[i] > 1.0:
+            function_currency = constant.FUNCTION_CURRENCY_USD
+        else:
+            function_currency = constant.FUNCTION_CURRENCY_NTD
+        return class_transaction.Transaction(self.invoice_no[i],
+                                             self.buyer_text[i],
+                                             date.fromordinal(self.date_ordinal[i]).strftime(constant.DATE_FORMAT_GENERAL_LEDGER),
+                                             self.amount_nt(i),
+                                             self.amount_us[i],
+                                             function_currency,
+                                             self.exchange_rate[i],
+                                             constant.DATA_SOURCE_GENERAL_LEDGER)
+
+
+#
+# Load the snapshot from the filtered general ledger rows handed over in memory, which are
+# written to the external sales worksheet in the same order right after its header row
+#
+def load_general_ledger_rows(gl_rows):
+    ledger = LedgerSnapshot()
+    for jt, values in enumerate(gl_rows, start=2):
+        ledger.append_values(jt, values, GL_COLUMNS)
+    return ledger
+
+
+#
+# Invoice date in the general ledger is a "%m/%d/%Y" string
+#
+def ledger_date_ordinal(invoice_date):
+    if isinstance(invoice_date, datetime):
+        return invoice_date.toordinal()
+    try:
+        return utility.parse_date(invoice_date, constant.DATE_FORMAT_GENERAL_LEDGER).toordinal()
+    except (ValueError, TypeError):
+        return None
@@ -0,0 +1,131 @@
+#
+# File: class_ledger_cache.py
+# Brief: On-disk cache of the parsed, Accounts Receivable filtered general ledger, so that re-runs
+#        against an unchanged general ledger skip Excel parsing
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 entries keyed by the general ledger filter as well
+#
+# Note:
+#   1. Cache entries are keyed by SHA-256 of the general ledger file content, the key of the
+#      general ledger filter(class_row_filter.GeneralLedgerFilter.key()) and the cache schema
+#      version. Size and mtime of every general ledger seen are kept in an index, so that the file
+#      is hashed again only if either of them changed
+#   2. Rows are stored column by column, a list of values per column, pickled with the highest
+#      protocol; the header row and the length of each row are stored along with them
+#   3. Least recently used entries are evicted once the total size of the cache exceeds max_bytes
+#   4. Entries and the index are written to a temporary file and renamed, so that concurrent runs,
+#      e.g. batch workers, never read a partially written entry
+#
+import hashlib
+from itertools import zip_longest
+import json
+import logging
+import os
+import pickle
+
+# bump LEDGER_CACHE_SCHEMA_VERSION whenever the rows filtered or the layout of an entry changes
+LEDGER_CACHE_SCHEMA_VERSION = 2
+LEDGER_CACHE_INDEX_FILE = "index.json"
+LEDGER_CACHE_SUFFIX = ".ledger"
+DEFAULT_LEDGER_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+class LedgerCache:
+    def __init__(self, cache_dir, max_bytes=DEFAULT_LEDGER_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    #
+    # load() returns (header, rows) of the general ledger filtered with the filter of filter_key if it
+    # is cached, None otherwise
+    #
+    def load(self, gl_excel, filter_key=""):
+        entry_file = self._entry_file(gl_excel, filter_key)
+        if not os.path.exists(entry_file):
+            return None
+        try:
+            with open(entry_file, "rb") as f:
+                schema_version, header, row_lengths, columns = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError) as e:
+            logging.warning("總帳快取 %s 無法讀取: %s", entry_file, e)
+            return None
+        if schema_version != LEDGER_CACHE_SCHEMA_VERSION:
+            return None
+        # touch the entry for LRU eviction
+        os.utime(entry_file)
+        rows = [r[:length] for r, length in zip(zip(*columns), row_lengths)]
+        return header, rows
+
+    def store(self, gl_excel, header, rows, filter_key=""):
+        entry_file = self._entry_file(gl_excel, filter_key)
+        row_lengths = [len(r) for r in rows]
+        columns = [list(column) for column in zip_longest(*rows)]
+        self._write_atomically(entry_file,
+                               pickle.dumps((LEDGER_CACHE_SCHEMA_VERSION, header, row_lengths, columns),
+                                            protocol=pickle.HIGHEST_PROTOCOL))
+        self.evict()
+
+    #
+    # evict() removes least recently used entries until the cache fits in max_bytes
+    #
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(LEDGER_CACHE_SUFFIX):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total_bytes = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except OSError:
+                pass
+
+    def _entry_file(self, gl_excel, filter_key):
+        name = "%s_%s_v%d%s" % (self._content_hash(gl_excel), filter_key, LEDGER_CACHE_SCHEMA_VERSION,
+                                LEDGER_CACHE_SUFFIX)
+        return os.path.join(self.cache_dir, name)
+
+    #
+    # SHA-256 of the file content, looked up in the index by path, size and mtime first
+    #
+    def _content_hash(self, gl_excel):
+        path = os.path.abspath(gl_excel)
+        stat = os.stat(path)
+        index = self._read_index()
+        known = index.get(path)
+        if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        content_hash = sha256.hexdigest()
+        index[path] = [stat.st_size, stat.st_mtime_ns, content_hash]
+        self._write_atomically(os.path.join(self.cache_dir, LEDGER_CACHE_INDEX_FILE),
+                               json.dumps(index, ensure_ascii=False).encode("utf-8"))
+        return content_hash
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, LEDGER_CACHE_INDEX_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_atomically(self, path, data):
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
@@ -0,0 +1,79 @@
+#
+# File: class_ledger_index.py
+# Brief: Candidate index over the filtered external sales records, so that each invoice only
+#        probes the few records Transaction.match_transaction() could accept
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 buyer keys resolved through class_buyer_resolver.BuyerIndex
+#   3. 2026/10/18: v. 0.3 index kept with the ledger snapshot and reused by later runs
+#
+import class_buyer_resolver
+
+
+class LedgerIndex:
+    # Class LedgerIndex resolves the buyer key of a source transaction to the records of a ledger
+    # snapshot(class_ledger.LedgerSnapshot) of which the buyer text includes it, through the n-gram
+    # index of class_buyer_resolver.BuyerIndex, since buyer's name in the invoice only needs to be
+    # found somewhere in the text of the general ledger. The records of each buyer key are then
+    # bucketed by the ordinal of the invoice date, since the invoice dates may differ by one day at
+    # most. Buyer keys are resolved once per run, on their first lookup. The buyer index of the
+    # ledger is built unless given
+    #
+    def __init__(self, ledger, buyer_index=None):
+        self.ledger = ledger
+        if buyer_index is None:
+            buyer_index = class_buyer_resolver.BuyerIndex(ledger)
+        self.buyer_index = buyer_index
+        self.date_buckets = {}
+
+    def __len__(self):
+        return len(self.ledger)
+
+    #
+    # candidates() returns the positions of records in the snapshot, in row order, of which the
+    # buyer text includes the buyer key of the source transaction and the invoice date is within a
+    # day of it. It falls back to all records of the buyer if the invoice date can not be parsed
+    #
+    def candidates(self, source_transaction):
+        buyer_key = source_transaction.buyer_key()
+        try:
+            date_ordinal = source_transaction.invoice_date_object().toordinal()
+        except (ValueError, TypeError):
+            return self.buyer_index.positions_of(buyer_key)
+        date_buckets = self.date_buckets.get(buyer_key)
+        if date_buckets is None:
+            date_buckets = self.date_buckets[buyer_key] = {}
+            for i in self.buyer_index.positions_of(buyer_key):
+                date_buckets.setdefault(self.ledger.date_ordinal[i], []).append(i)
+        found = []
+        for day in (date_ordinal-1, date_ordinal, date_ordinal+1):
+            found.extend(date_buckets.get(day, ()))
+        found.sort()
+        return found
+
+
+#
+# Match every source transaction against the ledger snapshot through the index. Returns, for each
+# source transaction, the list of ledger positions it matches in row order. The number of candidates
+# examined is counted, and the progress reported, in metrics(class_metrics.RunMetrics) if given.
+# The index is kept with the snapshot, so that buyer keys resolved by one run are not resolved again
+# by the next run against the same snapshot
+#
+def match_all(ledger, source_transactions, metrics=None):
+    ledger_index = ledger.ledger_index
+    if ledger_index is None:
+        ledger_index = ledger.ledger_index = LedgerIndex(ledger)
+    results = []
+    number_of_candidates = 0
+    for k, source_transaction in enumerate(source_transactions):
+        if metrics is not None:
+            metrics.progress("match_invoices", k + 1, len(source_transactions))
+        candidates = ledger_index.candidates(source_transaction)
+        number_of_candidates += len(candidates)
+        results.append([it for it in candidates if ledger.match_resolved(it, source_transaction)])
+    if metrics is not None:
+        metrics.count("candidates", number_of_candidates)
+        metrics.count("buyer_keys", len(ledger_index.buyer_index.resolved))
+    return results
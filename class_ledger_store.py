@@ -0,0 +1,162 @@
+#
+# File: class_ledger_store.py
+# Brief: Local SQLite store accumulating the Accounts Receivable rows of general ledger exports,
+#        so that any period can be reconciled without reading the exports again
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 buyer text and amount columns, their indexes and query_amount_range()
+#                  removed, nothing queried them
+#   3. 2026/10/18: v. 0.3 rows stored as JSON along with the general ledger filter, the buyer and
+#                  the amount in indexed columns, which query() takes
+#
+# Note:
+#   1. Every row is kept whole as JSON text, row_values, along with the columns it is queried by,
+#      which are indexed: the key of the general ledger filter(class_row_filter.GeneralLedgerFilter)
+#      the row was appended under, voucher date(COL_GL_INVOICE_DATE) as date ordinal, buyer and NTD
+#      amount in integer cents. Dates in the rows, if any, are kept as ISO text, see _encode_value()
+#   2. Buyer texts are normalized as the matching does, see class_buyer_resolver.normalize_buyer_text(),
+#      and kept once each in ledger_buyers, rows referring to them by buyer_id. A buyer key is looked
+#      up in the distinct buyer texts, as class_buyer_resolver.BuyerIndex does, and the rows of the
+#      texts including it are then taken through the index of buyer_id
+#   3. Rows are identified by a fingerprint of the filter key, their values and their occurrence
+#      among identical rows of the same export, so that appending overlapping exports, e.g. a
+#      year-to-date export every month, does not duplicate rows, while rows appended under another
+#      filter are kept apart, and never returned for a filter they were not appended under
+#   4. Rows are returned in the order they were first appended, i.e. the order of the exports
+#   5. The store is a file users keep and share, hence JSON rather than pickle, which would run
+#      code of a crafted file on load. Stores of v. 0.1 and v. 0.2, which are pickled, are refused
+#      with ValueError instead of being read; they are rebuilt by appending the exports again
+#
+from datetime import datetime
+import hashlib
+import json
+import sqlite3
+import constant
+import class_buyer_resolver
+import class_ledger
+
+# PRAGMA user_version of the stores of this layout
+LEDGER_STORE_VERSION = 3
+LEDGER_STORE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS ledger_header (id INTEGER PRIMARY KEY CHECK (id = 1), row_values TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS ledger_buyers (id INTEGER PRIMARY KEY, buyer_text TEXT UNIQUE NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS ledger_rows (id INTEGER PRIMARY KEY, fingerprint TEXT UNIQUE NOT NULL, "
+    "filter_key TEXT NOT NULL, voucher_date INTEGER, buyer_id INTEGER REFERENCES ledger_buyers (id), "
+    "amount_cents INTEGER, row_values TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_ledger_rows_voucher_date ON ledger_rows (filter_key, voucher_date)",
+    "CREATE INDEX IF NOT EXISTS ix_ledger_rows_buyer ON ledger_rows (filter_key, buyer_id, voucher_date)",
+    "CREATE INDEX IF NOT EXISTS ix_ledger_rows_amount ON ledger_rows (filter_key, amount_cents, voucher_date)",
+)
+DATETIME_TAG = "$datetime"
+
+
+class LedgerStore:
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        tables = self.connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+        if version != LEDGER_STORE_VERSION and tables > 0:
+            self.connection.close()
+            raise ValueError("總帳資料庫 %s 為舊版格式，請改用新的資料庫檔案並重新加入總帳" % db_file)
+        with self.connection:
+            for statement in LEDGER_STORE_SCHEMA:
+                self.connection.execute(statement)
+            self.connection.execute("PRAGMA user_version = %d" % LEDGER_STORE_VERSION)
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM ledger_rows").fetchone()[0]
+
+    #
+    # append() adds the rows of one general ledger export filtered with the filter of filter_key,
+    # returns the number of rows not seen before
+    #
+    def append(self, header, gl_rows, filter_key=""):
+        occurrences = {}
+        records = []
+        buyer_texts = {}
+        for r in gl_rows:
+            values = _encode_row(r)
+            occurrence = occurrences.get(values, 0)
+            occurrences[values] = occurrence + 1
+            fingerprint = hashlib.sha1(("%s\t%s#%d" % (filter_key, values, occurrence)).encode("utf-8")).hexdigest()
+            buyer_text = r[constant.COL_GL_TEXT]
+            if type(buyer_text) is str:
+                buyer_text = buyer_texts.setdefault(buyer_text, class_buyer_resolver.normalize_buyer_text(buyer_text))
+            else:
+                buyer_text = None
+            amount = r[constant.COL_GL_AMOUNT]
+            records.append([fingerprint, filter_key, class_ledger.ledger_date_ordinal(r[constant.COL_GL_INVOICE_DATE]),
+                            buyer_text, round(amount * 100) if isinstance(amount, (int, float)) else None, values])
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO ledger_header (id, row_values) VALUES (1, ?)",
+                                    (_encode_row(header),))
+            buyer_ids = {}
+            for buyer_text in set(buyer_texts.values()):
+                self.connection.execute("INSERT OR IGNORE INTO ledger_buyers (buyer_text) VALUES (?)", (buyer_text,))
+                buyer_ids[buyer_text] = self.connection.execute("SELECT id FROM ledger_buyers WHERE buyer_text = ?",
+                                                                (buyer_text,)).fetchone()[0]
+            for record in records:
+                record[3] = buyer_ids.get(record[3])
+            before = self.connection.total_changes
+            self.connection.executemany("INSERT OR IGNORE INTO ledger_rows "
+                                        "(fingerprint, filter_key, voucher_date, buyer_id, amount_cents, row_values) "
+                                        "VALUES (?, ?, ?, ?, ?, ?)", records)
+            return self.connection.total_changes - before
+
+    #
+    # query() returns the header and the rows appended under filter_key of which the voucher date
+    # is in the date range, all of the dates if both start_date and end_date are "". The rows may be
+    # narrowed down further, e.g. to the candidates of one invoice, to those of which
+    #   1. buyer_key: the normalized buyer text includes it
+    #   2. amount_range: (lowest, highest) NTD amount, the amount is within it
+    #
+    def query(self, start_date, end_date, filter_key="", buyer_key="", amount_range=None):
+        header = self.connection.execute("SELECT row_values FROM ledger_header WHERE id = 1").fetchone()
+        if header is None:
+            return None, []
+        conditions = ["filter_key = ?"]
+        parameters = [filter_key]
+        if start_date != "" or end_date != "":
+            conditions.append("voucher_date BETWEEN ? AND ?")
+            parameters += [start_date.toordinal(), end_date.toordinal()]
+        if amount_range is not None:
+            conditions.append("amount_cents BETWEEN ? AND ?")
+            parameters += [round(amount_range[0] * 100), round(amount_range[1] * 100)]
+        if buyer_key != "":
+            conditions.append("buyer_id IN (SELECT id FROM ledger_buyers WHERE instr(buyer_text, ?) > 0)")
+            parameters.append(buyer_key)
+        cursor = self.connection.execute("SELECT row_values FROM ledger_rows WHERE %s ORDER BY id" %
+                                         " AND ".join(conditions), parameters)
+        return _decode_row(header[0]), [_decode_row(values) for values, in cursor]
+
+    #
+    # filter_keys() returns the number of rows appended under each filter key
+    #
+    def filter_keys(self):
+        return dict(self.connection.execute("SELECT filter_key, COUNT(*) FROM ledger_rows GROUP BY filter_key"))
+
+    def close(self):
+        self.connection.close()
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {DATETIME_TAG: value.isoformat()}
+    return value
+
+
+def _decode_object(obj):
+    if len(obj) == 1 and DATETIME_TAG in obj:
+        return datetime.fromisoformat(obj[DATETIME_TAG])
+    return obj
+
+
+def _encode_row(row):
+    return json.dumps([_encode_value(value) for value in row], ensure_ascii=False)
+
+
+def _decode_row(values):
+    return tuple(json.loads(values, object_hook=_decode_object))
@@ -0,0 +1,169 @@
+#
+# File: class_log_index.py
+# Brief: Index of line offsets of the match log, so that a window of lines, a search or the matching
+#        decisions can be read from the file without loading the whole log
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+# Note:
+#   1. The log is read with seek() and read() rather than mapped in memory, since a mapped log
+#      could not be truncated by the next run on Windows, see utility.initialization()
+#   2. Offsets are computed once, a refresh() indexes only the lines appended since; a log
+#      shorter than what has been indexed, or of which the first line has changed, was rewritten
+#      by a new run and is indexed again
+#   3. Only complete lines, ending with a newline, are indexed while the log is being written
+#   4. The log is written in the locale encoding, the default of logging.FileHandler, in which a
+#      newline or a tab byte is never part of a multi-byte character
+#
+from array import array
+from bisect import bisect_right
+import locale
+import os
+import re
+import constant
+
+# bytes read at a time while indexing or scanning the log
+READ_BLOCK_BYTES = 4 * 1024 * 1024
+DECISION_MATCHED = "是"
+DECISION_UNMATCHED = "否"
+
+
+class LogIndex:
+    # Class LogIndex keeps the byte offset of the start of every line of the log, plus the offset
+    # of the end of the last indexed line, and the line numbers of matched and unmatched decisions,
+    # see xlsrw_oop.log_decision()
+    #
+    def __init__(self, log_file, encoding=None):
+        self.log_file = log_file
+        self.encoding = encoding if encoding is not None else locale.getpreferredencoding(False)
+        self.f = open(log_file, "rb")
+        # 比對, then invoice number, buyer, invoice date, currency and amount, then 是 or 否
+        self.decision_pattern = re.compile(constant.LOG_DECISION_TAG.encode(self.encoding) +
+                                           rb"\t(?:[^\t\n]*\t){5}([^\t\n]*)\t")
+        self.matched_tag = DECISION_MATCHED.encode(self.encoding)
+        self._reset()
+        self.refresh()
+
+    def _reset(self):
+        self.offsets = array("q", [0])
+        self.first_line = b""
+        self.decisions = {DECISION_MATCHED: [], DECISION_UNMATCHED: []}
+        self.decisions_scanned = 0
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    #
+    # refresh() indexes the lines appended to the log since the last refresh, returns the number of
+    # lines indexed
+    #
+    def refresh(self):
+        number_of_lines = len(self)
+        if os.fstat(self.f.fileno()).st_size < self.offsets[-1] or \
+                (len(self) > 0 and self._read_lines(0, 1) != self.first_line):
+            self._reset()
+            number_of_lines = 0
+        self.f.seek(self.offsets[-1])
+        block_start = self.offsets[-1]
+        while True:
+            block = self.f.read(READ_BLOCK_BYTES)
+            if not block:
+                break
+            pos = block.find(b"\n")
+            while pos >= 0:
+                self.offsets.append(block_start + pos + 1)
+                pos = block.find(b"\n", pos + 1)
+            block_start += len(block)
+        self.first_line = self._read_lines(0, 1) if len(self) > 0 else b""
+        return len(self) - number_of_lines
+
+    #
+    # lines() returns the lines from line number start on, at most count of them, without newlines
+    #
+    def lines(self, start, count):
+        end = min(start + count, len(self))
+        if start >= end:
+            return []
+        self.f.seek(self.offsets[start])
+        data = self.f.read(self.offsets[end] - self.offsets[start])
+        return data.decode(self.encoding, errors="replace").splitlines()
+
+    def line(self, line_no):
+        lines = self.lines(line_no, 1)
+        return lines[0] if lines else ""
+
+    #
+    # Blocks of whole lines, as tuples of (first line number, bytes), from line number start to the
+    # end of the log, or backwards down to the first line
+    #
+    def _blocks(self, start, backward=False):
+        if backward:
+            end = start + 1
+            while end > 0:
+                first = max(bisect_right(self.offsets, self.offsets[end] - READ_BLOCK_BYTES) - 1, 0)
+                first = min(first, end - 1)
+                yield first, self._read_lines(first, end)
+                end = first
+        else:
+            first = start
+            while first < len(self):
+                end = max(bisect_right(self.offsets, self.offsets[first] + READ_BLOCK_BYTES) - 1, first + 1)
+                end = min(end, len(self))
+                yield first, self._read_lines(first, end)
+                first = end
+
+    def _read_lines(self, first, end):
+        self.f.seek(self.offsets[first])
+        return self.f.read(self.offsets[end] - self.offsets[first])
+
+    def _line_of(self, first, pos):
+        return bisect_right(self.offsets, self.offsets[first] + pos) - 1
+
+    #
+    # find() returns the number of the first line, from line number start on, which includes text,
+    # or the last one up to line number start if backward is set. Returns -1 if not found
+    #
+    def find(self, text, start, backward=False):
+        if text == "" or len(self) == 0:
+            return -1
+        start = min(max(start, 0), len(self) - 1)
+        needle = text.encode(self.encoding, errors="replace")
+        for first, data in self._blocks(start, backward):
+            pos = data.rfind(needle) if backward else data.find(needle)
+            if pos >= 0:
+                return self._line_of(first, pos)
+        return -1
+
+    #
+    # find_in() returns the position in line_numbers, ascending line numbers such as those of
+    # decision_lines(), of the first line from position start on which includes text, or the last
+    # one up to position start if backward is set. Returns -1 if not found
+    #
+    def find_in(self, text, line_numbers, start, backward=False):
+        if text == "" or len(line_numbers) == 0:
+            return -1
+        start = min(max(start, 0), len(line_numbers) - 1)
+        needle = text.encode(self.encoding, errors="replace")
+        positions = range(start, -1, -1) if backward else range(start, len(line_numbers))
+        for k in positions:
+            if needle in self._read_lines(line_numbers[k], line_numbers[k] + 1):
+                return k
+        return -1
+
+    #
+    # decision_lines() returns the ascending line numbers of the matching decisions of the result,
+    # DECISION_MATCHED or DECISION_UNMATCHED. Lines appended since the last call are scanned only
+    #
+    def decision_lines(self, result):
+        if self.decisions_scanned < len(self):
+            for first, data in self._blocks(self.decisions_scanned):
+                for m in self.decision_pattern.finditer(data):
+                    decision = DECISION_MATCHED if m.group(1) == self.matched_tag else DECISION_UNMATCHED
+                    self.decisions[decision].append(self._line_of(first, m.start()))
+            self.decisions_scanned = len(self)
+        return self.decisions[result]
+
+    def close(self):
+        self.f.close()
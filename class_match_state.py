@@ -0,0 +1,165 @@
+#
+# File: class_match_state.py
+# Brief: Matching results of the previous run kept in a sidecar file next to the external sales
+#        Excel file, so that a re-run only matches the invoices and ledger records changed since
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 state invalidated by a change of the configuration, see Note 4
+#
+# Note:
+#   1. Invoices are keyed by invoice number, ledger records by a fingerprint of the values taken
+#      into matching; both come with their occurrence among identical keys, so that duplicates are
+#      told apart
+#   2. Whether an invoice matches a ledger record depends on nothing but the two of them, hence
+#      on a re-run
+#       - a new or changed invoice is matched against the whole ledger
+#       - an unchanged invoice keeps its previous matches still in the ledger, and is matched only
+#         against the ledger records not seen before
+#      which gives the same results as matching everything again
+#   3. The sidecar is JSON, and is ignored if written by another MATCH_STATE_VERSION
+#   4. Whether an invoice matches a ledger record depends on the configuration as well: the alias
+#      table, the normalization of buyer's names, the match criteria and the general ledger
+#      filter. The sidecar keeps a digest of them, see config_key(), and is ignored if written
+#      with another configuration, e.g. after an alias is added
+#
+import hashlib
+import json
+import logging
+import os
+import unicodedata
+import class_buyer_resolver
+import constant
+
+MATCH_STATE_VERSION = 2
+MATCH_STATE_SUFFIX = ".match_state.json"
+
+
+class MatchState:
+    # Class MatchState keeps the matching results of the previous run of state_file, written with
+    # the configuration of config_key, see Note 4
+    #
+    def __init__(self, state_file, config_key=""):
+        self.state_file = state_file
+        self.config_key = config_key
+        self.invoices = {}
+        self.ledger = set()
+        self.pending = None
+        try:
+            with open(state_file, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get("version") != MATCH_STATE_VERSION:
+            return
+        if state.get("config") != config_key:
+            logging.info("增量比對: 設定已變更，不沿用前次比對結果 %s", state_file)
+            return
+        self.invoices = state["invoices"]
+        self.ledger = set(state["ledger"])
+
+    #
+    # find_matches() returns the matching results of the source transactions as
+    # match_all(ledger, source_transactions) would, along with a flag per source transaction
+    # telling whether its results were matched in this run rather than kept from the previous run
+    #
+    def find_matches(self, ledger, source_transactions, match_all):
+        ledger_keys = ledger_fingerprints(ledger)
+        position_of = {key: i for i, key in enumerate(ledger_keys)}
+        new_positions = [i for i, key in enumerate(ledger_keys) if key not in self.ledger]
+        invoice_keys = _with_occurrence(str(s.invoice_number) for s in source_transactions)
+        invoice_values = [invoice_fingerprint(s) for s in source_transactions]
+
+        changed = []
+        unchanged = []
+        for k, invoice_key in enumerate(invoice_keys):
+            previous = self.invoices.get(invoice_key)
+            if previous is not None and previous[0] == invoice_values[k]:
+                unchanged.append(k)
+            else:
+                changed.append(k)
+        results = [[] for _ in source_transactions]
+        rematched = [False] * len(source_transactions)
+        if len(changed) > 0:
+            for k, matched in zip(changed, match_all(ledger, [source_transactions[k] for k in changed])):
+                results[k] = matched
+                rematched[k] = True
+        if len(unchanged) > 0 and len(new_positions) > 0:
+            new_ledger = ledger.subset(new_positions)
+            for k, matched in zip(unchanged, match_all(new_ledger, [source_transactions[k] for k in unchanged])):
+                results[k] = [new_positions[it] for it in matched]
+                rematched[k] = len(matched) > 0
+        for k in unchanged:
+            previous_keys = self.invoices[invoice_keys[k]][1]
+            kept = [position_of[key] for key in previous_keys if key in position_of]
+            if len(kept) != len(previous_keys):
+                rematched[k] = True
+            results[k] = sorted(kept + results[k])
+        logging.info("增量比對: 新增或變更發票 %d 筆, 新增總帳紀錄 %d 筆, 沿用前次結果發票 %d 筆",
+                     len(changed), len(new_positions), len(unchanged))
+        self.pending = (ledger_keys,
+                        {invoice_keys[k]: [invoice_values[k], [ledger_keys[it] for it in results[k]]]
+                         for k in range(len(source_transactions))})
+        return results, rematched
+
+    #
+    # save() writes the state of the last find_matches() to the sidecar, to be called once the
+    # matching results are saved
+    #
+    def save(self):
+        if self.pending is None:
+            return
+        ledger_keys, invoices = self.pending
+        temp_file = "%s.%d.tmp" % (self.state_file, os.getpid())
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"version": MATCH_STATE_VERSION, "config": self.config_key, "invoices": invoices,
+                       "ledger": ledger_keys}, f, ensure_ascii=False)
+        os.replace(temp_file, self.state_file)
+        self.ledger = set(ledger_keys)
+        self.invoices = invoices
+        self.pending = None
+
+
+#
+# Sidecar file of the external sales Excel file
+#
+def match_state_file(ext_sales_excel):
+    return ext_sales_excel + MATCH_STATE_SUFFIX
+
+
+#
+# Digest of the configuration the matching results depend on, see Note 4, with the general ledger
+# filter gl_filter(class_row_filter.GeneralLedgerFilter)
+#
+def config_key(gl_filter):
+    resolver = class_buyer_resolver.default_resolver()
+    return _digest((sorted(resolver.aliases.items()), sorted(resolver.key_aliases.items()),
+                    constant.BUYER_NAME_SUFFIXES, constant.LENGTH_BUYER_NAME_KEY, unicodedata.unidata_version,
+                    constant.AMOUNT_DIFF_THRESHOLD_RATIO, gl_filter.key()))
+
+
+def invoice_fingerprint(source_transaction):
+    return _digest((source_transaction.buyer_name, source_transaction.invoice_date,
+                    source_transaction.invoice_amount_NT, source_transaction.invoice_amount_US,
+                    source_transaction.function_currency, source_transaction.exchange_rate))
+
+
+def ledger_fingerprints(ledger):
+    return _with_occurrence(_digest((ledger.buyer_text[i], ledger.date_ordinal[i], ledger.amount_cents[i],
+                                     ledger.exchange_rate[i], ledger.amount_us[i]))
+                            for i in range(len(ledger)))
+
+
+def _digest(values):
+    return hashlib.sha1(repr(values).encode("utf-8")).hexdigest()[:20]
+
+
+def _with_occurrence(keys):
+    occurrences = {}
+    keys_with_occurrence = []
+    for key in keys:
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        keys_with_occurrence.append(key if occurrence == 0 else "%s#%d" % (key, occurrence))
+    return keys_with_occurrence
@@ -0,0 +1,92 @@
+#
+# File: class_matching_engine.py
+# Brief: Matching engine interface, the reference engine and the registry of engines selectable
+#        by name, constant.MATCHERS
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+# Note:
+#   1. An engine takes the invoices as source transactions(class_transaction.Transaction) and the
+#      account receivable records as a ledger snapshot(class_ledger.LedgerSnapshot), and returns
+#      the match decisions: for each source transaction, the ledger positions it matches in row
+#      order. The decisions of every engine must be identical to those of the reference engine
+#   2. The reference engine checks every pair of invoice and ledger record with
+#      Transaction.match_ledger_values(), i.e. the match criteria as they are defined, without any
+#      index. It is slow by design and is the baseline of xlsrw_difftest.py
+#   3. Engines are stateless between runs and are created by name, in worker processes as well,
+#      see class_parallel_matcher._match_shard()
+#
+from abc import ABC, abstractmethod
+import logging
+import constant
+import class_ledger_index
+import class_numpy_matcher
+
+
+class MatchingEngine(ABC):
+    # Class MatchingEngine is the interface of matching engines
+    #   name: the engine name, one of constant.MATCHERS
+    #
+    name = None
+
+    #
+    # match_all() returns, for each source transaction, the list of ledger positions it matches in
+    # row order. Candidates examined are counted, and the progress reported, in metrics if given
+    #
+    @abstractmethod
+    def match_all(self, ledger, source_transactions, metrics=None):
+        pass
+
+
+class ReferenceEngine(MatchingEngine):
+    name = constant.MATCHER_REFERENCE
+
+    def match_all(self, ledger, source_transactions, metrics=None):
+        results = []
+        for k, source_transaction in enumerate(source_transactions):
+            if metrics is not None:
+                metrics.progress("match_invoices", k + 1, len(source_transactions))
+            results.append([i for i in range(len(ledger)) if ledger.match(i, source_transaction)])
+        if metrics is not None:
+            metrics.count("candidates", len(ledger) * len(source_transactions))
+        return results
+
+
+class IndexEngine(MatchingEngine):
+    name = constant.MATCHER_INDEX
+
+    def match_all(self, ledger, source_transactions, metrics=None):
+        return class_ledger_index.match_all(ledger, source_transactions, metrics)
+
+
+class NumpyEngine(MatchingEngine):
+    name = constant.MATCHER_NUMPY
+
+    def match_all(self, ledger, source_transactions, metrics=None):
+        return class_numpy_matcher.NumpyMatcher(ledger).match_all(source_transactions, metrics)
+
+
+ENGINES = {engine.name: engine for engine in (IndexEngine, NumpyEngine, ReferenceEngine)}
+
+
+#
+# Engines which can run here, NumpyEngine needs NumPy
+#
+def available_engines():
+    return [name for name in constant.MATCHERS
+            if name != constant.MATCHER_NUMPY or class_numpy_matcher.np is not None]
+
+
+#
+# Create the engine of the name, constant.MATCHER_*. The NumPy engine falls back to the index
+# engine if NumPy is not installed
+#
+def matching_engine(name):
+    if name not in ENGINES:
+        raise ValueError("Unknown matcher: %s" % name)
+    if name == constant.MATCHER_NUMPY and class_numpy_matcher.np is None:
+        logging.warning("NumPy 未安裝，改用索引比對")
+        name = constant.MATCHER_INDEX
+    return ENGINES[name]()
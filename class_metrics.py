@@ -0,0 +1,181 @@
+#
+# File: class_metrics.py
+# Brief: Per-stage timing, counters and throttled progress of one reconciliation run
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 cancellation of a run through its cancel event
+#   3. 2026/10/18: v. 0.3 stages run in a worker process, elapsed time of overlapping stages
+#
+# Note:
+#   1. Stages record wall time and CPU time of this process; CPU time spent in matching worker
+#      processes, -j > 1, is not included. A stage run in a worker process of class_side_process.py
+#      is recorded with its own wall time and CPU time, see record_stage()
+#   2. Counters are named after what they count, e.g. gl_rows_read, candidates, matched; the
+#      matching summary of xlsrw_oop.match_invoice_records() is merged into the counters
+#   3. progress() is cheap enough to be called per row; the progress listener, the console
+#      progress bar or the GUI, is called at most once per PROGRESS_INTERVAL_SECONDS, and
+#      once more when a stage is done
+#   4. The metrics are saved as JSON next to the output file, see metrics_file()
+#   5. Once the cancel event of a run is set, the next stage() or progress() of the run raises
+#      RunCancelled, so that stages stop at a row boundary without checking the event themselves
+#   6. Stages may overlap, so the sum of their wall times, wall_seconds, may exceed the time the
+#      run took, elapsed_seconds
+#
+from contextlib import contextmanager
+import json
+import time
+import progressbar
+
+PROGRESS_INTERVAL_SECONDS = 0.2
+METRICS_SUFFIX = ".metrics.json"
+
+
+class RunCancelled(Exception):
+    # Exception RunCancelled is raised in the running stage once the run is cancelled
+    #
+    pass
+
+
+class RunMetrics:
+    def __init__(self, progress_listener=None, progress_interval=PROGRESS_INTERVAL_SECONDS, cancel_event=None):
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._started_at = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.progress_listener = progress_listener
+        self.progress_interval = progress_interval
+        self._last_progress = 0.0
+        self.cancel_event = cancel_event
+
+    #
+    # stage() measures the enclosed block as the named stage, rows is the number of rows the
+    # stage processed if known, for rows per second. A stage entered again accumulates
+    #
+    @contextmanager
+    def stage(self, name, rows=None):
+        self.check_cancelled()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield self
+        finally:
+            record = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "rows": None})
+            record["wall_seconds"] += time.perf_counter() - wall_start
+            record["cpu_seconds"] += time.process_time() - cpu_start
+            if rows is not None:
+                self.set_rows(name, rows)
+
+    #
+    # record_stage() adds the wall time and CPU time of the named stage measured elsewhere, e.g. in
+    # a worker process
+    #
+    def record_stage(self, name, wall_seconds, cpu_seconds, rows=None):
+        record = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "rows": None})
+        record["wall_seconds"] += wall_seconds
+        record["cpu_seconds"] += cpu_seconds
+        if rows is not None:
+            self.set_rows(name, rows)
+
+    def set_rows(self, name, rows):
+        record = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "rows": None})
+        record["rows"] = rows
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def update_counters(self, counters):
+        for counter, n in counters.items():
+            self.count(counter, n)
+
+    #
+    # progress() reports done out of total rows of the stage to the progress listener, throttled
+    #
+    def progress(self, stage, done, total):
+        self.check_cancelled()
+        if self.progress_listener is None:
+            return
+        now = time.monotonic()
+        if done < total and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        self.progress_listener(stage, done, total)
+
+    #
+    # check_cancelled() raises RunCancelled if the cancel event(threading.Event) of the run is set
+    #
+    def check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise RunCancelled()
+
+    def as_dict(self):
+        stages = {}
+        for name, record in self.stages.items():
+            stages[name] = {"wall_seconds": round(record["wall_seconds"], 4),
+                            "cpu_seconds": round(record["cpu_seconds"], 4),
+                            "rows": record["rows"]}
+            if record["rows"] is not None and record["wall_seconds"] > 0:
+                stages[name]["rows_per_second"] = round(record["rows"] / record["wall_seconds"], 1)
+        return {"started": self.started,
+                "wall_seconds": round(sum(record["wall_seconds"] for record in self.stages.values()), 4),
+                "elapsed_seconds": round(time.perf_counter() - self._started_at, 4),
+                "stages": stages,
+                "counters": dict(self.counters)}
+
+    def save(self, metrics_file):
+        with open(metrics_file, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False, indent=2)
+
+    #
+    # summary() returns one line per stage for the console or the GUI log
+    #
+    def summary(self):
+        lines = []
+        for name, record in self.as_dict()["stages"].items():
+            line = "%s: %.2f 秒" % (name, record["wall_seconds"])
+            if "rows_per_second" in record:
+                line += ", %d 列, %.0f 列/秒" % (record["rows"], record["rows_per_second"])
+            lines.append(line)
+        return lines
+
+
+class ConsoleProgress:
+    # Class ConsoleProgress is the progress listener of the command line, one progress bar per
+    # stage
+    #
+    def __init__(self):
+        self.stage = None
+        self.bar = None
+
+    def __call__(self, stage, done, total):
+        if stage != self.stage:
+            self.finish()
+            self.stage = stage
+            self.bar = progressbar.ProgressBar(maxval=100, widgets=[stage + " ", progressbar.Bar('=', '[', ']'),
+                                                                    ' ', progressbar.Percentage()])
+            self.bar.start()
+        if done >= total:
+            self.finish()
+        else:
+            self.bar.update(done / total * 100)
+
+    def finish(self):
+        if self.bar is not None:
+            self.bar.finish()
+            self.bar = None
+            self.stage = None
+
+
+#
+# Metrics file of the output file
+#
+def metrics_file(output_file):
+    return output_file + METRICS_SUFFIX
+
+
+#
+# Metrics of a run from the command line, with progress bars on the console
+#
+def console_metrics():
+    return RunMetrics(ConsoleProgress())
@@ -0,0 +1,127 @@
+#
+# File: class_numpy_matcher.py
+# Brief: NumPy-backed matching engine, which matches a whole batch of invoices against the
+#        ledger snapshot with sorted-array range queries
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 buyer groups resolved through class_buyer_resolver.BuyerIndex
+#
+# Note:
+#   1. NumPy is optional; NumpyMatcher is available only if numpy can be imported, check
+#      class_numpy_matcher.np before using it
+#   2. The amount criterion abs(target - source) <= source * AMOUNT_DIFF_THRESHOLD_RATIO is an
+#      interval on the target amount, which is located with searchsorted() on amounts sorted per
+#      buyer. The interval is slightly widened and every candidate pair is then checked again with
+#      the very same float expression as Transaction.match_ledger_values(), so the decisions are
+#      identical to the scalar matcher
+#
+import constant
+import class_buyer_resolver
+import class_ledger_index
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class NumpyMatcher:
+    # Class NumpyMatcher keeps NumPy copies of the ledger snapshot columns, and per buyer key the
+    # ledger positions sorted by NTD amount and by USD amount
+    #
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.date_ordinal = np.array(ledger.date_ordinal, dtype=np.int64)
+        self.amount_nt = np.array(ledger.amount_cents, dtype=np.int64) / 100
+        self.amount_us = np.array(ledger.amount_us, dtype=np.float64)
+        self.ledger_index = None
+        self.buyer_groups = {}
+        self.number_of_candidates = 0
+        self.buyer_index = class_buyer_resolver.BuyerIndex(ledger)
+
+    #
+    # match_all() returns, for each source transaction, the list of ledger positions it matches
+    # in row order. The number of candidate pairs examined is counted, and the progress reported, in metrics if given
+    #
+    def match_all(self, source_transactions, metrics=None):
+        number_of_candidates = self.number_of_candidates
+        results = [[] for _ in source_transactions]
+        batches = {}
+        for k, source_transaction in enumerate(source_transactions):
+            try:
+                source_transaction.invoice_date_object()
+            except (ValueError, TypeError):
+                # not able to be batched, leave it to the scalar matcher
+                results[k] = self._match_one(source_transaction)
+                continue
+            batch_key = (source_transaction.buyer_key(), source_transaction.function_currency)
+            batches.setdefault(batch_key, []).append(k)
+        number_of_batched = 0
+        total_batched = sum(len(batch) for batch in batches.values())
+        for (buyer_key, function_currency), batch in batches.items():
+            self._match_batch(buyer_key, function_currency, batch, source_transactions, results)
+            number_of_batched += len(batch)
+            if metrics is not None:
+                metrics.progress("match_invoices", number_of_batched, total_batched)
+        if metrics is not None:
+            metrics.count("candidates", self.number_of_candidates - number_of_candidates)
+        return results
+
+    def _match_one(self, source_transaction):
+        if self.ledger_index is None:
+            self.ledger_index = class_ledger_index.LedgerIndex(self.ledger, self.buyer_index)
+        candidates = self.ledger_index.candidates(source_transaction)
+        self.number_of_candidates += len(candidates)
+        return [it for it in candidates if self.ledger.match_resolved(it, source_transaction)]
+
+    def _match_batch(self, buyer_key, function_currency, batch, source_transactions, results):
+        sorted_positions, sorted_amounts = self._buyer_group(buyer_key, function_currency)
+        if len(sorted_positions) == 0:
+            return
+        sources = [source_transactions[k] for k in batch]
+        if function_currency == constant.FUNCTION_CURRENCY_NTD:
+            source_amounts = np.array([s.invoice_amount_NT for s in sources], dtype=np.float64)
+            target_amounts = self.amount_nt
+        else:
+            source_amounts = np.array([s.invoice_amount_US for s in sources], dtype=np.float64)
+            target_amounts = self.amount_us
+        source_dates = np.array([s.invoice_date_object().toordinal() for s in sources], dtype=np.int64)
+        thresholds = source_amounts * constant.AMOUNT_DIFF_THRESHOLD_RATIO
+        widened = np.abs(thresholds) * (1 + 1e-9) + 1e-9
+        lo = np.searchsorted(sorted_amounts, source_amounts - widened, side="left")
+        hi = np.searchsorted(sorted_amounts, source_amounts + widened, side="right")
+        counts = hi - lo
+        total = int(counts.sum())
+        self.number_of_candidates += total
+        if total == 0:
+            return
+        # expand every [lo, hi) range into (source, ledger position) candidate pairs
+        pair_source = np.repeat(np.arange(len(sources)), counts)
+        pair_offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_ledger = sorted_positions[lo[pair_source] + pair_offset]
+        accepted = np.abs(target_amounts[pair_ledger] - source_amounts[pair_source]) <= thresholds[pair_source]
+        accepted &= np.abs(source_dates[pair_source] - self.date_ordinal[pair_ledger]) <= 1
+        pair_source = pair_source[accepted]
+        pair_ledger = pair_ledger[accepted]
+        order = np.lexsort((pair_ledger, pair_source))
+        for s, it in zip(pair_source[order].tolist(), pair_ledger[order].tolist()):
+            results[batch[s]].append(it)
+
+    #
+    # _buyer_group() returns the ledger positions of which the text includes buyer_key, sorted by
+    # the amount in the function currency, along with the sorted amounts
+    #
+    def _buyer_group(self, buyer_key, function_currency):
+        group_key = (buyer_key, function_currency)
+        if group_key not in self.buyer_groups:
+            positions = self.buyer_index.positions_of(buyer_key)
+            positions = np.array(positions, dtype=np.int64)
+            if function_currency == constant.FUNCTION_CURRENCY_NTD:
+                amounts = self.amount_nt[positions]
+            else:
+                amounts = self.amount_us[positions]
+            order = np.argsort(amounts, kind="stable")
+            self.buyer_groups[group_key] = (positions[order], amounts[order])
+        return self.buyer_groups[group_key]
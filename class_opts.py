@@ -6,10 +6,26 @@
 #   1. 2020/10/2: v. 0.1 1st creation
 #   2. 2020/11/1: v. 0.2
 #           - added a new option for the external sales output file
+#   3. 2026/10/18: v. 0.3
+#           - added pipeline mode option
+#           - added matcher option
+#           - added number of matching processes option
+#           - added BatchOpts for the batch reconciliation
+#           - added general ledger cache directory option
+#           - added SQLite ledger store option
+#           - added incremental matching switch
+#           - added BenchmarkOpts for the benchmark suite
+#           - added log verbosity option
+#           - added annotation mode option of the matching results of invoice details
+#           - added one-to-one assignment option
+#           - added DiffTestOpts for the differential test of matching engines
+#           - added voucher types and account patterns options of the general ledger filter
+#           - added ServiceOpts for the local reconciliation service
 #
 import getopt
 import sys
 from datetime import datetime
+import constant
 
 
 class Opts:
@@ -18,19 +34,50 @@ class Opts:
     #   2. target_general_ledger: target Excel file where the general ledger
     #   3. invoice_date_start: starting date of the range of invoice date
     #   4. invoice_date_end: end date of the range of invoice date
+    #   5. pipeline: hand filtered general ledger over to invoice matching in memory
+    #   6. matcher: matching engine, "index", "numpy" or "reference"
+    #   7. jobs: number of worker processes for matching, 1 to match in this process
+    #   8. cache_dir: directory of the parsed general ledger cache, no cache if empty
+    #   9. store_file: SQLite ledger store the general ledger is appended to and queried from,
+    #      general_ledger is optional if store_file is specified
+    #   10. incremental: match only invoices and ledger records changed since the previous run
+    #   11. verbosity: log verbosity, "quiet", "decision" or "detail"
+    #   12. annotation_mode: how the matching results of invoice details are saved, "xlsx", "csv",
+    #       "column" or "copy"
+    #   13. assignment: "all" to keep every match, or "one-to-one" to keep one ledger record per
+    #       invoice and one invoice per ledger record
+    #   14. voucher_types: voucher types of the general ledger rows kept
+    #   15. account_patterns: general ledger rows are kept if the account description includes any of them
     #
     def __init__(self, argv):
-        # string: invoice_details (i:, --invoice), general_ledger (l:, --ledger)
+        # string: invoice_details (i:, --invoice), general_ledger (l:, --ledger), matcher (m:, --matcher)
+        #         cache_dir (c:, --cache), store_file (s:, --store), verbosity (v:, --verbosity)
+        #         annotation_mode (a:, --annotate), assignment (u:, --assign)
+        # list: voucher_types (t:, --voucher-types), account_patterns (k:, --accounts), comma separated
+        # integer: jobs (j:, --jobs)
         # date: invoice_date_start (b:, --begin), invoice_date_end (e:, --end)
-        # switch: help (h, --help)
+        # switch: help (h, --help), pipeline (p, --pipeline), incremental (n, --incremental)
         self.invoice_file = ""
         self.ledger_file = ""
         self.sales_file = ""
         self.begin_date = ""
         self.end_date = ""
+        self.pipeline = False
+        self.matcher = constant.MATCHER_INDEX
+        self.jobs = 1
+        self.cache_dir = ""
+        self.store_file = ""
+        self.incremental = False
+        self.verbosity = constant.LOG_VERBOSITY_DECISION
+        self.annotation_mode = constant.ANNOTATION_XLSX
+        self.assignment = constant.ASSIGNMENT_ALL
+        self.voucher_types = constant.GL_VOUCHER_TYPES
+        self.account_patterns = constant.GL_ACCOUNT_PATTERNS
         try:
-            opts, args = getopt.getopt(argv[1:], "hi:l:b:e:o:",
-                                       ["help", "invoice=", "ledger=", "output=", "begin=", "end="])
+            opts, args = getopt.getopt(argv[1:], "hi:l:b:e:o:pm:j:c:s:nv:a:u:t:k:",
+                                       ["help", "invoice=", "ledger=", "output=", "begin=", "end=", "pipeline",
+                                        "matcher=", "jobs=", "cache=", "store=", "incremental",
+                                        "verbosity=", "annotate=", "assign=", "voucher-types=", "accounts="])
         except getopt.GetoptError:
             print("Invalid command syntax...")
             print_help_message(argv[0])
@@ -49,6 +96,56 @@ class Opts:
                 self.end_date = arg
             elif opt in ("-o", "--output"):
                 self.sales_file = arg
+            elif opt in ("-p", "--pipeline"):
+                self.pipeline = True
+            elif opt in ("-m", "--matcher"):
+                if arg not in constant.MATCHERS:
+                    print("Unknown matcher: ", arg)
+                    print_help_message(argv[0])
+                    sys.exit()
+                self.matcher = arg
+            elif opt in ("-j", "--jobs"):
+                try:
+                    self.jobs = int(arg)
+                except ValueError:
+                    self.jobs = 0
+                if self.jobs < 1:
+                    print("Number of jobs should be a positive integer")
+                    sys.exit()
+            elif opt in ("-c", "--cache"):
+                self.cache_dir = arg
+            elif opt in ("-s", "--store"):
+                self.store_file = arg
+            elif opt in ("-n", "--incremental"):
+                self.incremental = True
+            elif opt in ("-v", "--verbosity"):
+                if arg not in constant.LOG_VERBOSITIES:
+                    print("Unknown log verbosity: ", arg)
+                    print_help_message(argv[0])
+                    sys.exit()
+                self.verbosity = arg
+            elif opt in ("-a", "--annotate"):
+                if arg not in constant.ANNOTATIONS:
+                    print("Unknown annotation mode: ", arg)
+                    print_help_message(argv[0])
+                    sys.exit()
+                self.annotation_mode = arg
+            elif opt in ("-u", "--assign"):
+                if arg not in constant.ASSIGNMENTS:
+                    print("Unknown assignment: ", arg)
+                    print_help_message(argv[0])
+                    sys.exit()
+                self.assignment = arg
+            elif opt in ("-t", "--voucher-types"):
+                self.voucher_types = parse_list(arg)
+                if len(self.voucher_types) == 0:
+                    print("Voucher types should not be empty")
+                    sys.exit()
+            elif opt in ("-k", "--accounts"):
+                self.account_patterns = parse_list(arg)
+                if len(self.account_patterns) == 0:
+                    print("Account patterns should not be empty")
+                    sys.exit()
         if self.sales_file == "":
             self.sales_file = "External_Sales.xlsx"
         self.date_sanity_check()
@@ -81,9 +178,345 @@ class Opts:
 
 
 def print_help_message(command):
-    print("Syntax: ", command, " -i [invoice] -l [ledger] -o <output> -b <start date> -e <end date>")
+    print("Syntax: ", command, " -i [invoice] -l [ledger] -o <output> -b <start date> -e <end date> -p -m <matcher> -j <jobs> -c <cache dir> -s <store> -n -v <verbosity> -a <annotation> -u <assignment> -t <voucher types> -k <accounts>")
     print("\t-i (--invoice): Invoice file name <mandatory>")
-    print("\t-l (--ledger): General ledger file name <mandatory>")
+    print("\t-l (--ledger): General ledger file name <mandatory unless -s is given>")
     print("\t-b (--begin): Beginning invoicing date: yyyymmdd <optional>")
     print("\t-e (--end): End invoicing date: yyyymmdd <optional>")
+    print("\t-p (--pipeline): Match in memory and write the output file once <optional>")
+    print("\t-m (--matcher): Matching engine, index, numpy or reference, default: index <optional>")
+    print("\t-j (--jobs): Number of matching processes, default: 1 <optional>")
+    print("\t-c (--cache): Directory to cache the parsed general ledger in <optional>")
+    print("\t-s (--store): SQLite ledger store to append the general ledger to and query by date <optional>")
+    print("\t-n (--incremental): Match only invoices and ledger records changed since the previous run <optional>")
+    print("\t-v (--verbosity): Log verbosity, quiet, decision or detail, default: decision <optional>")
+    print("\t-a (--annotate): Save invoice matching results as xlsx or csv keyed by invoice number, column for a")
+    print("\t                 single-column patch, or copy to annotate a copy of the invoice file, default: xlsx <optional>")
+    print("\t-u (--assign): Keep all matches, or one-to-one to keep one ledger record per invoice and one")
+    print("\t               invoice per ledger record, default: all <optional>")
+    print("\t-t (--voucher-types): Comma separated voucher types of the general ledger rows kept, default: %s <optional>"
+          % ",".join(constant.GL_VOUCHER_TYPES))
+    print("\t-k (--accounts): Comma separated patterns, general ledger rows of which the account description")
+    print("\t                 includes any of them are kept, default: %s <optional>" % ",".join(constant.GL_ACCOUNT_PATTERNS))
+    print("\t-h (--help): Print this help menu")
+
+
+#
+# Split a comma separated option argument, empty items are dropped
+#
+def parse_list(arg):
+    return tuple(item.strip() for item in arg.split(",") if item.strip() != "")
+
+
+class BatchOpts:
+    # Class BatchOpts stores arguments to run the batch reconciliation, xlsrw_batch.py, which includes
+    #   1. manifest_file: CSV manifest of the reconciliation jobs
+    #   2. job_dir: directory of job folders, used if no manifest is given
+    #   3. workers: number of worker processes running the jobs concurrently
+    #   4. summary_file: combined summary CSV of all the jobs
+    #   5. matcher: matching engine, "index", "numpy" or "reference"
+    #   6. cache_dir: directory of the parsed general ledger cache, no cache if empty
+    #   7. annotation_mode: how the matching results of invoice details are saved, see Opts
+    #
+    def __init__(self, argv):
+        # string: manifest_file (f:, --manifest), job_dir (d:, --dir), summary_file (s:, --summary)
+        #         matcher (m:, --matcher), cache_dir (c:, --cache), annotation_mode (a:, --annotate)
+        # integer: workers (w:, --workers)
+        # switch: help (h, --help)
+        self.manifest_file = ""
+        self.job_dir = ""
+        self.summary_file = "Batch_Summary.csv"
+        self.workers = 2
+        self.matcher = constant.MATCHER_INDEX
+        self.cache_dir = ""
+        self.annotation_mode = constant.ANNOTATION_XLSX
+        try:
+            opts, args = getopt.getopt(argv[1:], "hf:d:s:w:m:c:a:",
+                                       ["help", "manifest=", "dir=", "summary=", "workers=", "matcher=", "cache=",
+                                        "annotate="])
+        except getopt.GetoptError:
+            print("Invalid command syntax...")
+            print_batch_help_message(argv[0])
+            sys.exit()
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                print_batch_help_message(argv[0])
+                sys.exit()
+            elif opt in ("-f", "--manifest"):
+                self.manifest_file = arg
+            elif opt in ("-d", "--dir"):
+                self.job_dir = arg
+            elif opt in ("-s", "--summary"):
+                self.summary_file = arg
+            elif opt in ("-w", "--workers"):
+                try:
+                    self.workers = int(arg)
+                except ValueError:
+                    self.workers = 0
+                if self.workers < 1:
+                    print("Number of workers should be a positive integer")
+                    sys.exit()
+            elif opt in ("-m", "--matcher"):
+                if arg not in constant.MATCHERS:
+                    print("Unknown matcher: ", arg)
+                    print_batch_help_message(argv[0])
+                    sys.exit()
+                self.matcher = arg
+            elif opt in ("-c", "--cache"):
+                self.cache_dir = arg
+            elif opt in ("-a", "--annotate"):
+                if arg not in constant.ANNOTATIONS:
+                    print("Unknown annotation mode: ", arg)
+                    print_batch_help_message(argv[0])
+                    sys.exit()
+                self.annotation_mode = arg
+        if self.manifest_file == "" and self.job_dir == "":
+            print("Either a manifest or a job directory is required")
+            print_batch_help_message(argv[0])
+            sys.exit()
+
+
+#
+# Convert the yyyymmdd strings of a date range to datetime objects, the same way as
+# Opts.date_sanity_check() does. Raises ValueError if the date range is invalid
+#
+def parse_date_range(begin_date, end_date):
+    if begin_date == "" and end_date == "":
+        return "", ""
+    begin_date = datetime.strptime(begin_date, "%Y%m%d") if begin_date != "" else datetime(2000, 1, 1)
+    end_date = datetime.strptime(end_date, "%Y%m%d") if end_date != "" else datetime.today()
+    if end_date < begin_date:
+        raise ValueError("End date is earlier than starting date")
+    return begin_date, end_date
+
+
+def print_batch_help_message(command):
+    print("Syntax: ", command, " -f <manifest> | -d <job directory> -s <summary> -w <workers> -m <matcher> -c <cache dir> -a <annotation>")
+    print("\t-f (--manifest): CSV manifest with columns invoice,ledger,output[,begin,end]")
+    print("\t-d (--dir): Directory of job folders, each has one invoice .xls and one ledger .xlsx")
+    print("\t-s (--summary): Combined summary CSV, default: Batch_Summary.csv <optional>")
+    print("\t-w (--workers): Number of jobs run concurrently, default: 2 <optional>")
+    print("\t-m (--matcher): Matching engine, index, numpy or reference, default: index <optional>")
+    print("\t-c (--cache): Directory to cache the parsed general ledgers in <optional>")
+    print("\t-a (--annotate): Invoice matching results as xlsx, csv, column or copy, default: xlsx <optional>")
+    print("\t-h (--help): Print this help menu")
+
+
+class BenchmarkOpts:
+    # Class BenchmarkOpts stores arguments to run the benchmark, xlsrw_benchmark.py, which includes
+    #   1. sizes: numbers of general ledger rows to benchmark, invoices are a quarter of them
+    #   2. data_dir: directory of the generated synthetic data, generated once per size
+    #   3. results_file: JSON lines file the results of every run are appended to
+    #   4. matcher, jobs: matching engine and number of matching processes
+    #   5. trace_memory: trace peak memory of every stage, which slows down the stages
+    #   6. annotation_mode: how the matching results of invoice details are saved, see Opts
+    #
+    def __init__(self, argv):
+        # string: sizes (s:, --sizes), data_dir (d:, --dir), results_file (r:, --results), matcher (m:, --matcher)
+        #         annotation_mode (a:, --annotate), assignment (u:, --assign)
+        # integer: jobs (j:, --jobs)
+        # switch: help (h, --help), no memory tracing (x, --no-memory)
+        self.sizes = [1000, 10000, 100000]
+        self.data_dir = "./benchmark_data"
+        self.results_file = "benchmark_results.jsonl"
+        self.matcher = constant.MATCHER_INDEX
+        self.jobs = 1
+        self.trace_memory = True
+        self.annotation_mode = constant.ANNOTATION_XLSX
+        try:
+            opts, args = getopt.getopt(argv[1:], "hs:d:r:m:j:xa:",
+                                       ["help", "sizes=", "dir=", "results=", "matcher=", "jobs=", "no-memory",
+                                        "annotate="])
+        except getopt.GetoptError:
+            print("Invalid command syntax...")
+            print_benchmark_help_message(argv[0])
+            sys.exit()
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                print_benchmark_help_message(argv[0])
+                sys.exit()
+            elif opt in ("-s", "--sizes"):
+                try:
+                    self.sizes = [int(size) for size in arg.split(",")]
+                except ValueError:
+                    self.sizes = []
+                if len(self.sizes) == 0 or min(self.sizes) < 1:
+                    print("Sizes should be comma separated positive integers")
+                    sys.exit()
+            elif opt in ("-d", "--dir"):
+                self.data_dir = arg
+            elif opt in ("-r", "--results"):
+                self.results_file = arg
+            elif opt in ("-m", "--matcher"):
+                if arg not in constant.MATCHERS:
+                    print("Unknown matcher: ", arg)
+                    print_benchmark_help_message(argv[0])
+                    sys.exit()
+                self.matcher = arg
+            elif opt in ("-j", "--jobs"):
+                try:
+                    self.jobs = int(arg)
+                except ValueError:
+                    self.jobs = 0
+                if self.jobs < 1:
+                    print("Number of jobs should be a positive integer")
+                    sys.exit()
+            elif opt in ("-x", "--no-memory"):
+                self.trace_memory = False
+            elif opt in ("-a", "--annotate"):
+                if arg not in constant.ANNOTATIONS:
+                    print("Unknown annotation mode: ", arg)
+                    print_benchmark_help_message(argv[0])
+                    sys.exit()
+                self.annotation_mode = arg
+
+
+def print_benchmark_help_message(command):
+    print("Syntax: ", command, " -s <sizes> -d <data directory> -r <results> -m <matcher> -j <jobs> -x -a <annotation>")
+    print("\t-s (--sizes): Comma separated numbers of general ledger rows, default: 1000,10000,100000 <optional>")
+    print("\t-d (--dir): Directory of the synthetic data, default: ./benchmark_data <optional>")
+    print("\t-r (--results): JSON lines file to append the results to, default: benchmark_results.jsonl <optional>")
+    print("\t-m (--matcher): Matching engine, index, numpy or reference, default: index <optional>")
+    print("\t-j (--jobs): Number of matching processes, default: 1 <optional>")
+    print("\t-x (--no-memory): Do not trace peak memory, for timing only <optional>")
+    print("\t-a (--annotate): Invoice matching results as xlsx, csv, column or copy, default: xlsx <optional>")
+    print("\t-h (--help): Print this help menu")
+
+
+class DiffTestOpts:
+    # Class DiffTestOpts stores arguments to run the differential test of matching engines,
+    # xlsrw_difftest.py, which includes
+    #   1. rounds: number of randomly generated inputs
+    #   2. seed: seed of the first round, round r is generated with seed + r
+    #   3. engines: matching engines tested against the reference engine
+    #   4. jobs: number of matching processes, the engines are tested in a process pool if > 1
+    #   5. invoices, ledger_records: largest numbers of invoices and ledger records of a round
+    #
+    def __init__(self, argv):
+        # string: engines (m:, --matchers)
+        # integer: rounds (r:, --rounds), seed (s:, --seed), jobs (j:, --jobs), invoices (i:, --invoices),
+        #          ledger_records (l:, --ledger)
+        # switch: help (h, --help)
+        self.rounds = 200
+        self.seed = 1
+        self.engines = [constant.MATCHER_INDEX, constant.MATCHER_NUMPY]
+        self.jobs = 1
+        self.invoices = 60
+        self.ledger_records = 120
+        try:
+            opts, args = getopt.getopt(argv[1:], "hr:s:m:j:i:l:",
+                                       ["help", "rounds=", "seed=", "matchers=", "jobs=", "invoices=", "ledger="])
+        except getopt.GetoptError:
+            print("Invalid command syntax...")
+            print_difftest_help_message(argv[0])
+            sys.exit()
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                print_difftest_help_message(argv[0])
+                sys.exit()
+            elif opt in ("-m", "--matchers"):
+                self.engines = arg.split(",")
+                for engine in self.engines:
+                    if engine not in constant.MATCHERS:
+                        print("Unknown matcher: ", engine)
+                        print_difftest_help_message(argv[0])
+                        sys.exit()
+            elif opt in ("-r", "--rounds", "-s", "--seed", "-j", "--jobs", "-i", "--invoices", "-l", "--ledger"):
+                try:
+                    value = int(arg)
+                except ValueError:
+                    value = -1
+                if value < 0 or (value == 0 and opt not in ("-s", "--seed")):
+                    print("Option %s should be a positive integer" % opt)
+                    sys.exit()
+                if opt in ("-r", "--rounds"):
+                    self.rounds = value
+                elif opt in ("-s", "--seed"):
+                    self.seed = value
+                elif opt in ("-j", "--jobs"):
+                    self.jobs = value
+                elif opt in ("-i", "--invoices"):
+                    self.invoices = value
+                else:
+                    self.ledger_records = value
+
+
+def print_difftest_help_message(command):
+    print("Syntax: ", command, " -r <rounds> -s <seed> -m <matchers> -j <jobs> -i <invoices> -l <ledger records>")
+    print("\t-r (--rounds): Number of randomly generated inputs, default: 200 <optional>")
+    print("\t-s (--seed): Seed of the first round, default: 1 <optional>")
+    print("\t-m (--matchers): Comma separated matching engines to test against the reference engine,")
+    print("\t                 default: index,numpy <optional>")
+    print("\t-j (--jobs): Number of matching processes, default: 1 <optional>")
+    print("\t-i (--invoices): Largest number of invoices of a round, default: 60 <optional>")
+    print("\t-l (--ledger): Largest number of ledger records of a round, default: 120 <optional>")
+    print("\t-h (--help): Print this help menu")
+
+
+class ServiceOpts:
+    # Class ServiceOpts stores arguments to run the local reconciliation service, xlsrw_service.py,
+    # which includes
+    #   1. port: TCP port the service listens on, on constant.SERVICE_HOST
+    #   2. watch_dir: folder watched for new or changed exports, none if empty
+    #   3. max_entries: number of general ledgers, ledger snapshots and invoice details kept in memory
+    #   4. cache_dir: directory of the parsed general ledger cache, no cache if empty
+    #   5. poll_seconds: seconds between scans of the watch folder
+    #
+    def __init__(self, argv):
+        # string: watch_dir (w:, --watch), cache_dir (c:, --cache)
+        # integer: port (p:, --port), max_entries (n:, --entries)
+        # number: poll_seconds (t:, --poll)
+        # switch: help (h, --help)
+        self.port = constant.SERVICE_PORT
+        self.watch_dir = ""
+        self.max_entries = constant.SERVICE_CACHE_ENTRIES
+        self.cache_dir = ""
+        self.poll_seconds = constant.SERVICE_WATCH_POLL_SECONDS
+        try:
+            opts, args = getopt.getopt(argv[1:], "hp:w:n:c:t:",
+                                       ["help", "port=", "watch=", "entries=", "cache=", "poll="])
+        except getopt.GetoptError:
+            print("Invalid command syntax...")
+            print_service_help_message(argv[0])
+            sys.exit()
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                print_service_help_message(argv[0])
+                sys.exit()
+            elif opt in ("-w", "--watch"):
+                self.watch_dir = arg
+            elif opt in ("-c", "--cache"):
+                self.cache_dir = arg
+            elif opt in ("-p", "--port", "-n", "--entries"):
+                try:
+                    value = int(arg)
+                except ValueError:
+                    value = 0
+                if value < 1:
+                    print("Option %s should be a positive integer" % opt)
+                    sys.exit()
+                if opt in ("-p", "--port"):
+                    self.port = value
+                else:
+                    self.max_entries = value
+            elif opt in ("-t", "--poll"):
+                try:
+                    self.poll_seconds = float(arg)
+                except ValueError:
+                    self.poll_seconds = 0
+                if self.poll_seconds <= 0:
+                    print("Seconds between scans should be a positive number")
+                    sys.exit()
+
+
+def print_service_help_message(command):
+    print("Syntax: ", command, " -p <port> -w <watch dir> -n <entries> -c <cache dir> -t <poll seconds>")
+    print("\t-p (--port): Port to listen on, on %s, default: %d <optional>" % (constant.SERVICE_HOST,
+                                                                             constant.SERVICE_PORT))
+    print("\t-w (--watch): Folder watched for new or changed invoice and general ledger files <optional>")
+    print("\t-n (--entries): Number of general ledgers, ledger snapshots and invoice details kept in memory,")
+    print("\t                default: %d <optional>" % constant.SERVICE_CACHE_ENTRIES)
+    print("\t-c (--cache): Directory to cache the parsed general ledger in <optional>")
+    print("\t-t (--poll): Seconds between scans of the watch folder, default: %g <optional>"
+          % constant.SERVICE_WATCH_POLL_SECONDS)
     print("\t-h (--help): Print this help menu")
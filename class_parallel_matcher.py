@@ -0,0 +1,159 @@
+#
+# File: class_parallel_matcher.py
+# Brief: Multi-core invoice matching with a process pool, invoices and ledger records are
+#        partitioned by buyer key
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 shards matched by the engine of class_matching_engine.py
+#
+# Note:
+#   1. Match criteria never cross buyers, so invoices of the same buyer key, along with the ledger
+#      records of which the text includes that key, form an independent shard of work
+#   2. Ledger columns are placed in shared memory once; workers attach to them by name and only
+#      receive the ledger positions of their shard, instead of a pickled copy of the ledger
+#   3. Worker processes are started with the platform default method, spawn on Windows, so the
+#      worker entry, _match_shard(), stays a module-level function
+#
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import class_buyer_resolver
+import class_ledger
+import class_matching_engine
+import class_metrics
+import class_transaction
+import utility
+
+# ledger snapshot columns placed in shared memory, with their array type codes
+SHARED_COLUMNS = (("row", "q"), ("date_ordinal", "q"), ("amount_cents", "q"),
+                  ("exchange_rate", "d"), ("amount_us", "d"))
+# number of shards per worker, more shards than workers keeps the workers evenly loaded
+SHARDS_PER_WORKER = 4
+
+
+class SharedLedger:
+    # Class SharedLedger copies the columns of a ledger snapshot into shared memory blocks,
+    # buyer texts are stored as one UTF-8 buffer along with the offsets of each text
+    #
+    def __init__(self, ledger):
+        self.blocks = []
+        self.names = {}
+        for column, typecode in SHARED_COLUMNS:
+            self._share(column, array(typecode, getattr(ledger, column)).tobytes())
+        encoded_texts = [buyer_text.encode("utf-8") for buyer_text in ledger.buyer_text]
+        text_offsets = array("q", [0])
+        for encoded_text in encoded_texts:
+            text_offsets.append(text_offsets[-1] + len(encoded_text))
+        self._share("text_offsets", text_offsets.tobytes())
+        self._share("text_bytes", b"".join(encoded_texts))
+
+    def _share(self, column, data):
+        # shared memory of size 0 is not allowed
+        block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        block.buf[:len(data)] = data
+        self.blocks.append(block)
+        self.names[column] = (block.name, len(data))
+
+    def release(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+#
+# Match the source transactions against the ledger snapshot in a pool of worker processes.
+# Returns, for each source transaction, the list of ledger positions it matches in row order,
+# the same as the serial matchers. Candidates examined by the workers are counted in metrics if given
+#
+def match_all(ledger, source_transactions, matcher, workers, metrics=None):
+    results = [[] for _ in source_transactions]
+    shards = partition_by_buyer(ledger, source_transactions, workers * SHARDS_PER_WORKER)
+    if len(shards) == 0:
+        return results
+    shared_ledger = SharedLedger(ledger)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=utility.worker_logging,
+                                 initargs=utility.worker_logging_args()) as executor:
+            futures = []
+            for shard_positions, shard_sources in shards:
+                source_values = [transaction_values(source_transactions[k]) for k in shard_sources]
+                futures.append(executor.submit(_match_shard, shared_ledger.names, shard_positions,
+                                               source_values, matcher))
+            number_of_matched = 0
+            try:
+                for (shard_positions, shard_sources), future in zip(shards, futures):
+                    shard_results, shard_counters = future.result()
+                    for k, local_matches in zip(shard_sources, shard_results):
+                        results[k] = [shard_positions[it] for it in local_matches]
+                    number_of_matched += len(shard_sources)
+                    if metrics is not None:
+                        metrics.update_counters(shard_counters)
+                        metrics.progress("match_invoices", number_of_matched, len(source_transactions))
+            except class_metrics.RunCancelled:
+                # shards not started yet are dropped, instead of being waited for on leaving the pool
+                executor.shutdown(cancel_futures=True)
+                raise
+    finally:
+        shared_ledger.release()
+    return results
+
+
+#
+# Group the source transactions by buyer key, and pack the groups into at most num_of_shards
+# shards of similar work load, largest group first. Each shard is a tuple of
+#   (ascending ledger positions relevant to the shard, indexes of its source transactions)
+#
+def partition_by_buyer(ledger, source_transactions, num_of_shards):
+    buyer_groups = {}
+    for k, source_transaction in enumerate(source_transactions):
+        buyer_groups.setdefault(source_transaction.buyer_key(), []).append(k)
+    buyer_index = class_buyer_resolver.BuyerIndex(ledger)
+    groups = []
+    for buyer_key, group_sources in buyer_groups.items():
+        positions = buyer_index.positions_of(buyer_key)
+        groups.append((len(group_sources) * max(len(positions), 1), positions, group_sources))
+    groups.sort(key=lambda group: group[0], reverse=True)
+    shards = [[0, set(), []] for _ in range(min(num_of_shards, len(groups)))]
+    for load, positions, group_sources in groups:
+        shard = min(shards, key=lambda s: s[0])
+        shard[0] += load
+        shard[1].update(positions)
+        shard[2].extend(group_sources)
+    return [(sorted(positions), sorted(group_sources)) for load, positions, group_sources in shards]
+
+
+def transaction_values(transaction):
+    return (transaction.invoice_number, transaction.buyer_name, transaction.invoice_date,
+            transaction.invoice_amount_NT, transaction.invoice_amount_US, transaction.function_currency,
+            transaction.exchange_rate, transaction.source)
+
+
+#
+# Worker entry: rebuild the ledger records of the shard from shared memory and match the shard
+# with the serial matcher. Returns the matched positions local to the shard, along with the
+# counters of the shard
+#
+def _match_shard(shared_names, shard_positions, source_values, matcher):
+    blocks = {column: shared_memory.SharedMemory(name=name) for column, (name, size) in shared_names.items()}
+    views = []
+    try:
+        for column, typecode in SHARED_COLUMNS + (("text_offsets", "q"), ("text_bytes", "B")):
+            views.append(blocks[column].buf[:shared_names[column][1]].cast(typecode))
+        row, date_ordinal, amount_cents, exchange_rate, amount_us, text_offsets, text_bytes = views
+        ledger = class_ledger.LedgerSnapshot()
+        for p in shard_positions:
+            buyer_text = bytes(text_bytes[text_offsets[p]:text_offsets[p+1]]).decode("utf-8")
+            ledger.append_record(row[p], "", buyer_text, date_ordinal[p], amount_cents[p], exchange_rate[p],
+                                 amount_us[p])
+    finally:
+        for view in views:
+            view.release()
+        for block in blocks.values():
+            block.close()
+    source_transactions = [class_transaction.Transaction(*values) for values in source_values]
+    metrics = class_metrics.RunMetrics()
+    results = class_matching_engine.matching_engine(matcher).match_all(ledger, source_transactions, metrics)
+    return results, metrics.counters
@@ -0,0 +1,557 @@
+#
+# File: class_reconcile_service.py
+# Brief: Long-running local reconciliation service, which keeps parsed general ledgers, ledger
+#        snapshots along with their indexes and invoice details in memory, watches an input folder
+#        for new or changed exports, and runs match jobs submitted through a local HTTP/JSON API
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 requests authenticated by the token of the service, JSON bodies only and
+#                  outputs restricted to the folder of the invoice details, see Note 6
+#   3. 2026/10/18: v. 0.3 date ranges of the entries in memory keyed by day, outputs skipped by the
+#                  watch folder bounded by the jobs kept
+#
+# Note:
+#   1. Jobs are run one at a time by the job thread, through the pipeline functions of xlsrw_oop.py,
+#      as reconcile_invoice_and_general_ledger() does. The general ledger rows, the ledger snapshot
+#      of the date range and the invoice details are taken from memory if their file is unchanged,
+#      i.e. same path, size and mtime, so that a repeated run only matches and writes the results
+#   2. Entries kept in memory, of any kind, are bounded by number and evicted least recently used
+#      first. Entries of a file are dropped as soon as the file is seen changed. General ledgers
+#      missing in memory are taken from the on-disk ledger cache if given, see class_ledger_cache.py
+#   3. The watch folder is scanned every poll seconds; a new or changed .xlsx is read as a general
+#      ledger, with its snapshot of no date range, and a .xls as invoice details, once its size and
+#      mtime are the same in two scans in a row, so that a file being copied is not read half way.
+#      The outputs of the jobs kept by the service, see Note 5, external sales files and sidecar
+#      files are skipped.
+#      Warming up is queued to the job thread as well, so that the entries in memory are never built
+#      by two threads
+#   4. API, JSON in and out, bound to constant.SERVICE_HOST only:
+#      - GET /status: jobs by status and the entries in memory
+#      - GET /jobs, GET /jobs/<id>: jobs and their status, progress, summary and metrics
+#      - POST /jobs: submit a job of invoice, ledger[, output, begin, end, matcher, annotation_mode,
+#        assignment, voucher_types, account_patterns], begin and end as yyyymmdd; returns the job
+#      - DELETE /jobs/<id>: cancel the job, see class_metrics.RunCancelled
+#   5. Finished jobs are kept for their results, up to constant.SERVICE_FINISHED_JOBS
+#   6. Any local process can reach the port, so
+#      - every request carries the token of the service in constant.SERVICE_TOKEN_HEADER; a random
+#        token is written at each start to constant.SERVICE_TOKEN_FILE, readable by the user only,
+#        see write_service_token(), otherwise the request is refused with 401
+#      - POST bodies of another Content-Type than application/json are refused with 415, so that a
+#        web page can not submit a job with a simple form post
+#      - output, relative to the folder of the invoice details, is resolved and should be inside
+#        that folder, so that a job never writes anywhere else
+#
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hmac
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+
+import constant
+import class_invoice_annotation
+import class_invoice_details
+import class_ledger
+import class_metrics
+import class_opts
+import class_row_filter
+import class_side_process
+import xlsrw_oop
+
+JOB_FIELDS = ("invoice", "ledger", "output", "begin", "end", "matcher", "annotation_mode", "assignment",
+              "voucher_types", "account_patterns")
+EXTERNAL_SALES_FILE = "External_Sales.xlsx"
+# external sales files, e.g. External_Sales.xlsx or External_Sales_GUI.xlsx, are outputs, not exports
+EXTERNAL_SALES_PREFIX = "external_sales"
+GENERAL_LEDGER_EXTENSION = ".xlsx"
+INVOICE_DETAILS_EXTENSION = ".xls"
+
+
+class LRUCache:
+    # Class LRUCache keeps at most max_entries values, the least recently used one is evicted first.
+    # Keys are tuples of which the second item is the stamp of the file the value is read from, see
+    # file_stamp()
+    #
+    def __init__(self, max_entries=constant.SERVICE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    #
+    # put() keeps the value, replacing the values of the same kind read from an older version of
+    # the file
+    #
+    def put(self, key, value):
+        with self.lock:
+            for old_key in [old_key for old_key in self.entries
+                            if old_key[0] == key[0] and old_key[1][0] == key[1][0] and old_key[1] != key[1]]:
+                del self.entries[old_key]
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    #
+    # discard_file() drops the entries read from the file of the path, of any stamp
+    #
+    def discard_file(self, path):
+        path = os.path.normcase(os.path.abspath(path))
+        with self.lock:
+            for key in [key for key in self.entries if key[1][0] == path]:
+                del self.entries[key]
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries)
+
+
+class ServiceJob:
+    # Class ServiceJob keeps one match job submitted to the service
+    #   1. request: the fields of the job as submitted, see JOB_FIELDS
+    #   2. status: one of constant.SERVICE_JOB_*
+    #   3. progress: (stage, done, total) last reported by the run
+    #   4. summary, metrics: the matching summary and the metrics of the run once done
+    #   5. outputs: normalized paths of the files the job writes, skipped by the watch folder
+    #
+    def __init__(self, job_id, request):
+        self.job_id = job_id
+        self.request = request
+        self.outputs = {os.path.normcase(request["output"])}
+        if request["annotation_mode"] != constant.ANNOTATION_COPY:
+            self.outputs.add(os.path.normcase(class_invoice_annotation.annotation_file(request["invoice"],
+                                                                                       request["annotation_mode"])))
+        self.status = constant.SERVICE_JOB_QUEUED
+        self.submitted = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.seconds = None
+        self.progress = None
+        self.summary = None
+        self.metrics = None
+        self.error = None
+        self.cancel_event = threading.Event()
+
+    def report_progress(self, stage, done, total):
+        self.progress = (stage, done, total)
+
+    def as_dict(self):
+        return {"id": self.job_id, "status": self.status, "submitted": self.submitted, "seconds": self.seconds,
+                "request": self.request,
+                "progress": None if self.progress is None else dict(zip(("stage", "done", "total"), self.progress)),
+                "summary": self.summary, "metrics": self.metrics, "error": self.error}
+
+
+class ReconcileService:
+    # Class ReconcileService runs the submitted jobs and the warm-ups of the watch folder in its job
+    # thread, and keeps the entries read from the files in an LRUCache
+    #   1. ledger_cache: on-disk ledger cache(class_ledger_cache.LedgerCache) or None
+    #   2. watch_dir: folder watched for new or changed exports, "" for none
+    #
+    def __init__(self, max_entries=constant.SERVICE_CACHE_ENTRIES, ledger_cache=None, watch_dir="",
+                 poll_seconds=constant.SERVICE_WATCH_POLL_SECONDS):
+        self.cache = LRUCache(max_entries)
+        self.ledger_cache = ledger_cache
+        self.watch_dir = watch_dir
+        self.poll_seconds = poll_seconds
+        self.jobs = OrderedDict()
+        self.jobs_lock = threading.Lock()
+        self.next_job_id = 1
+        self.tasks = queue.Queue()
+        self.stopped = threading.Event()
+        self.threads = [threading.Thread(target=self._run_tasks, name="Reconcile_service_jobs", daemon=True)]
+        if watch_dir != "":
+            self.threads.append(threading.Thread(target=self._watch, name="Reconcile_service_watch", daemon=True))
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.tasks.put(None)
+        for job in self.list_jobs():
+            job.cancel_event.set()
+        for thread in self.threads:
+            thread.join()
+
+    #
+    # submit() validates the request and queues the job, raises ValueError if the request is invalid
+    #
+    def submit(self, request):
+        request = job_request(request)
+        with self.jobs_lock:
+            job = ServiceJob(str(self.next_job_id), request)
+            self.next_job_id += 1
+            self.jobs[job.job_id] = job
+            self._prune_jobs()
+        self.tasks.put(("job", job))
+        logging.info("常駐服務: 收到工作 %s, 發票 %s, 總帳 %s", job.job_id, request["invoice"], request["ledger"])
+        return job
+
+    def job(self, job_id):
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.jobs_lock:
+            return list(self.jobs.values())
+
+    #
+    # cancel() cancels a queued or running job, returns the job or None if there is no such job
+    #
+    def cancel(self, job_id):
+        job = self.job(job_id)
+        if job is not None and job.status not in constant.SERVICE_JOB_FINISHED:
+            job.cancel_event.set()
+        return job
+
+    def status(self):
+        counts = {}
+        for job in self.list_jobs():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"jobs": counts, "watch_dir": self.watch_dir, "max_entries": self.cache.max_entries,
+                "entries": [{"kind": key[0], "file": key[1][0]} for key in self.cache.keys()]}
+
+    #
+    # general_ledger_rows() returns the header and the rows of the general ledger kept by the filter,
+    # without date range, read unless in memory
+    #
+    def general_ledger_rows(self, gl_excel, gl_filter, metrics):
+        key = ("ledger", file_stamp(gl_excel), gl_filter.key())
+        entry = self.cache.get(key)
+        if entry is not None:
+            metrics.count("service_ledger_hits")
+            return entry
+        entry = xlsrw_oop.filter_general_ledger(gl_excel, "", "", self.ledger_cache, None, metrics, gl_filter)
+        self.cache.put(key, entry)
+        return entry
+
+    #
+    # ledger_view() returns the header, the rows and the ledger snapshot of the general ledger in the
+    # date range. The snapshot keeps its index once built, see class_ledger_index.match_all()
+    #
+    def ledger_view(self, gl_excel, gl_filter, start_date, end_date, metrics):
+        key = ("view", file_stamp(gl_excel), gl_filter.key(), date_key(start_date), date_key(end_date))
+        entry = self.cache.get(key)
+        if entry is not None:
+            metrics.count("service_view_hits")
+            return entry
+        header, gl_rows = self.general_ledger_rows(gl_excel, gl_filter, metrics)
+        with metrics.stage("filter_by_date", len(gl_rows)):
+            gl_rows = xlsrw_oop.filter_general_ledger_rows_by_date(gl_rows, start_date, end_date, metrics)
+        with metrics.stage("load_ledger_snapshot", len(gl_rows)):
+            ledger = class_ledger.load_general_ledger_rows(gl_rows)
+        entry = (header, gl_rows, ledger)
+        self.cache.put(key, entry)
+        return entry
+
+    #
+    # invoice_details() returns the invoice details(class_invoice_details.InvoiceDetails), read
+    # unless in memory
+    #
+    def invoice_details(self, invoice_excel):
+        key = ("invoices", file_stamp(invoice_excel))
+        invoice_details = self.cache.get(key)
+        if invoice_details is None:
+            invoice_details = class_invoice_details.read_invoice_details(invoice_excel)
+            self.cache.put(key, invoice_details)
+        return invoice_details
+
+    def _run_tasks(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            kind, target = task
+            if kind == "job":
+                self._run_job(target)
+            else:
+                self._warm_up(target)
+
+    def _run_job(self, job):
+        if job.cancel_event.is_set():
+            job.status = constant.SERVICE_JOB_CANCELLED
+            return
+        job.status = constant.SERVICE_JOB_RUNNING
+        request = job.request
+        start_time = time.time()
+        metrics = class_metrics.RunMetrics(job.report_progress, cancel_event=job.cancel_event)
+        try:
+            start_date, end_date = class_opts.parse_date_range(request["begin"], request["end"])
+            gl_filter = class_row_filter.GeneralLedgerFilter(request["voucher_types"], request["account_patterns"])
+            header, gl_rows, ledger = self.ledger_view(request["ledger"], gl_filter, start_date, end_date, metrics)
+            # the invoice details in memory are handed over as if read in a side process
+            side_process = class_side_process.SideProcess(enabled=False)
+            side_process.submit("read_invoice_details", self.invoice_details, request["invoice"])
+            job.summary = xlsrw_oop.reconcile_general_ledger_rows(request["invoice"], header, gl_rows,
+                                                                  request["output"], None, request["matcher"], 1,
+                                                                  None, request["annotation_mode"],
+                                                                  request["assignment"], metrics, side_process,
+                                                                  start_date, end_date, ledger)
+            job.status = constant.SERVICE_JOB_DONE
+        except class_metrics.RunCancelled:
+            logging.warning("常駐服務: 工作 %s 已取消", job.job_id)
+            job.status = constant.SERVICE_JOB_CANCELLED
+        except Exception as e:
+            logging.exception("常駐服務: 工作 %s 失敗", job.job_id)
+            job.error = str(e)
+            job.status = constant.SERVICE_JOB_FAILED
+        job.seconds = round(time.time() - start_time, 3)
+        job.metrics = metrics.as_dict()
+
+    #
+    # Read a new or changed file of the watch folder into memory, general ledgers with the default
+    # filter and no date range
+    #
+    def _warm_up(self, path):
+        metrics = class_metrics.RunMetrics()
+        start_time = time.time()
+        self.cache.discard_file(path)
+        try:
+            if path.lower().endswith(GENERAL_LEDGER_EXTENSION):
+                self.ledger_view(path, class_row_filter.GeneralLedgerFilter(), "", "", metrics)
+            else:
+                self.invoice_details(path)
+        except Exception as e:
+            logging.warning("常駐服務: %s 無法預先讀取: %s", path, e)
+            return
+        logging.info("常駐服務: 預先讀取 %s, 耗時 %.1f 秒", path, time.time() - start_time)
+
+    def _watch(self):
+        seen = {}
+        pending = {}
+        poll_seconds = 0
+        while not self.stopped.wait(poll_seconds):
+            poll_seconds = self.poll_seconds
+            for path, stamp in self._scan_watch_dir().items():
+                if seen.get(path) == stamp:
+                    continue
+                if pending.get(path) == stamp:
+                    # unchanged since the previous scan, the file is complete
+                    del pending[path]
+                    seen[path] = stamp
+                    self.tasks.put(("warm", path))
+                else:
+                    pending[path] = stamp
+
+    def _scan_watch_dir(self):
+        found = {}
+        try:
+            entries = list(os.scandir(self.watch_dir))
+        except OSError as e:
+            logging.warning("常駐服務: 無法讀取監看資料夾 %s: %s", self.watch_dir, e)
+            return found
+        with self.jobs_lock:
+            outputs = set().union(*(job.outputs for job in self.jobs.values()))
+        for entry in entries:
+            name = entry.name.lower()
+            if not entry.is_file() or name.startswith("~$") or \
+                    not name.endswith((GENERAL_LEDGER_EXTENSION, INVOICE_DETAILS_EXTENSION)):
+                continue
+            if name.startswith(EXTERNAL_SALES_PREFIX) or \
+                    name.endswith(tuple(class_invoice_annotation.ANNOTATION_FILE_SUFFIXES.values())):
+                continue
+            path = os.path.abspath(entry.path)
+            if os.path.normcase(path) in outputs:
+                continue
+            stat = entry.stat()
+            found[path] = (stat.st_size, stat.st_mtime_ns)
+        return found
+
+    def _prune_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in constant.SERVICE_JOB_FINISHED]
+        for job_id in finished[:max(0, len(finished) - constant.SERVICE_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    # Class ServiceRequestHandler serves the API of Note 4 for the ReconcileService of the server
+    #
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts = self._path_parts()
+        service = self.server.service
+        if parts == ["status"]:
+            self._reply(200, service.status())
+        elif parts == ["jobs"]:
+            self._reply(200, {"jobs": [job.as_dict() for job in service.list_jobs()]})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            self._reply_job(service.job(parts[1]))
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self._path_parts() != ["jobs"]:
+            self._reply(404, {"error": "not found"})
+            return
+        if self.headers.get_content_type() != "application/json":
+            self._reply(415, {"error": "Content-Type should be application/json"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            job = self.server.service.submit(request)
+        except (ValueError, TypeError) as e:
+            self._reply(400, {"error": str(e)})
+            return
+        self._reply(202, job.as_dict())
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        parts = self._path_parts()
+        if len(parts) == 2 and parts[0] == "jobs":
+            self._reply_job(self.server.service.cancel(parts[1]))
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def log_message(self, format, *args):
+        logging.debug("常駐服務: %s %s", self.address_string(), format % args)
+
+    def _authorized(self):
+        # header values are decoded as ISO-8859-1, hence encoded back the same way
+        token = self.headers.get(constant.SERVICE_TOKEN_HEADER, "").encode("latin-1")
+        if hmac.compare_digest(token, self.server.token.encode("latin-1")):
+            return True
+        self._reply(401, {"error": "invalid service token"})
+        return False
+
+    def _path_parts(self):
+        return [part for part in self.path.split("?")[0].split("/") if part != ""]
+
+    def _reply_job(self, job):
+        if job is None:
+            self._reply(404, {"error": "no such job"})
+        else:
+            self._reply(200, job.as_dict())
+
+    def _reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+#
+# HTTP server of the service on host:port accepting requests with the token, serve_forever() to run it
+#
+def service_server(service, token, host=constant.SERVICE_HOST, port=constant.SERVICE_PORT):
+    server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.token = token
+    return server
+
+
+#
+# Write a new random token to token_file, readable and writable by the user only, and return it.
+# The file is created anew, so that the permissions of a previous file are not kept
+#
+def write_service_token(token_file=constant.SERVICE_TOKEN_FILE):
+    token_file = os.path.expanduser(token_file)
+    token = secrets.token_urlsafe(32)
+    remove_service_token(token_file)
+    fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+    return token
+
+
+def remove_service_token(token_file=constant.SERVICE_TOKEN_FILE):
+    try:
+        os.remove(os.path.expanduser(token_file))
+    except FileNotFoundError:
+        pass
+
+
+#
+# Validate a submitted job and fill in the defaults, paths made absolute. Raises ValueError
+#
+def job_request(request):
+    if not isinstance(request, dict):
+        raise ValueError("job should be a JSON object")
+    unknown = [field for field in request if field not in JOB_FIELDS]
+    if len(unknown) > 0:
+        raise ValueError("unknown fields: %s" % ",".join(unknown))
+    job = {}
+    for field in ("invoice", "ledger"):
+        if not isinstance(request.get(field), str) or request[field] == "":
+            raise ValueError("%s is required" % field)
+        job[field] = os.path.abspath(request[field])
+        if not os.path.isfile(job[field]):
+            raise ValueError("%s not found: %s" % (field, job[field]))
+    job["output"] = job_output(job["invoice"], request.get("output") or EXTERNAL_SALES_FILE)
+    job["begin"] = str(request.get("begin") or "")
+    job["end"] = str(request.get("end") or "")
+    class_opts.parse_date_range(job["begin"], job["end"])
+    for field, default, choices in (("matcher", constant.MATCHER_INDEX, constant.MATCHERS),
+                                    ("annotation_mode", constant.ANNOTATION_XLSX, constant.ANNOTATIONS),
+                                    ("assignment", constant.ASSIGNMENT_ALL, constant.ASSIGNMENTS)):
+        job[field] = request.get(field) or default
+        if job[field] not in choices:
+            raise ValueError("unknown %s: %s" % (field, job[field]))
+    for field, default in (("voucher_types", constant.GL_VOUCHER_TYPES),
+                           ("account_patterns", constant.GL_ACCOUNT_PATTERNS)):
+        values = request.get(field) or default
+        if isinstance(values, str):
+            values = class_opts.parse_list(values)
+        if not all(isinstance(value, str) for value in values):
+            raise ValueError("%s should be strings" % field)
+        job[field] = list(values)
+    return job
+
+
+#
+# Output of a job, relative to the folder of the invoice details, see Note 6. Raises ValueError if it
+# is resolved, symbolic links followed, outside that folder
+#
+def job_output(invoice, output):
+    if not isinstance(output, str):
+        raise ValueError("output should be a file name")
+    invoice_dir = os.path.dirname(invoice)
+    real_invoice_dir = os.path.realpath(invoice_dir)
+    real_output = os.path.realpath(os.path.join(invoice_dir, output))
+    try:
+        inside = os.path.commonpath([real_invoice_dir, real_output]) == real_invoice_dir and \
+            real_output != real_invoice_dir
+    except ValueError:
+        # on different drives
+        inside = False
+    if not inside:
+        raise ValueError("output should be in the folder of the invoice details: %s" % invoice_dir)
+    return os.path.join(invoice_dir, os.path.relpath(real_output, real_invoice_dir))
+
+
+#
+# Key of a date of a date range in memory, the day only: an end date left out is today, along with
+# the time of the day, see class_opts.parse_date_range(), and the same day is the same date range
+#
+def date_key(date):
+    return date.strftime("%Y%m%d") if date != "" else ""
+
+
+#
+# Stamp of a file, its normalized absolute path, size and mtime, which changes whenever the file does
+#
+def file_stamp(path):
+    stat = os.stat(path)
+    return os.path.normcase(os.path.abspath(path)), stat.st_size, stat.st_mtime_ns
@@ -0,0 +1,154 @@
+#
+# File: class_row_filter.py
+# Brief: Predicates on single columns of general ledger and invoice rows, the configurable filter
+#        of the general ledger, voucher types, account patterns and voucher date range, and the
+#        count of rows each predicate eliminated
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+# Note:
+#   1. A predicate looks at one column of the row only, its projection. The predicates of a filter
+#      are checked cheapest first, a row is dropped by the first predicate it fails, and the
+#      predicate is charged with the row: voucher type is a set lookup, an account pattern a
+#      substring search, and the voucher date a parse, memoized by utility.parse_date()
+#   2. An account description which is not text, e.g. an empty cell, matches no account pattern,
+#      and a date which can not be parsed is out of any date range; such rows are dropped and
+#      counted instead of raising in the middle of the general ledger
+#   3. An account pattern matches if it is found anywhere in the account description, i.e.
+#      "Accounts Receivable" matches "1191-000 Accounts Receivable" as well as a description
+#      starting with it, which the hard coded filter used to drop
+#   4. Invoices are filtered by the date range of the general ledger as well, widened by the date
+#      allowance of the match criteria, see invoice_date_predicate()
+#   5. GeneralLedgerFilter.key() identifies the voucher types and account patterns, so that the
+#      ledger cache keeps the rows filtered with different settings apart
+#
+from datetime import datetime, timedelta
+import hashlib
+import logging
+import constant
+import utility
+
+# the invoice date and voucher date of a match are one day apart at most, see
+# class_transaction.Transaction.match_amount_and_date()
+INVOICE_DATE_MARGIN = timedelta(days=1)
+
+
+class RowPredicate:
+    # Class RowPredicate tests the value of one column of a row
+    #   1. name: name of the counter of the rows it eliminates
+    #   2. label: name shown in the report
+    #   3. column: 0-based column of the row it tests
+    #   4. cost: relative cost of the test, predicates are checked in increasing cost
+    #   5. test: function of the column value, True to keep the row
+    #
+    def __init__(self, name, label, column, cost, test):
+        self.name = name
+        self.label = label
+        self.column = column
+        self.cost = cost
+        self.test = test
+
+
+class RowFilter:
+    # Class RowFilter keeps the rows which pass all of its predicates, and counts the rows read and
+    # the rows eliminated by each predicate
+    #
+    def __init__(self, predicates):
+        self.predicates = sorted(predicates, key=lambda predicate: predicate.cost)
+        self.tests = [(predicate.column, predicate.test) for predicate in self.predicates]
+        self.eliminated = [0] * len(self.predicates)
+        self.rows_read = 0
+
+    def accepts(self, row):
+        self.rows_read += 1
+        for k, (column, test) in enumerate(self.tests):
+            if not test(row[column]):
+                self.eliminated[k] += 1
+                return False
+        return True
+
+    def filter(self, rows):
+        return [r for r in rows if self.accepts(r)]
+
+    #
+    # report() adds the number of rows eliminated by each predicate to the counters of
+    # metrics(class_metrics.RunMetrics), prefixed with counter_prefix, and logs them in one line
+    #
+    def report(self, metrics, counter_prefix, title):
+        for predicate, eliminated in zip(self.predicates, self.eliminated):
+            metrics.count(counter_prefix + predicate.name, eliminated)
+        if len(self.predicates) > 0:
+            logging.info("%s: 讀取 %d 列, %s, 保留 %d 列", title, self.rows_read,
+                         ", ".join("%s排除 %d 列" % (predicate.label, eliminated)
+                                   for predicate, eliminated in zip(self.predicates, self.eliminated)),
+                         self.rows_read - sum(self.eliminated))
+
+
+class GeneralLedgerFilter:
+    # Class GeneralLedgerFilter is the configuration of the general ledger filter
+    #   1. voucher_types: voucher types kept, e.g. ("F",)
+    #   2. account_patterns: a row is kept if its account description includes any of them
+    #
+    def __init__(self, voucher_types=constant.GL_VOUCHER_TYPES, account_patterns=constant.GL_ACCOUNT_PATTERNS):
+        self.voucher_types = tuple(voucher_types)
+        self.account_patterns = tuple(account_patterns)
+
+    #
+    # predicates() returns the predicates of the filter, with the voucher date range if start_date
+    # and end_date are given
+    #
+    def predicates(self, start_date="", end_date=""):
+        predicates = [voucher_type_predicate(self.voucher_types), account_predicate(self.account_patterns)]
+        if start_date != "" or end_date != "":
+            predicates.append(general_ledger_date_predicate(start_date, end_date))
+        return predicates
+
+    def key(self):
+        text = "\t".join(("voucher_types",) + self.voucher_types + ("account_patterns",) + self.account_patterns)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def voucher_type_predicate(voucher_types):
+    return RowPredicate("voucher_type", "傳票類別", constant.COL_GL_VOUCHER_TYPE, 1, frozenset(voucher_types).__contains__)
+
+
+def account_predicate(account_patterns):
+    def test(account_description):
+        if type(account_description) is not str:
+            return False
+        for pattern in account_patterns:
+            if pattern in account_description:
+                return True
+        return False
+    return RowPredicate("account", "會計科目", constant.COL_GL_ACCOUNT_DESCRIPTION, 2, test)
+
+
+def general_ledger_date_predicate(start_date, end_date):
+    return date_range_predicate("voucher_date", "傳票日期", constant.COL_GL_INVOICE_DATE,
+                                constant.DATE_FORMAT_GENERAL_LEDGER, start_date, end_date)
+
+
+#
+# Predicate of a date column in [start_date, end_date], the dates being text of date_format or
+# datetime objects
+#
+def date_range_predicate(name, label, column, date_format, start_date, end_date):
+    def test(date_value):
+        if type(date_value) is not datetime:
+            try:
+                date_value = utility.parse_date(date_value, date_format)
+            except (TypeError, ValueError):
+                return False
+        return start_date <= date_value <= end_date
+    return RowPredicate(name, label, column, 3, test)
+
+
+#
+# Predicate of the invoice date in the date range, widened by INVOICE_DATE_MARGIN, so that an invoice
+# dated next to the range keeps its match with a general ledger record in the range
+#
+def invoice_date_predicate(start_date, end_date):
+    return date_range_predicate("invoice_date", "發票日期", constant.COL_INVOICE_DATE, constant.DATE_FORMAT_INVOICE,
+                                start_date - INVOICE_DATE_MARGIN, end_date + INVOICE_DATE_MARGIN)
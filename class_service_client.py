@@ -0,0 +1,84 @@
+#
+# File: class_service_client.py
+# Brief: Client of the local reconciliation service of class_reconcile_service.py, for the GUI and
+#        scripts to submit match jobs and fetch their results
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 requests carry the token of the service
+#
+# Note:
+#   1. Only the standard library is used, so that the client adds no dependency to the GUI
+#   2. Errors of the service, HTTP 4xx, are raised as ServiceError with the message of the service;
+#      a service which can not be reached raises OSError(urllib.error.URLError)
+#   3. The token of the service is read from constant.SERVICE_TOKEN_FILE per request, so that a
+#      restarted service, with a new token, is followed; without the file, requests are refused
+#
+import json
+import os
+import urllib.error
+import urllib.request
+import constant
+
+REQUEST_TIMEOUT_SECONDS = 5
+AVAILABLE_TIMEOUT_SECONDS = 0.5
+
+
+class ServiceError(Exception):
+    # Exception ServiceError is raised when the service rejects a request
+    #
+    pass
+
+
+class ServiceClient:
+    def __init__(self, url=constant.SERVICE_URL, token_file=constant.SERVICE_TOKEN_FILE):
+        self.url = url.rstrip("/")
+        self.token_file = os.path.expanduser(token_file)
+
+    #
+    # available() returns True if the service answers within AVAILABLE_TIMEOUT_SECONDS
+    #
+    def available(self):
+        try:
+            self._request("GET", "/status", timeout=AVAILABLE_TIMEOUT_SECONDS)
+            return True
+        except (OSError, ServiceError, ValueError):
+            return False
+
+    def status(self):
+        return self._request("GET", "/status")
+
+    #
+    # submit() submits a match job, see class_reconcile_service.JOB_FIELDS, returns the job
+    #
+    def submit(self, job):
+        return self._request("POST", "/jobs", job)
+
+    def job(self, job_id):
+        return self._request("GET", "/jobs/%s" % job_id)
+
+    def cancel(self, job_id):
+        return self._request("DELETE", "/jobs/%s" % job_id)
+
+    def _request(self, method, path, body=None, timeout=REQUEST_TIMEOUT_SECONDS):
+        data = None if body is None else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json; charset=utf-8",
+                                                  constant.SERVICE_TOKEN_HEADER: self._token()})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode("utf-8")).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise ServiceError(message)
+
+    def _token(self):
+        try:
+            with open(self.token_file, encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ""
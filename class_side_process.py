@@ -0,0 +1,109 @@
+#
+# File: class_side_process.py
+# Brief: One worker process running a stage of the reconciliation alongside the main process, e.g.
+#        reading the invoice details while the general ledger is filtered
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+# Note:
+#   1. Reading and writing the Excel files is pure Python work of xlrd, openpyxl, xlwt and
+#      xlsxwriter, which threads can not run at the same time, hence a process rather than a thread
+#   2. Stages are submitted by name, and their results are waited for by name, so that the stage
+#      submitted early, e.g. read_invoice_details, is picked up where it used to run. The wall time
+#      and CPU time of the stage in the worker process are recorded in the metrics of the run
+#   3. Starting a process is not free, spawn on Windows imports the modules again, so the worker is
+#      only started if it is worth it, see worth_a_side_process(). Otherwise submitted stages run
+#      right away in the main process, one after the other as they used to
+#   4. Waiting for a stage checks the cancel event of the run, see class_metrics.RunMetrics; a stage
+#      already running in the worker is not interrupted, the worker process exits once it is done
+#
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+import os
+import time
+import constant
+import utility
+
+# seconds between checks of the cancel event while waiting for a stage
+WAIT_POLL_SECONDS = 0.2
+
+
+class SideProcess:
+    # Class SideProcess keeps the worker process, if enabled, and the futures of the submitted
+    # stages keyed by stage name. It is a context manager, the worker process is shut down on exit
+    #
+    def __init__(self, enabled=True):
+        if enabled:
+            self.executor = ProcessPoolExecutor(max_workers=1, initializer=utility.worker_logging,
+                                                initargs=utility.worker_logging_args())
+        else:
+            self.executor = None
+        self.futures = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(wait=exc_type is None)
+        return False
+
+    #
+    # submit() runs function(*args) as the named stage, in the worker process if enabled
+    #
+    def submit(self, stage, function, *args):
+        if self.executor is not None:
+            future = self.executor.submit(_timed, function, *args)
+        else:
+            future = Future()
+            try:
+                future.set_result(_timed(function, *args))
+            except Exception as e:
+                future.set_exception(e)
+        self.futures[stage] = future
+
+    def submitted(self, stage):
+        return stage in self.futures
+
+    #
+    # result() waits for the named stage, records its time in metrics(class_metrics.RunMetrics) and
+    # returns its result, or raises the exception of the stage
+    #
+    def result(self, stage, metrics, rows=None):
+        future = self.futures.pop(stage)
+        while True:
+            metrics.check_cancelled()
+            try:
+                result, wall_seconds, cpu_seconds = future.result(timeout=WAIT_POLL_SECONDS)
+                break
+            except TimeoutError:
+                continue
+        metrics.record_stage(stage, wall_seconds, cpu_seconds, rows)
+        return result
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=True)
+            self.executor = None
+
+
+#
+# Run function(*args), returns its result along with the wall time and CPU time it took
+#
+def _timed(function, *args):
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = function(*args)
+    return result, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+
+#
+# A worker process is worth starting if there is a spare processor, and the invoice details file is
+# large enough for its reading to outlast the start of the process
+#
+def worth_a_side_process(invoice_excel):
+    try:
+        invoice_bytes = os.path.getsize(invoice_excel)
+    except OSError:
+        return False
+    return (os.cpu_count() or 1) > 1 and invoice_bytes >= constant.SIDE_PROCESS_MIN_INVOICE_BYTES
@@ -1,13 +1,20 @@
 #
 # Widget set
 #
-from datetime import datetime
 import constant
+import class_buyer_resolver
 import logging
-import pdb
+import utility
 
 
 class Transaction:
+    # Transaction is a compact record of an invoice or a general ledger entry. Its invoice date is
+    # parsed once at construction, with the memoized utility.parse_date(), and kept along with its
+    # ordinal; the date of an unparsable string is left None and invoice_date_object() raises
+    # ValueError as it used to
+    __slots__ = ("invoice_number", "buyer_name", "invoice_date", "invoice_amount_NT", "invoice_amount_US",
+                 "function_currency", "exchange_rate", "source", "date_object", "date_ordinal", "_buyer_key")
+
     def __init__(self, invoice_number, buyer_name, invoice_date, invoice_amount_nt,
                  invoice_amount_us, function_currency, exchange_rate,
                  transaction_data_source):
@@ -25,29 +32,36 @@ class Transaction:
             self.invoice_amount_US = invoice_amount_us
 
         self.source = transaction_data_source
+        try:
+            self.date_object = utility.parse_date(invoice_date, self.date_format())
+            self.date_ordinal = self.date_object.toordinal()
+        except (ValueError, TypeError):
+            self.date_object = None
+            self.date_ordinal = None
+        self._buyer_key = None
 
+    #
+    # display_transaction() logs the transaction in detail, at debug level, i.e. with
+    # constant.LOG_VERBOSITY_DETAIL
+    #
     def display_transaction(self):
-        logging.info("\t發票號碼: %s", self.invoice_number)
-        logging.info("\t買方名稱: %s", self.buyer_name)
-        if self.source == constant.DATA_SOURCE_INVOICE_DETAIL:
-            date_object = datetime.strptime(self.invoice_date, "%Y/%m/%d")
-        else:
-            date_object = datetime.strptime(self.invoice_date, "%m/%d/%Y")
-        logging.info("\t發票日期: %s", date_object)
+        logging.debug("\t發票號碼: %s", self.invoice_number)
+        logging.debug("\t買方名稱: %s", self.buyer_name)
+        logging.debug("\t發票日期: %s", self.invoice_date_object())
         if self.function_currency == constant.FUNCTION_CURRENCY_USD:
             # print("交易類型: 美金交易/交易匯率@", str(self.exchange_rate))
-            logging.info("\t交易類型: 美金交易/交易匯率@ %s", str(self.exchange_rate))
+            logging.debug("\t交易類型: 美金交易/交易匯率@ %s", str(self.exchange_rate))
             # print("發票金額:", self.invoice_amount_NT, "of type:", type(self.invoice_amount_NT))
-            logging.info("\t發票金額: %s", self.invoice_amount_NT)
+            logging.debug("\t發票金額: %s", self.invoice_amount_NT)
             # print("美金/台幣匯率", self.exchange_rate)
-            logging.info("\t美金/台幣匯率: %s", self.exchange_rate)
+            logging.debug("\t美金/台幣匯率: %s", self.exchange_rate)
             # print("交易美金金額:", "%.2f" % (self.invoice_amount_NT / self.exchange_rate))
-            logging.info("\t交易美金金額: %s", "%.2f" % (self.invoice_amount_NT / self.exchange_rate))
+            logging.debug("\t交易美金金額: %s", "%.2f" % (self.invoice_amount_NT / self.exchange_rate))
         else:
             # print("交易類型: 台幣交易")
-            logging.info("\t交易類型: 台幣交易")
+            logging.debug("\t交易類型: 台幣交易")
             # print("發票金額:", self.invoice_amount_NT, "of type:", type(self.invoice_amount_NT))
-            logging.info("\t發票金額: %s", self.invoice_amount_NT)
+            logging.debug("\t發票金額: %s", self.invoice_amount_NT)
 
     #
     # match_transaction() : matches the calling transaction object to the target transaction object
@@ -56,55 +70,77 @@ class Transaction:
     #   2. difference between the amount in source transaction and the amount in target transaction is
     #      within 1% of the amount in the source transaction
     #   3. invoice date in source transaction is the same as that in the target transaction
-    # Note: Due to a mistake made during creating the customer profile, buyer name of 志邦精密有限公司 in
-    #       general ledger was 至邦精密有限公司. This needs a hack to resolve the conflict
+    # Note: buyer's names are compared after normalization and aliasing, see class_buyer_resolver.py
     #
     def match_transaction(self, target_transaction):
-        buyer_in_source = self.buyer_name[0:4]
-        # buyer name hack
-        if buyer_in_source == "志邦精密":
-            buyer_in_source = "至邦精密"
-        buyer_in_target = target_transaction.buyer_name
+        if class_buyer_resolver.normalize_buyer_text(target_transaction.buyer_name).find(self.buyer_key()) < 0:
+            return False
+        if self.function_currency == constant.FUNCTION_CURRENCY_NTD and \
+                type(target_transaction.invoice_amount_NT) is str:
+            logging.debug("發票金額非數值: 發票號碼 %s, 金額 %r", target_transaction.invoice_number,
+                          target_transaction.invoice_amount_NT)
+            return False
+        target_date_ordinal = target_transaction.date_ordinal
+        if target_date_ordinal is None:
+            target_date_ordinal = target_transaction.invoice_date_object().toordinal()
+        # the buyer is checked above, only the amount and the date are left
+        return self.match_amount_and_date(target_date_ordinal,
+                                          target_transaction.invoice_amount_NT,
+                                          target_transaction.invoice_amount_US)
+
+    #
+    # match_ledger_values() : the same match criteria as match_transaction(), applied to the
+    # pre-parsed values of a general ledger record, i.e. buyer text, ordinal of the invoice date,
+    # NTD amount and USD amount. This saves building a target Transaction object per comparison
+    #
+    def match_ledger_values(self, buyer_in_target, target_date_ordinal, target_amount_nt, target_amount_us):
         # match buyer name
-        if buyer_in_target.find(buyer_in_source) < 0:
+        if class_buyer_resolver.normalize_buyer_text(buyer_in_target).find(self.buyer_key()) < 0:
             return False
-        # match transaction amount
-        source_invoice_date = self.invoice_date_object()
-        target_invoice_date = target_transaction.invoice_date_object()
-        # added for debug purpose - 2021/4/3
-        # if self.invoice_number == "MQ80532569":
-        #     pdb.set_trace()
+        return self.match_amount_and_date(target_date_ordinal, target_amount_nt, target_amount_us)
 
+    #
+    # match_amount_and_date() : criteria 2 and 3 of match_transaction() only, for a general ledger
+    # record of which the buyer text is already resolved to include the buyer key, see
+    # class_buyer_resolver.BuyerIndex
+    #
+    def match_amount_and_date(self, target_date_ordinal, target_amount_nt, target_amount_us):
+        # match transaction amount
+        source_date_ordinal = self.date_ordinal
+        if source_date_ordinal is None:
+            source_date_ordinal = self.invoice_date_object().toordinal()
         if self.function_currency == constant.FUNCTION_CURRENCY_NTD:
-            # function_currency_in_source = self.function_currency
             amount_in_source = self.invoice_amount_NT
-            amount_diff_threshold = amount_in_source * constant.AMOUNT_DIFF_THRESHOLD_RATIO
-            if type(target_transaction.invoice_amount_NT) is str:
-                print("[Bug]target_transaction.invoice_amount_NT is of type", type(target_transaction.invoice_amount_NT))
-                print("[Bug]target_transaction.invoice_amount_NT:", target_transaction.invoice_amount_NT)
-                print("[Bug]target_transaction.invoice_number:", target_transaction.invoice_number)
-                amount_diff = amount_diff_threshold + 1
-            else:
-                amount_diff = target_transaction.invoice_amount_NT - amount_in_source
-            if abs(amount_diff) > amount_diff_threshold:
-                return False
-            if abs((source_invoice_date-target_invoice_date).days) > 1:
-                return False
-            return True
+            amount_diff = target_amount_nt - amount_in_source
         else:
             # FUNCTION_CURRENCY_USD
             amount_in_source = self.invoice_amount_US
-            amount_diff_threshold = amount_in_source * constant.AMOUNT_DIFF_THRESHOLD_RATIO
-            amount_diff = target_transaction.invoice_amount_US - amount_in_source
-            if abs(amount_diff) > amount_diff_threshold:
-                return False
-            if abs((source_invoice_date-target_invoice_date).days) > 1:
-                return False
-            return True
+            amount_diff = target_amount_us - amount_in_source
+        amount_diff_threshold = amount_in_source * constant.AMOUNT_DIFF_THRESHOLD_RATIO
+        if abs(amount_diff) > amount_diff_threshold:
+            return False
+        # match invoice date
+        if abs(source_date_ordinal - target_date_ordinal) > 1:
+            return False
+        return True
 
-    def invoice_date_object(self):
+    #
+    # buyer_key() : the leading characters of the normalized buyer's name used to look up the buyer
+    # in the target transaction, with the alias table applied, see class_buyer_resolver.py
+    #
+    def buyer_key(self):
+        if self._buyer_key is None:
+            self._buyer_key = class_buyer_resolver.buyer_key(self.buyer_name)
+        return self._buyer_key
+
+    def date_format(self):
         if self.source == constant.DATA_SOURCE_INVOICE_DETAIL:
-            date_object = datetime.strptime(self.invoice_date, "%Y/%m/%d")
+            return constant.DATE_FORMAT_INVOICE
         else:
-            date_object = datetime.strptime(self.invoice_date, "%m/%d/%Y")
-        return date_object
+            return constant.DATE_FORMAT_GENERAL_LEDGER
+
+    def invoice_date_object(self):
+        if self.date_object is None:
+            # raises ValueError/TypeError of the unparsable date
+            return utility.parse_date(self.invoice_date, self.date_format())
+        return self.date_object
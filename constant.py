@@ -1,19 +1,82 @@
 # GUI controls
 ENTRY_TYPE_INVOICE_RECORD = "invoice"
 ENTRY_TYPE_GENERAL_LEDGER = "general ledger"
+# events of the running reconciliation are drained every GUI_EVENT_POLL_MS milliseconds, at most
+# GUI_EVENTS_PER_POLL events at a time so that the main loop keeps handling user input
+GUI_EVENT_POLL_MS = 100
+GUI_EVENTS_PER_POLL = 500
 
 # Hard coded file names
 EXCEL_LOOKUP_LOG_FILE = ".//log//excel_lookup.log"
 EXTERNAL_SALES_MATCHING_FILE = "External_Sales_GUI.xlsx"
+LEDGER_CACHE_DIR = ".//cache"
+# invoice details files of at least this size are read in a worker process while the general
+# ledger is filtered, see class_side_process.py
+SIDE_PROCESS_MIN_INVOICE_BYTES = 512 * 1024
+# alias table of buyer's names, relative to the directory of the program, see class_buyer_resolver.py
+BUYER_ALIAS_FILE = "config/buyer_aliases.csv"
+# local reconciliation service, see class_reconcile_service.py: address, number of general
+# ledgers, ledger snapshots and invoice details kept in memory, seconds between scans of the watch
+# folder, and number of finished jobs kept for their results
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_URL = "http://%s:%d" % (SERVICE_HOST, SERVICE_PORT)
+SERVICE_CACHE_ENTRIES = 8
+SERVICE_WATCH_POLL_SECONDS = 2.0
+SERVICE_FINISHED_JOBS = 100
+# token of the running service, written at start to a file in the home directory readable by the
+# user only, and sent by clients in the header SERVICE_TOKEN_HEADER
+SERVICE_TOKEN_FILE = "~/.excel_lookup_service_token"
+SERVICE_TOKEN_HEADER = "X-Service-Token"
+# status of the jobs of the service
+SERVICE_JOB_QUEUED = "queued"
+SERVICE_JOB_RUNNING = "running"
+SERVICE_JOB_DONE = "done"
+SERVICE_JOB_FAILED = "failed"
+SERVICE_JOB_CANCELLED = "cancelled"
+SERVICE_JOB_FINISHED = (SERVICE_JOB_DONE, SERVICE_JOB_FAILED, SERVICE_JOB_CANCELLED)
 
 # General
 LENGTH_COMPANY_NAME_CHECK = 6
+LENGTH_BUYER_NAME_KEY = 4
+# company suffixes removed from buyer's names of the invoices before keying
+BUYER_NAME_SUFFIXES = ("股份有限公司", "有限公司", "(股)公司", "公司")
+# length of the n-grams of the inverted index over the buyer texts of the general ledger
+BUYER_NGRAM_LENGTH = 2
 EXCHANGE_RATE_LEADING_CHRS = "匯率:"
 USD_AMOUNT_CHRS = "美金未稅"
 FUNCTION_CURRENCY_USD = "USD"
 FUNCTION_CURRENCY_NTD = "NTD"
 DATA_SOURCE_INVOICE_DETAIL = 0
 DATA_SOURCE_GENERAL_LEDGER = 1
+DATE_FORMAT_INVOICE = "%Y/%m/%d"
+DATE_FORMAT_GENERAL_LEDGER = "%m/%d/%Y"
+MATCHER_INDEX = "index"
+MATCHER_NUMPY = "numpy"
+# every pair checked with the match criteria as defined, the baseline of the other matchers
+MATCHER_REFERENCE = "reference"
+MATCHERS = (MATCHER_INDEX, MATCHER_NUMPY, MATCHER_REFERENCE)
+# log verbosity: warnings only, one line per matching decision, or per-transaction detail as well
+LOG_VERBOSITY_QUIET = "quiet"
+LOG_VERBOSITY_DECISION = "decision"
+LOG_VERBOSITY_DETAIL = "detail"
+LOG_VERBOSITIES = (LOG_VERBOSITY_QUIET, LOG_VERBOSITY_DECISION, LOG_VERBOSITY_DETAIL)
+# leading field of the one line log of a matching decision
+LOG_DECISION_TAG = "比對"
+# annotation of the matching results of the invoice details, see class_invoice_annotation.py:
+# sidecar .xlsx or CSV keyed by invoice number, single-column patch, or formatting preserving copy
+ANNOTATION_XLSX = "xlsx"
+ANNOTATION_CSV = "csv"
+ANNOTATION_COLUMN = "column"
+ANNOTATION_COPY = "copy"
+ANNOTATIONS = (ANNOTATION_XLSX, ANNOTATION_CSV, ANNOTATION_COLUMN, ANNOTATION_COPY)
+# assignment of the matches: every accepted pair, or one ledger record per invoice and one invoice
+# per ledger record, see class_assignment.py
+ASSIGNMENT_ALL = "all"
+ASSIGNMENT_ONE_TO_ONE = "one-to-one"
+ASSIGNMENTS = (ASSIGNMENT_ALL, ASSIGNMENT_ONE_TO_ONE)
+# ambiguous clusters of no more invoices and ledger records than this are assigned optimally
+ASSIGNMENT_OPTIMAL_MAX = 20
 #
 # Invoice related constants
 # Input invoice file is of .xls format, and is loaded using xlrd package, in which the way to access
@@ -60,4 +123,8 @@ COL_ES_TEXT = COL_GL_TEXT + COL_GL_ES_OFFSET
 
 
 TARGET_ACCOUNT_IN_GL = "Accounts Receivable"
+# default general ledger filter: voucher types kept, and patterns the account description of a kept
+# row includes any of, see class_row_filter.py
+GL_VOUCHER_TYPES = ("F",)
+GL_ACCOUNT_PATTERNS = (TARGET_ACCOUNT_IN_GL,)
 AMOUNT_DIFF_THRESHOLD_RATIO = 0.01
@@ -10,6 +10,21 @@
 #               - added opening match Excel file
 #   2. 2021/4/6: v. 1.1a
 #               - added threading to pipeline processing stages
+#   3. 2026/10/18: v. 1.2a
+#               - run general ledger pre-process and invoice matching as one in-memory pipeline
+#               - cache the parsed general ledger in constant.LEDGER_CACHE_DIR
+#               - show throttled progress of the running stage
+#               - log every run to constant.EXCEL_LOOKUP_LOG_FILE through the background log writer
+#               - log and progress of the reconciliation thread are queued and drained by the main
+#                 loop with after(), one progress bar per stage, and a cancel button
+#               - view the match log a window of lines at a time, with search, filter of matched or
+#                 unmatched decisions and jump to the end
+#               - matching results of invoice details saved as a sidecar .xlsx, or in a copy of the
+#                 invoice file if 註記於發票檔 is checked
+#               - one-to-one assignment of invoices and ledger records if 一對一配對 is checked
+#               - matching engine selected in 比對引擎
+#               - jobs submitted to the local reconciliation service if 送交對帳服務 is checked and
+#                 the service is running, see xlsrw_service.py
 #
 # ToDo's :
 #       1) allow user to specify match results Excel file name
@@ -25,10 +40,29 @@ from datetime import datetime, date
 import os
 import time
 from os import path
+import logging
+import queue
 import threading
 import subprocess
+from bisect import bisect_left
 import constant
 import xlsrw_oop
+import class_ledger_cache
+import class_log_index
+import class_matching_engine
+import class_metrics
+import class_service_client
+import utility
+
+# events queued by the reconciliation thread for the main loop, see OperationPanel._drain_events()
+EVENT_LOG = "log"
+EVENT_PROGRESS = "progress"
+EVENT_FINISHED = "finished"
+# lines shown by the log viewer
+LOG_VIEW_ALL = "全部"
+LOG_VIEW_MATCHED = "已配對"
+LOG_VIEW_UNMATCHED = "未配對"
+LOG_VIEWS = (LOG_VIEW_ALL, LOG_VIEW_MATCHED, LOG_VIEW_UNMATCHED)
 
 
 # SelectorPanel class creates the upper half of the GUI, which includes
@@ -110,6 +144,32 @@ class SelectorPanel(ttk.Frame):
         self.cal_end.pack(side=LEFT, padx=5)
         frame.pack(side=TOP, padx='1c', pady=3)
 
+        # matching results are saved as a sidecar .xlsx next to the invoice file, unless annotating
+        # a formatting preserving copy of the invoice file is checked
+        frame = ttk.Frame(self)
+        self.annotate_copy_chk = IntVar()
+        annotate_copy_btn = Checkbutton(frame, text="註記於發票檔(保留格式，較耗記憶體)", variable=self.annotate_copy_chk,
+                                        onvalue=1, offvalue=0, anchor="w")
+        annotate_copy_btn.pack(side=LEFT)
+        # one ledger record per invoice and one invoice per ledger record, see class_assignment.py
+        self.one_to_one_chk = IntVar()
+        one_to_one_btn = Checkbutton(frame, text="一對一配對", variable=self.one_to_one_chk,
+                                     onvalue=1, offvalue=0, anchor="w")
+        one_to_one_btn.pack(side=LEFT, padx=10)
+        # matching engine, see class_matching_engine.py
+        lbl_matcher = ttk.Label(frame, text="比對引擎", anchor="e")
+        lbl_matcher.pack(side=LEFT, padx=5)
+        self.matcher_var = StringVar(value=constant.MATCHER_INDEX)
+        matcher_box = ttk.Combobox(frame, textvariable=self.matcher_var,
+                                   values=class_matching_engine.available_engines(), state="readonly", width=10)
+        matcher_box.pack(side=LEFT)
+        # submit to the local reconciliation service, which keeps the parsed files in memory
+        self.service_chk = IntVar()
+        service_btn = Checkbutton(frame, text="送交對帳服務", variable=self.service_chk,
+                                  onvalue=1, offvalue=0, anchor="w")
+        service_btn.pack(side=LEFT, padx=10)
+        frame.pack(side=TOP, padx='1c', pady=3, fill=X)
+
     # This is the file selector handler
     def _file_dialog(self, entry, file_type):
         fn = None
@@ -149,11 +209,14 @@ class OperationPanel(ttk.Frame):
         imh = ImageTk.PhotoImage(im)
         # matchBtn = ttk.Button(text='比對銷貨紀錄', image=imh, default=ACTIVE,
         #                       command=self.match_invoice)
-        matchBtn = ttk.Button(text='比對銷貨紀錄', image=imh, default=ACTIVE,
-                              command=self.match_invoice_threading)
-        matchBtn.image = imh
+        self.matchBtn = ttk.Button(text='比對銷貨紀錄', image=imh, default=ACTIVE,
+                                   command=self.match_invoice_threading)
+        self.matchBtn.image = imh
         # configure button style
-        matchBtn['compound'] = LEFT
+        self.matchBtn['compound'] = LEFT
+
+        # 'Cancel Matching' button, enabled while a reconciliation is running
+        self.cancelBtn = ttk.Button(text='取消比對', state=DISABLED, command=self.cancel_matching)
 
         # 'View Matching Log' button
         im = Image.open('.//images//view.png')
@@ -176,7 +239,7 @@ class OperationPanel(ttk.Frame):
         im = Image.open('.//images//exit.png')  # image file
         imh = ImageTk.PhotoImage(im)  # handle to file
         dismissBtn = ttk.Button(text='離開', image=imh,
-                                command=self.winfo_toplevel().destroy)
+                                command=self.exit_application)
         # dismissBtn = ttk.Button(text='離開', image=imh, command=self.exit_button)
         dismissBtn.image = imh  # prevent image from being garbage collected
         dismissBtn['compound'] = LEFT  # display image to left of label text
@@ -197,15 +260,23 @@ class OperationPanel(ttk.Frame):
         self.log_text.pack(side=RIGHT, expand=1, fill=BOTH)
         y_scrollbar.config(command=self.log_text.yview)
 
+        # Progress frame, one row of stage name, determinate progress bar and rows done per stage of
+        # the running reconciliation, added as the stages start
+        self.progress_frame = ttk.Frame(self)
+        self.progress_frame.columnconfigure(1, weight=1)
+        self.stage_bars = {}
+
         # place and register widgets as children of this frame
         sep.grid(in_=self, row=0, columnspan=5, sticky=EW, pady=10)
         log_label.grid(in_=self, row=1, columnspan=5, sticky=N, pady=5)
         # self.log_text.grid(in_=self, row=2, columnspan=5, sticky=EW, padx=10, pady=5)
         log_frame.grid(in_=self, row=2, columnspan=5, sticky=EW, padx=10, pady=5)
-        matchBtn.grid(in_=self, row=3, column=0, sticky=E, padx=5, pady=10)
-        viewLogBtn.grid(in_=self, row=3, column=1, sticky=E, padx=5, pady=10)
-        openExcelBtn.grid(in_=self, row=3, column=2, sticky=E, padx=5, pady=10)
-        dismissBtn.grid(in_=self, row=3, column=3, sticky=E, padx=5, pady=10)
+        self.progress_frame.grid(in_=self, row=4, columnspan=5, sticky=EW, padx=10, pady=5)
+        self.matchBtn.grid(in_=self, row=3, column=0, sticky=E, padx=5, pady=10)
+        self.cancelBtn.grid(in_=self, row=3, column=1, sticky=E, padx=5, pady=10)
+        viewLogBtn.grid(in_=self, row=3, column=2, sticky=E, padx=5, pady=10)
+        openExcelBtn.grid(in_=self, row=3, column=3, sticky=E, padx=5, pady=10)
+        dismissBtn.grid(in_=self, row=3, column=4, sticky=E, padx=5, pady=10)
 
         # set resize constraints
         self.rowconfigure(0, weight=1)
@@ -215,12 +286,21 @@ class OperationPanel(ttk.Frame):
         # <'Escape'> activates 'Dismiss' button
         self.winfo_toplevel().bind('<Return>', lambda x: viewLogBtn.invoke())
         self.winfo_toplevel().bind('<Escape>', lambda x: dismissBtn.invoke())
+        self.winfo_toplevel().protocol("WM_DELETE_WINDOW", self.exit_application)
 
         # thread handling relevant attributes
         self.gl_prep_done_ev = threading.Event()
         self.im_done_ev = threading.Event()
         self.gl_prep_done_ev.clear()
         self.im_done_ev.clear()
+        # The reconciliation thread never touches the widgets, its log and progress are queued as
+        # events and drained by the main loop at a fixed rate
+        self.events = queue.SimpleQueue()
+        self.worker = None
+        self.cancel_ev = threading.Event()
+        self.exit_requested = False
+        self.log_viewer = None
+        self.after(constant.GUI_EVENT_POLL_MS, self._drain_events)
 
     # The button event handler when users click "檢視比對紀錄" button
     def examine_match_log(self):
@@ -228,12 +308,12 @@ class OperationPanel(ttk.Frame):
         if not(path.exists(log_record_fn)):
             self.print_log("比對紀錄檔案尚未產生...")
             return
-        file_log_record = open(log_record_fn, 'r')
-        lines = file_log_record.readlines()
         self.print_log("顯示比對紀錄...")
-        for line in lines:
-            self.print_text(line)
-        self.see_text_end()
+        if self.log_viewer is not None and self.log_viewer.winfo_exists():
+            self.log_viewer.lift()
+            self.log_viewer.jump_to_end()
+            return
+        self.log_viewer = LogViewer(self.winfo_toplevel(), log_record_fn)
 
     # The button event handler when users click "開啟比對結果" button
     def open_match_results(self, target_excel):
@@ -250,6 +330,9 @@ class OperationPanel(ttk.Frame):
 
     # The button event handler when users click "比對銷貨紀錄" button
     def match_invoice_threading(self):
+        if self.worker is not None:
+            self.print_log("比對進行中，請等待完成或取消比對")
+            return False
         external_sales_fn = constant.EXTERNAL_SALES_MATCHING_FILE
         # sanity check of selected invoice records and general ledger
         inv_record_fn = self.master.sel_pnl.invoice_ent.get()
@@ -285,41 +368,363 @@ class OperationPanel(ttk.Frame):
             cal_end_date_obj = ""
 
         self.print_log("執行發票、總帳匹配.....")
-        self.print_log("1. 進行總帳前處理")
-        t1 = threading.Thread(target=xlsrw_oop.preproc_general_ledger_with_date,
-                              name="Gl_preprocessor",
-                              args=(self.master.sel_pnl.gl_ent.get(),
-                                    constant.EXTERNAL_SALES_MATCHING_FILE,
-                                    cal_start_date_obj,
-                                    cal_end_date_obj,
-                                    self))
-        t2 = threading.Thread(target=xlsrw_oop.match_invoice_and_external_sales,
-                              name="Invoice_matching_processor",
-                              args=(self.master.sel_pnl.invoice_ent.get(),
-                                    constant.EXTERNAL_SALES_MATCHING_FILE,
-                                    self))
-        tlogging = threading.Thread(target=self.pipeline_thread,
-                                    name="pipeliner",
-                                    args=(t2,))
-        tlogging.start()
-        t1.start()
+        os.makedirs(path.dirname(constant.EXCEL_LOOKUP_LOG_FILE), exist_ok=True)
+        utility.initialization(constant.EXCEL_LOOKUP_LOG_FILE)
+        self._clear_stage_bars()
+        # a new cancel event per run, so that a cancelled run never affects the next one
+        self.cancel_ev = threading.Event()
+        if self.master.sel_pnl.annotate_copy_chk.get() == 1:
+            annotation_mode = constant.ANNOTATION_COPY
+        else:
+            annotation_mode = constant.ANNOTATION_XLSX
+        if self.master.sel_pnl.one_to_one_chk.get() == 1:
+            assignment = constant.ASSIGNMENT_ONE_TO_ONE
+        else:
+            assignment = constant.ASSIGNMENT_ALL
+        if self.master.sel_pnl.service_chk.get() == 1:
+            client = class_service_client.ServiceClient()
+            if client.available():
+                job = {"invoice": path.abspath(inv_record_fn),
+                       "ledger": path.abspath(gl_record_fn),
+                       # saved in the folder of the invoice details, see class_reconcile_service.py
+                       "output": path.basename(external_sales_fn),
+                       "begin": cal_start_date_obj.strftime("%Y%m%d") if cal_start_date_obj != "" else "",
+                       "end": cal_end_date_obj.strftime("%Y%m%d") if cal_end_date_obj != "" else "",
+                       "matcher": self.master.sel_pnl.matcher_var.get(),
+                       "annotation_mode": annotation_mode,
+                       "assignment": assignment}
+                self.worker = threading.Thread(target=self._reconcile_with_service,
+                                               name="Reconciliation_service_client", args=(client, job))
+                self.matchBtn.config(state=DISABLED)
+                self.cancelBtn.config(state=NORMAL)
+                self.worker.start()
+                return True
+            self.print_log("對帳服務未啟動，改於本機執行")
+        # general ledger pre-process and invoice matching run as one in-memory pipeline, so that
+        # the external sales Excel file is written only once, after matching is done
+        self.worker = threading.Thread(target=self._reconcile,
+                                       name="Reconciliation_pipeline",
+                                       args=(self.master.sel_pnl.invoice_ent.get(),
+                                             self.master.sel_pnl.gl_ent.get(),
+                                             constant.EXTERNAL_SALES_MATCHING_FILE,
+                                             cal_start_date_obj,
+                                             cal_end_date_obj,
+                                             self,
+                                             self.master.sel_pnl.matcher_var.get(),
+                                             1,
+                                             class_ledger_cache.LedgerCache(constant.LEDGER_CACHE_DIR),
+                                             None,
+                                             None,
+                                             annotation_mode,
+                                             assignment,
+                                             class_metrics.RunMetrics(self.show_progress,
+                                                                      cancel_event=self.cancel_ev)))
+        self.matchBtn.config(state=DISABLED)
+        self.cancelBtn.config(state=NORMAL)
+        self.worker.start()
         return True
 
-    def pipeline_thread(self, t2):
-        while not self.gl_prep_done_ev.isSet():
-            self.gl_prep_done_ev.wait()
-            self.print_log("2. 進行原始發票資料檔比對")
-            t2.start()
+    # Body of the reconciliation thread, the outcome is queued as the last event of the run
+    def _reconcile(self, *args):
+        try:
+            xlsrw_oop.reconcile_invoice_and_general_ledger(*args)
+            self.events.put((EVENT_FINISHED, "發票、總帳匹配完成"))
+        except class_metrics.RunCancelled:
+            logging.warning("比對已取消")
+            self.events.put((EVENT_FINISHED, "比對已取消"))
+        except Exception as e:
+            logging.exception("比對失敗")
+            self.events.put((EVENT_FINISHED, "比對失敗: %s" % e))
+
+    # Body of the thread following a job submitted to the reconciliation service; its progress is
+    # queued as the progress of a local run, and cancelling cancels the job in the service
+    def _reconcile_with_service(self, client, job):
+        try:
+            submitted = client.submit(job)
+            job_id = submitted["id"]
+            self.print_log("已送交對帳服務，工作編號 %s，結果儲存於 %s" % (job_id, submitted["request"]["output"]))
+            cancel_sent = False
+            while True:
+                time.sleep(constant.GUI_EVENT_POLL_MS / 1000)
+                if self.cancel_ev.is_set() and not cancel_sent:
+                    client.cancel(job_id)
+                    cancel_sent = True
+                record = client.job(job_id)
+                if record["progress"] is not None:
+                    self.show_progress(record["progress"]["stage"], record["progress"]["done"],
+                                       record["progress"]["total"])
+                if record["status"] in constant.SERVICE_JOB_FINISHED:
+                    break
+            if record["status"] == constant.SERVICE_JOB_DONE:
+                self.events.put((EVENT_FINISHED, "發票、總帳匹配完成，對帳服務執行 %.1f 秒" % record["seconds"]))
+            elif record["status"] == constant.SERVICE_JOB_CANCELLED:
+                self.events.put((EVENT_FINISHED, "比對已取消"))
+            else:
+                self.events.put((EVENT_FINISHED, "比對失敗: %s" % record["error"]))
+        except (OSError, class_service_client.ServiceError) as e:
+            logging.exception("對帳服務無法使用")
+            self.events.put((EVENT_FINISHED, "對帳服務無法使用: %s" % e))
 
+    # The button event handler when users click "取消比對" button. The running stage stops at its
+    # next row, see class_metrics.RunMetrics.check_cancelled()
+    def cancel_matching(self):
+        if self.worker is None:
+            return
+        self.cancel_ev.set()
+        self.cancelBtn.config(state=DISABLED)
+        self.print_log("取消比對中...")
+
+    # The button event handler when users click "離開" button, or close the window. A running
+    # reconciliation is cancelled first, and the window is closed once it stops
+    def exit_application(self):
+        if self.worker is None:
+            self.winfo_toplevel().destroy()
+            return
+        self.exit_requested = True
+        self.cancel_matching()
+
+    # print_log() may be called from the reconciliation thread, in which case the message is queued
+    # for the main loop instead of being inserted into the log widget directly
     def print_log(self, log_msg):
         now = datetime.now()
         time_stamp = now.strftime("[%Y/%m/%d %H:%M:%S] >> ")
+        if threading.current_thread() is not threading.main_thread():
+            self.events.put((EVENT_LOG, time_stamp + log_msg + "\n"))
+            return
         self.log_text.insert(END, time_stamp + log_msg + "\n")
         self.log_text.see(END)
 
+    # progress listener of class_metrics.RunMetrics, called from the reconciliation thread
+    def show_progress(self, stage, done, total):
+        self.events.put((EVENT_PROGRESS, stage, done, total))
+
+    # Drain the queued events of the reconciliation thread, and schedule the next drain. Only the
+    # latest progress of each stage is shown
+    def _drain_events(self):
+        latest_progress = {}
+        finished_msg = None
+        for _ in range(constant.GUI_EVENTS_PER_POLL):
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == EVENT_LOG:
+                self.log_text.insert(END, event[1])
+                self.log_text.see(END)
+            elif event[0] == EVENT_PROGRESS:
+                latest_progress[event[1]] = event[2:]
+            elif event[0] == EVENT_FINISHED:
+                finished_msg = event[1]
+        for stage, (done, total) in latest_progress.items():
+            self._show_stage_bar(stage, done, total)
+        if finished_msg is not None:
+            self._finish_reconciliation(finished_msg)
+            if self.exit_requested:
+                self.winfo_toplevel().destroy()
+                return
+        self.after(constant.GUI_EVENT_POLL_MS, self._drain_events)
+
+    def _finish_reconciliation(self, msg):
+        self.worker.join()
+        self.worker = None
+        self.print_log(msg)
+        self.matchBtn.config(state=NORMAL)
+        self.cancelBtn.config(state=DISABLED)
+
+    # Show the progress of the stage on its own progress bar, which is added when the stage starts
+    def _show_stage_bar(self, stage, done, total):
+        if stage not in self.stage_bars:
+            row = len(self.stage_bars)
+            stage_label = ttk.Label(self.progress_frame, text=stage, width=24, anchor="w")
+            stage_bar = ttk.Progressbar(self.progress_frame, orient=HORIZONTAL, mode="determinate")
+            rows_label = ttk.Label(self.progress_frame, text="", width=24, anchor="w")
+            stage_label.grid(row=row, column=0, sticky=W)
+            stage_bar.grid(row=row, column=1, sticky=EW, padx=5, pady=2)
+            rows_label.grid(row=row, column=2, sticky=W)
+            self.stage_bars[stage] = (stage_bar, rows_label)
+        stage_bar, rows_label = self.stage_bars[stage]
+        stage_bar.config(maximum=max(total, 1), value=done if total > 0 else 1)
+        if total > 0:
+            rows_label.config(text="%d/%d (%.0f%%)" % (done, total, done / total * 100))
+
+    def _clear_stage_bars(self):
+        for child in self.progress_frame.winfo_children():
+            child.destroy()
+        self.stage_bars = {}
+
     def print_text(self, line):
         self.log_text.insert(END, line)
 
     def see_text_end(self):
         self.log_text.see(END)
 
+
+
+#
+# class LogViewer is the window of the match log, which renders only the lines in sight, read
+# through the line offset index of class_log_index.LogIndex, so that a log of hundreds of MB
+# opens at once
+#
+class LogViewer(Toplevel):
+    # LogViewer shows a view of the log, the line numbers of the log in sight order:
+    #   1. all of the lines, LOG_VIEW_ALL
+    #   2. the lines of matched, or unmatched, decisions only, LOG_VIEW_MATCHED or LOG_VIEW_UNMATCHED
+    # top: the position in the view of the first line in sight
+    # found: the position in the view of the line found by the last search, -1 if none
+    def __init__(self, master, log_file):
+        Toplevel.__init__(self, master)
+        self.title("比對紀錄 " + log_file)
+        self.log_index = class_log_index.LogIndex(log_file)
+        self.view = range(len(self.log_index))
+        self.top = 0
+        self.found = -1
+        self.rows = 30
+
+        # tool bar of search entry, previous/next buttons, view selector and jump-to-end button
+        bar = ttk.Frame(self)
+        ttk.Label(bar, text="搜尋").pack(side=LEFT)
+        self.search_var = StringVar()
+        search_ent = ttk.Entry(bar, width=30, textvariable=self.search_var)
+        search_ent.pack(side=LEFT, padx=5)
+        ttk.Button(bar, text="上一筆", command=lambda: self.search_next(backward=True)).pack(side=LEFT, padx=5)
+        ttk.Button(bar, text="下一筆", command=self.search_next).pack(side=LEFT, padx=5)
+        ttk.Label(bar, text="顯示").pack(side=LEFT, padx=5)
+        self.view_var = StringVar(value=LOG_VIEW_ALL)
+        view_box = ttk.Combobox(bar, textvariable=self.view_var, values=LOG_VIEWS, state="readonly", width=8)
+        view_box.pack(side=LEFT, padx=5)
+        ttk.Button(bar, text="跳至結尾", command=self.jump_to_end).pack(side=LEFT, padx=5)
+        bar.pack(side=TOP, fill=X, padx=5, pady=5)
+
+        # The vertical scrollbar scrolls the view rather than the text widget, which holds the lines
+        # in sight only
+        text_frame = ttk.Frame(self)
+        self.y_scrollbar = Scrollbar(text_frame, orient=VERTICAL, command=self._on_scroll)
+        self.y_scrollbar.pack(side=RIGHT, fill=Y)
+        x_scrollbar = Scrollbar(text_frame, orient=HORIZONTAL)
+        x_scrollbar.pack(side=BOTTOM, fill=X)
+        self.text = Text(text_frame, wrap=NONE, width=120, height=self.rows, xscrollcommand=x_scrollbar.set)
+        self.text.pack(side=LEFT, expand=1, fill=BOTH)
+        x_scrollbar.config(command=self.text.xview)
+        self.text.tag_config("found", background="yellow")
+        text_frame.pack(side=TOP, expand=1, fill=BOTH, padx=5)
+        self.status_label = ttk.Label(self, text="", anchor="w")
+        self.status_label.pack(side=TOP, fill=X, padx=5, pady=5)
+
+        # incremental search as the search text changes, <Return> for the next line found
+        self.search_var.trace_add("write", lambda *args: self.search_incremental())
+        search_ent.bind("<Return>", lambda e: self.search_next())
+        view_box.bind("<<ComboboxSelected>>", lambda e: self.change_view())
+        self.text.bind("<MouseWheel>", self._on_wheel)
+        self.text.bind("<Button-4>", self._on_wheel)
+        self.text.bind("<Button-5>", self._on_wheel)
+        self.text.bind("<Prior>", lambda e: self.scroll_to(self.top - self.rows))
+        self.text.bind("<Next>", lambda e: self.scroll_to(self.top + self.rows))
+        self.text.bind("<Configure>", self._on_resize)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        search_ent.focus()
+        self.render()
+
+    # Render the lines in sight, and the scrollbar and status of the view
+    def render(self):
+        line_numbers = self.view[self.top:self.top + self.rows]
+        if isinstance(self.view, range):
+            lines = self.log_index.lines(line_numbers[0], len(line_numbers)) if len(line_numbers) > 0 else []
+        else:
+            lines = [self.log_index.line(line_no) for line_no in line_numbers]
+        self.text.config(state=NORMAL)
+        self.text.delete("1.0", END)
+        self.text.insert(END, "\n".join(lines))
+        if self.top <= self.found < self.top + len(lines):
+            found_row = self.found - self.top + 1
+            self.text.tag_add("found", "%d.0" % found_row, "%d.end" % found_row)
+        self.text.config(state=DISABLED)
+        if len(self.view) > 0:
+            self.y_scrollbar.set(self.top / len(self.view), (self.top + len(lines)) / len(self.view))
+            self.status_label.config(text="%s: 第 %d - %d 筆，共 %d 筆" % (self.view_var.get(), self.top + 1,
+                                                                         self.top + len(lines), len(self.view)))
+        else:
+            self.y_scrollbar.set(0, 1)
+            self.status_label.config(text="%s: 無紀錄" % self.view_var.get())
+
+    def scroll_to(self, top):
+        self.top = min(max(top, 0), max(len(self.view) - self.rows, 0))
+        self.render()
+        return "break"
+
+    def _on_scroll(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * len(self.view)))
+        elif args[0] == "scroll":
+            step = int(args[1]) * (self.rows if args[2] == "pages" else 1)
+            self.scroll_to(self.top + step)
+
+    # wheel events carry delta on Windows and macOS, and come as buttons 4 and 5 on X11
+    def _on_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            return self.scroll_to(self.top - 3)
+        return self.scroll_to(self.top + 3)
+
+    # render as many lines as fit in the text widget after it is resized
+    def _on_resize(self, event):
+        linespace = font.nametofont(self.text.cget("font")).metrics("linespace")
+        rows = max(self.text.winfo_height() // linespace, 1)
+        if rows != self.rows:
+            self.rows = rows
+            self.scroll_to(self.top)
+
+    # Show the view selected, keeping the log line in sight as close to the top as possible
+    def change_view(self):
+        top_line = self.view[self.top] if len(self.view) > 0 else 0
+        self._select_view()
+        self.found = -1
+        self.scroll_to(bisect_left(self.view, top_line))
+
+    def _select_view(self):
+        if self.view_var.get() == LOG_VIEW_MATCHED:
+            self.view = self.log_index.decision_lines(class_log_index.DECISION_MATCHED)
+        elif self.view_var.get() == LOG_VIEW_UNMATCHED:
+            self.view = self.log_index.decision_lines(class_log_index.DECISION_UNMATCHED)
+        else:
+            self.view = range(len(self.log_index))
+
+    # Index the lines appended to the log since, e.g. by a running reconciliation, and show the last ones
+    def jump_to_end(self):
+        self.log_index.refresh()
+        self._select_view()
+        self.found = -1
+        self.scroll_to(len(self.view))
+
+    # search from the line found so far, or the top line, for the search text as it is typed
+    def search_incremental(self):
+        self._search(self.found if self.found >= 0 else self.top, False)
+
+    def search_next(self, backward=False):
+        start = (self.found if self.found >= 0 else self.top) + (-1 if backward else 1)
+        if 0 <= start < len(self.view):
+            self._search(start, backward)
+        else:
+            self.bell()
+
+    def _search(self, start, backward):
+        text = self.search_var.get()
+        if text == "":
+            self.found = -1
+            self.render()
+            return
+        if isinstance(self.view, range):
+            found = self.log_index.find(text, start, backward)
+        else:
+            found = self.log_index.find_in(text, self.view, start, backward)
+        if found < 0:
+            self.bell()
+            self.status_label.config(text="找不到 " + text)
+            return
+        self.found = found
+        if self.top <= found < self.top + self.rows:
+            self.render()
+        else:
+            self.scroll_to(found - self.rows // 2)
+
+    def close(self):
+        self.log_index.close()
+        self.destroy()
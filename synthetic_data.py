@@ -0,0 +1,153 @@
+#
+# File: synthetic_data.py
+# Brief: Generator of synthetic invoice details and general ledger Excel files for benchmarking
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+# Note:
+#   1. Invoice details are written in .xls, Sheet0, with the constant.COL_INVOICE_* layout:
+#      string dates, comma separated totals, USD remarks of "匯率: 29.85, 美金未稅 USD 1,234.00"
+#      and a few 作廢 invoices
+#   2. The general ledger is written in .xlsx with the constant.COL_GL_* layout. Most of the
+#      Accounts Receivable records are booked from the invoices, with the amount and the date
+#      slightly off now and then; the rest are other vouchers, other accounts and negative amounts
+#      which the pre-process filters out
+#   3. .xls holds at most 65,536 rows, hence at most XLS_MAX_DATA_ROWS invoices. The general
+#      ledger is written by xlsxwriter in constant_memory mode, so that 1M rows fit in memory
+#   4. Data is determined by the seed, files of the same sizes and seed are identical
+#
+import datetime
+import random
+import sys
+import xlsxwriter
+import xlwt
+import constant
+
+XLS_MAX_DATA_ROWS = 65535
+INVOICE_COLUMNS = 15
+GL_COLUMNS = 24
+VOID_INVOICE_RATIO = 0.03
+USD_INVOICE_RATIO = 0.2
+BOOKED_INVOICE_RATIO = 0.7
+BUYERS = ("志邦精密有限公司", "台灣積體電路製造股份有限公司", "鴻海精密工業股份有限公司", "聯發科技股份有限公司",
+          "廣達電腦股份有限公司", "華碩電腦股份有限公司", "宏碁股份有限公司", "友達光電股份有限公司",
+          "群創光電股份有限公司", "仁寶電腦工業股份有限公司", "緯創資通股份有限公司", "英業達股份有限公司",
+          "台達電子工業股份有限公司", "研華股份有限公司", "光寶科技股份有限公司", "日月光半導體製造股份有限公司")
+# buyer names as they appear in the general ledger, see the alias table config/buyer_aliases.csv
+GL_BUYERS = {"志邦精密有限公司": "至邦精密有限公司"}
+OTHER_ACCOUNTS = ("4101-000 Sales Revenue", "2171-000 Output VAT", "1113-000 Cash in Bank")
+FIRST_DATE = datetime.date(2021, 1, 1)
+DAYS = 90
+
+
+#
+# Write number_of_invoices invoices to invoice_excel, returns the invoices as tuples of
+# (buyer, date, NTD total, exchange rate) for booking them into the general ledger
+#
+def write_invoice_details(invoice_excel, number_of_invoices, seed=1):
+    if number_of_invoices > XLS_MAX_DATA_ROWS:
+        raise ValueError(".xls holds at most %d invoices" % XLS_MAX_DATA_ROWS)
+    rnd = random.Random(seed)
+    wb = xlwt.Workbook(encoding="utf-8")
+    ws = wb.add_sheet("Sheet0")
+    header = ["發票號碼", "備註", "格式", "發票狀態", "發票日期", "買方統編", "買方名稱", "地址", "品名", "數量",
+              "銷售額", "稅額", "總計", "課稅別", "發票配對"]
+    for c, title in enumerate(header):
+        ws.write(0, c, title)
+    invoices = []
+    for js in range(1, number_of_invoices + 1):
+        buyer = rnd.choice(BUYERS)
+        invoice_date = FIRST_DATE + datetime.timedelta(days=rnd.randrange(DAYS))
+        sales = rnd.randrange(1000, 2000000)
+        vat = round(sales * 0.05)
+        total = sales + vat
+        if rnd.random() < USD_INVOICE_RATIO:
+            exchange_rate = round(rnd.uniform(27.5, 31.5), 2)
+            remark = "%s %.2f, %s USD %s" % (constant.EXCHANGE_RATE_LEADING_CHRS, exchange_rate,
+                                             constant.USD_AMOUNT_CHRS, "{:,.2f}".format(sales / exchange_rate))
+        else:
+            exchange_rate = 1.0
+            remark = ""
+        status = "作廢" if rnd.random() < VOID_INVOICE_RATIO else "開立"
+        ws.write(js, constant.COL_INVOICE_NO, "%s%08d" % (rnd.choice(("MQ", "MR", "NX")), js))
+        ws.write(js, constant.COL_INVOICE_REMARK, remark)
+        ws.write(js, 2, "35")
+        ws.write(js, constant.COL_INVOICE_STATUS, status)
+        ws.write(js, constant.COL_INVOICE_DATE, invoice_date.strftime(constant.DATE_FORMAT_INVOICE))
+        ws.write(js, 5, "%08d" % rnd.randrange(10 ** 8))
+        ws.write(js, constant.COL_INVOICE_BUYER, buyer)
+        ws.write(js, constant.COL_INVOICE_SALES, "{:,}".format(sales))
+        ws.write(js, constant.COL_INVOICE_VAT, "{:,}".format(vat))
+        ws.write(js, constant.COL_INVOICE_TOTAL, "{:,}".format(total))
+        if status != "作廢":
+            invoices.append((buyer, invoice_date, total, exchange_rate))
+    wb.save(invoice_excel)
+    return invoices
+
+
+#
+# Write number_of_rows rows of general ledger to gl_excel, about BOOKED_INVOICE_RATIO of the
+# Accounts Receivable records are booked from the invoices
+#
+def write_general_ledger(gl_excel, number_of_rows, invoices, seed=1):
+    rnd = random.Random(seed + 1)
+    wb = xlsxwriter.Workbook(gl_excel, {"constant_memory": True})
+    ws = wb.add_worksheet("Sheet1")
+    header = ["Voucher Type", "Voucher No", "Invoice No", "Voucher Row", "Voucher Date", "Year", "Period",
+              "Code Part", "Cost Center", "Project", "Account", "Account Description", "Corporate Function",
+              "Code H", "Currency Code", "Currency Rate", "Debit Amount", "Credit Amount", "Amount",
+              "Quantity", "Party Type", "Party", "Text", "Reference"]
+    ws.write_row(0, 0, header)
+    row = [""] * GL_COLUMNS
+    for jt in range(1, number_of_rows + 1):
+        is_receivable = rnd.random() < 0.5
+        if is_receivable and len(invoices) > 0 and rnd.random() < BOOKED_INVOICE_RATIO:
+            buyer, voucher_date, amount, exchange_rate = rnd.choice(invoices)
+            voucher_date += datetime.timedelta(days=rnd.choice((0, 0, 0, 0, 1, -1, 2)))
+            amount *= rnd.choice((1, 1, 1, 1.004, 0.997, 1.03))
+        else:
+            buyer = rnd.choice(BUYERS)
+            voucher_date = FIRST_DATE + datetime.timedelta(days=rnd.randrange(DAYS))
+            amount = rnd.randrange(1000, 2000000)
+            exchange_rate = round(rnd.uniform(27.5, 31.5), 2) if rnd.random() < USD_INVOICE_RATIO else 1.0
+            if is_receivable and rnd.random() < 0.1:
+                # Accounts Receivable received
+                amount = -amount
+        amount = round(amount)
+        row[constant.COL_GL_VOUCHER_TYPE] = "F" if rnd.random() < 0.9 else rnd.choice(("M", "U", "W"))
+        row[1] = jt
+        row[constant.COL_GL_INVOICE_NO] = "GL%08d" % jt
+        row[3] = rnd.randrange(1, 9)
+        row[constant.COL_GL_INVOICE_DATE] = voucher_date.strftime(constant.DATE_FORMAT_GENERAL_LEDGER)
+        row[5] = voucher_date.year
+        row[6] = voucher_date.month
+        if is_receivable:
+            row[constant.COL_GL_ACCOUNT_DESCRIPTION] = "1191-000 %s" % constant.TARGET_ACCOUNT_IN_GL
+        else:
+            row[constant.COL_GL_ACCOUNT_DESCRIPTION] = rnd.choice(OTHER_ACCOUNTS)
+        row[constant.COL_GL_INVOICE_CURRENCY] = constant.FUNCTION_CURRENCY_USD if exchange_rate > 1.0 else "TWD"
+        row[constant.COL_GL_EXCHANGE_RATE] = exchange_rate
+        row[constant.COL_GL_DEBIT_AMT] = amount if amount > 0 else 0
+        row[constant.COL_GL_CREDIT_AMT] = -amount if amount < 0 else 0
+        row[constant.COL_GL_AMOUNT] = amount
+        row[constant.COL_GL_TEXT] = "%s %s 銷貨 %s" % (rnd.randrange(100000), GL_BUYERS.get(buyer, buyer),
+                                                      voucher_date.strftime("%Y%m"))
+        ws.write_row(jt, 0, row)
+    wb.close()
+
+
+#
+# Write a pair of invoice details and general ledger files
+#
+def generate(invoice_excel, number_of_invoices, gl_excel, number_of_gl_rows, seed=1):
+    invoices = write_invoice_details(invoice_excel, number_of_invoices, seed)
+    write_general_ledger(gl_excel, number_of_gl_rows, invoices, seed)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 5:
+        print("Syntax: ", sys.argv[0], " <invoice .xls> <number of invoices> <general ledger .xlsx> <number of rows>")
+        sys.exit()
+    generate(sys.argv[1], int(sys.argv[2]), sys.argv[3], int(sys.argv[4]))
@@ -0,0 +1,107 @@
+#
+# File: test_class_assignment.py
+# Brief: Tests of the one-to-one assignment of class_assignment.py
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+from datetime import date
+import itertools
+import random
+import class_assignment
+import class_ledger
+import class_metrics
+import class_transaction
+import constant
+
+INVOICE_DATE = "2021/03/15"
+
+
+def brute_force_cost(cost):
+    n = len(cost)
+    return min(sum(cost[r][c] for r, c in enumerate(columns)) for columns in itertools.permutations(range(n)))
+
+
+def make_ledger(amounts):
+    ledger = class_ledger.LedgerSnapshot()
+    for k, amount in enumerate(amounts):
+        ledger.append_record(k + 2, "AB%08d" % k, "Buyer Co.", date(2021, 3, 15).toordinal(), round(amount * 100),
+                             1.0, 0.0)
+    return ledger
+
+
+def make_invoices(amounts):
+    return [class_transaction.Transaction("CD%08d" % k, "Buyer Co.", INVOICE_DATE, amount, 0.0,
+                                          constant.FUNCTION_CURRENCY_NTD, 1.0, constant.DATA_SOURCE_INVOICE_DETAIL)
+            for k, amount in enumerate(amounts)]
+
+
+def test_hungarian_is_optimal():
+    generator = random.Random(7)
+    for n in range(1, 6):
+        for _ in range(20):
+            cost = [[generator.randint(0, 9) for _ in range(n)] for _ in range(n)]
+            columns = class_assignment.hungarian(cost)
+            assert sorted(columns) == list(range(n))
+            assert sum(cost[r][c] for r, c in enumerate(columns)) == brute_force_cost(cost)
+
+
+def test_hungarian_small_matrix():
+    cost = [[4, 1, 3],
+            [2, 0, 5],
+            [3, 2, 2]]
+    assert class_assignment.hungarian(cost) == [1, 0, 2]
+
+
+def test_hungarian_empty_matrix():
+    assert class_assignment.hungarian([]) == []
+
+
+def test_optimal_keeps_most_pairs():
+    # greedy takes the best pair, invoice 0 with record 0, and leaves invoice 1 without a record
+    ledger = make_ledger([1000, 1001])
+    invoices = make_invoices([1000, 1002])
+    match_results = [[0, 1], [0]]
+    metrics = class_metrics.RunMetrics()
+    results, clusters = class_assignment.assign_one_to_one(ledger, invoices, match_results, metrics)
+    assert results == [[1], [0]]
+    assert len(clusters) == 1 and clusters[0].solver == class_assignment.SOLVER_OPTIMAL
+    assert metrics.counters["pairs_dropped"] == 1
+
+
+def test_greedy_above_optimal_max(monkeypatch):
+    monkeypatch.setattr(constant, "ASSIGNMENT_OPTIMAL_MAX", 1)
+    ledger = make_ledger([1000, 1001])
+    invoices = make_invoices([1000, 1002])
+    results, clusters = class_assignment.assign_one_to_one(ledger, invoices, [[0, 1], [0]])
+    assert results == [[0], []]
+    assert clusters[0].solver == class_assignment.SOLVER_GREEDY
+
+
+def test_rectangular_cluster():
+    # two invoices and three records, one record is left unassigned
+    ledger = make_ledger([1000, 1003, 1008])
+    invoices = make_invoices([1005, 1003])
+    results, clusters = class_assignment.assign_one_to_one(ledger, invoices, [[0, 1, 2], [1]])
+    assert results == [[2], [1]]
+    assert clusters[0].positions == [0, 1, 2]
+    assert sorted(clusters[0].assigned) == [0, 1]
+
+
+def test_unambiguous_pairs_are_kept():
+    ledger = make_ledger([1000, 2000])
+    invoices = make_invoices([1000, 2000])
+    results, clusters = class_assignment.assign_one_to_one(ledger, invoices, [[0], [1]])
+    assert results == [[0], [1]]
+    assert clusters == []
+
+
+def test_no_candidates():
+    ledger = make_ledger([1000])
+    invoices = make_invoices([5000, 6000])
+    metrics = class_metrics.RunMetrics()
+    results, clusters = class_assignment.assign_one_to_one(ledger, invoices, [[], []], metrics)
+    assert results == [[], []]
+    assert clusters == []
+    assert metrics.counters["pairs_dropped"] == 0
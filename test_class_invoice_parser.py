@@ -0,0 +1,61 @@
+#
+# File: test_class_invoice_parser.py
+# Brief: Tests of the invoice details parsing of class_invoice_parser.py with a bad invoice date
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+import csv
+import xlrd
+import xlwt
+import class_invoice_parser
+import class_ledger
+import constant
+import synthetic_data
+import xlsrw_oop
+
+BAD_DATE = "2021/13/45"
+
+
+def test_bad_date_is_a_parse_error():
+    parsed = class_invoice_parser.parse_invoice_columns(["開立", "開立", "作廢"], ["", "", ""],
+                                                        ["1,000", "2,000", "3,000"],
+                                                        ["2021/03/15", BAD_DATE, BAD_DATE])
+    assert list(parsed.valid) == [1, 0, 1]
+    assert parsed.errors == [(1, class_invoice_parser.FIELD_DATE, BAD_DATE, "發票日期無法辨識")]
+    assert parsed.number_of_void == 1
+
+
+def write_with_bad_date(invoice_excel, bad_invoice_excel, row):
+    sheet = xlrd.open_workbook(invoice_excel).sheet_by_name("Sheet0")
+    workbook = xlwt.Workbook()
+    bad_sheet = workbook.add_sheet("Sheet0")
+    for r in range(sheet.nrows):
+        for c, value in enumerate(sheet.row_values(r)):
+            bad_sheet.write(r, c, BAD_DATE if (r, c) == (row, constant.COL_INVOICE_DATE) else value)
+    invoice_number = sheet.cell_value(row, constant.COL_INVOICE_NO)
+    workbook.save(bad_invoice_excel)
+    return invoice_number
+
+
+def test_bad_date_is_reported_and_not_matched(tmp_path):
+    invoice_excel = str(tmp_path / "good.xls")
+    gl_excel = str(tmp_path / "ledger.xlsx")
+    bad_invoice_excel = str(tmp_path / "invoice.xls")
+    synthetic_data.generate(invoice_excel, 100, gl_excel, 200, seed=5)
+    sheet = xlrd.open_workbook(invoice_excel).sheet_by_name("Sheet0")
+    row = next(r for r in range(1, sheet.nrows)
+               if sheet.cell_value(r, constant.COL_INVOICE_STATUS) != class_invoice_parser.VOID_STATUS)
+    invoice_number = write_with_bad_date(invoice_excel, bad_invoice_excel, row)
+    header, gl_rows = xlsrw_oop.filter_general_ledger(gl_excel, "", "", None)
+    ledger = class_ledger.load_general_ledger_rows(gl_rows)
+
+    invoice_annotations, annotations, summary = xlsrw_oop.match_invoice_records(bad_invoice_excel, ledger)
+    assert summary["invalid"] == 1
+    assert summary["void"] == sheet.col_values(constant.COL_INVOICE_STATUS, 1).count(class_invoice_parser.VOID_STATUS)
+    assert summary["invoices"] == summary["void"] + summary["invalid"] + summary["out_of_range"] + \
+        summary["matched"] + summary["unmatched"]
+    with open(class_invoice_parser.parse_error_file(bad_invoice_excel), encoding="utf-8-sig") as f:
+        errors = list(csv.reader(f))[1:]
+    assert errors == [[str(row + 1), invoice_number, class_invoice_parser.FIELD_DATE, BAD_DATE, "發票日期無法辨識"]]
@@ -0,0 +1,90 @@
+#
+# File: test_class_ledger_store.py
+# Brief: Tests of the SQLite ledger store of class_ledger_store.py
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+from datetime import datetime
+import sqlite3
+import pytest
+import class_ledger_store
+import constant
+
+HEADER = tuple("column %d" % c for c in range(24))
+
+
+def gl_row(voucher_date, buyer_text, amount):
+    row = [None] * 24
+    row[constant.COL_GL_VOUCHER_TYPE] = "F"
+    row[constant.COL_GL_INVOICE_DATE] = voucher_date
+    row[constant.COL_GL_TEXT] = buyer_text
+    row[constant.COL_GL_AMOUNT] = amount
+    row[constant.COL_GL_ACCOUNT_DESCRIPTION] = "1191-000 Accounts Receivable"
+    return tuple(row)
+
+
+ROWS = [gl_row("03/01/2021", "12 群創光電 銷貨", 1000),
+        gl_row("03/15/2021", "34 ＡＢＣ Trading 銷貨", 2500.5),
+        gl_row("04/02/2021", "56 群創光電 銷貨", 1010),
+        gl_row("04/02/2021", "56 群創光電 銷貨", 1010)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    ledger_store = class_ledger_store.LedgerStore(str(tmp_path / "ledger.db"))
+    yield ledger_store
+    ledger_store.close()
+
+
+def test_rows_round_trip(store):
+    rows = ROWS + [gl_row("04/03/2021", "78 群創光電", 3000)[:-1] + (datetime(2021, 4, 3, 8, 30),)]
+    assert store.append(HEADER, rows, "key") == len(rows)
+    header, stored_rows = store.query("", "", "key")
+    assert header == HEADER
+    assert stored_rows == rows
+
+
+def test_overlapping_exports_are_not_duplicated(store):
+    store.append(HEADER, ROWS[:3], "key")
+    assert store.append(HEADER, ROWS, "key") == 1
+    assert len(store) == 4
+
+
+def test_rows_of_another_filter_are_kept_apart(store):
+    store.append(HEADER, ROWS[:2], "key")
+    store.append(HEADER, ROWS[1:], "other")
+    assert store.query("", "", "key")[1] == ROWS[:2]
+    assert store.query("", "", "other")[1] == ROWS[1:]
+    assert store.filter_keys() == {"key": 2, "other": 3}
+
+
+def test_query_by_date_buyer_and_amount(store):
+    store.append(HEADER, ROWS, "key")
+    assert store.query(datetime(2021, 3, 1), datetime(2021, 3, 31), "key")[1] == ROWS[:2]
+    assert store.query("", "", "key", buyer_key="群創")[1] == [ROWS[0], ROWS[2], ROWS[3]]
+    # buyer texts are normalized, full-width letters folded and case folded
+    assert store.query("", "", "key", buyer_key="abct")[1] == [ROWS[1]]
+    assert store.query("", "", "key", buyer_key="群創", amount_range=(1005, 1015))[1] == ROWS[2:]
+    assert store.query(datetime(2021, 3, 1), datetime(2021, 3, 31), "key", amount_range=(2500, 2501))[1] == [ROWS[1]]
+
+
+def test_queries_use_the_indexes(store):
+    store.append(HEADER, ROWS, "key")
+    for condition, index in (("voucher_date BETWEEN 1 AND 2", "ix_ledger_rows_voucher_date"),
+                             ("amount_cents BETWEEN 1 AND 2", "ix_ledger_rows_amount"),
+                             ("buyer_id IN (SELECT id FROM ledger_buyers WHERE instr(buyer_text, 'x') > 0)",
+                              "ix_ledger_rows_buyer")):
+        plan = store.connection.execute("EXPLAIN QUERY PLAN SELECT row_values FROM ledger_rows "
+                                        "WHERE filter_key = 'key' AND %s" % condition).fetchall()
+        assert any(index in step[-1] for step in plan)
+
+
+def test_store_of_an_older_version_is_refused(tmp_path):
+    db_file = str(tmp_path / "old.db")
+    connection = sqlite3.connect(db_file)
+    connection.execute("CREATE TABLE ledger_rows (id INTEGER PRIMARY KEY, row_values BLOB NOT NULL)")
+    connection.close()
+    with pytest.raises(ValueError):
+        class_ledger_store.LedgerStore(db_file)
@@ -0,0 +1,41 @@
+#
+# File: test_xlsrw_batch.py
+# Brief: Tests of the job directory of the batch reconciliation, xlsrw_batch.py
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+import os
+import constant
+import synthetic_data
+import xlsrw_batch
+
+
+def make_job_dir(job_dir):
+    folder = job_dir / "entity_a"
+    folder.mkdir()
+    synthetic_data.generate(str(folder / "invoice.xls"), 200, str(folder / "ledger.xlsx"), 400, seed=3)
+    return folder
+
+
+def test_job_dir_runs_twice(tmp_path):
+    folder = make_job_dir(tmp_path)
+    for run in range(2):
+        jobs = xlsrw_batch.scan_job_dir(str(tmp_path))
+        assert [(os.path.basename(job["invoice"]), os.path.basename(job["ledger"])) for job in jobs] == \
+            [("invoice.xls", "ledger.xlsx")]
+        summary = xlsrw_batch.run_batch(jobs, 1, constant.MATCHER_INDEX)
+        assert summary[0]["status"] == "ok"
+        assert summary[0]["matched"] > 0
+    assert (folder / xlsrw_batch.EXTERNAL_SALES_FILE).exists()
+    assert (folder / "invoice_matches.xlsx").exists()
+
+
+def test_output_files_are_not_inputs():
+    assert xlsrw_batch.is_output_file("External_Sales.xlsx")
+    assert xlsrw_batch.is_output_file("external_sales_GUI.xlsx")
+    assert xlsrw_batch.is_output_file("invoice_matches.xlsx")
+    assert xlsrw_batch.is_output_file("~$ledger.xlsx")
+    assert not xlsrw_batch.is_output_file("ledger.xlsx")
+    assert not xlsrw_batch.is_output_file("invoice.xls")
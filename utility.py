@@ -7,14 +7,130 @@
 # Date: 2020/10/4
 #
 import xlrd
+import atexit
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import multiprocessing.util
+import queue
+from datetime import datetime
+from functools import lru_cache
 import constant
 
+LOG_LEVELS = {constant.LOG_VERBOSITY_QUIET: logging.WARNING,
+              constant.LOG_VERBOSITY_DECISION: logging.INFO,
+              constant.LOG_VERBOSITY_DETAIL: logging.DEBUG}
+_log_listener = None
+# listener of the records of worker processes, started on first use, see worker_log_queue()
+_worker_log_listener = None
+_finalizer_registered = False
+
+
+#
+# Log records are put on a queue by the logging threads and written to log_file by the background
+# thread of a QueueListener, so that the matching never waits for formatting and file I/O.
+# verbosity, one of constant.LOG_VERBOSITIES, sets the root log level:
+#   1. quiet: warnings only
+#   2. decision: plus one line per matching decision, the default
+#   3. detail: plus the per-transaction detail of every decision, for audits
+# Calling it again, e.g. per GUI run, replaces the previous log file
+#
+def initialization(log_file="./log/excel_lookup.log", verbosity=constant.LOG_VERBOSITY_DECISION):
+    global _log_listener, _finalizer_registered
+    shutdown_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+    # set mode='w' to simply output log of the current run
+    file_handler = logging.FileHandler(log_file, mode='w')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s:%(message)s',
+                                                datefmt='%Y/%m/%d %I:%M:%S %p'))
+    log_queue = queue.SimpleQueue()
+    root.addHandler(_InProcessQueueHandler(log_queue))
+    root.setLevel(LOG_LEVELS[verbosity])
+    _log_listener = QueueListener(log_queue, file_handler)
+    _log_listener.start()
+    # flush the queue at exit, through multiprocessing's finalizers as well as atexit; registered
+    # once, since the GUI calls initialization() per run
+    if not _finalizer_registered:
+        multiprocessing.util.Finalize(None, shutdown_logging, exitpriority=0)
+        _finalizer_registered = True
+
+
+#
+# Stop the background log writers, after the records in the queues are written
+#
+def shutdown_logging():
+    global _log_listener, _worker_log_listener
+    if _worker_log_listener is not None:
+        _worker_log_listener.stop()
+        _worker_log_listener = None
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+#
+# Worker processes do not write the log file themselves: a forked worker inherits the queue
+# handler of the parent but not its listener thread, so its records would be lost. The parent
+# passes worker_logging_args() to the initializer of its process pool, worker_logging(), which
+# puts the records of the worker on a multiprocessing queue served by a listener of the parent,
+# writing to the log file of initialization()
+#
+def worker_log_queue():
+    global _worker_log_listener
+    if _log_listener is None:
+        return None
+    if _worker_log_listener is None:
+        _worker_log_listener = QueueListener(multiprocessing.Queue(), *_log_listener.handlers)
+        _worker_log_listener.start()
+    return _worker_log_listener.queue
+
+
+def worker_logging_args():
+    return worker_log_queue(), logging.getLogger().level
+
+
+#
+# Initializer of worker processes, replaces the handlers of the root logger with one feeding
+# log_queue; without log_queue, i.e. the parent does not log to a file, records are dropped
+#
+def worker_logging(log_queue, level):
+    global _log_listener, _worker_log_listener
+    # listeners inherited from a forked parent are not running in this process
+    _log_listener = None
+    _worker_log_listener = None
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    if log_queue is not None:
+        root.addHandler(QueueHandler(log_queue))
+    else:
+        root.addHandler(logging.NullHandler())
+    root.setLevel(level)
+
+
+class _InProcessQueueHandler(QueueHandler):
+    # The queue is consumed in this process, so records are queued as they are and formatted by the
+    # listener thread, instead of being formatted by QueueHandler.prepare() in the logging thread
+    #
+    def prepare(self, record):
+        return record
+
+
+#
+# Memoized datetime.strptime() for the two known date formats, constant.DATE_FORMAT_INVOICE and
+# constant.DATE_FORMAT_GENERAL_LEDGER. Invoices of a month share a few dozen dates only
+#
+@lru_cache(maxsize=4096)
+def parse_date(date_str, date_format):
+    return datetime.strptime(date_str, date_format)
 
-def initialization():
-    # set filemode='w' to simply output log of the current run
-    logging.basicConfig(filename="./log/excel_lookup.log", filemode='w', format='%(asctime)s %(levelname)s:%(message)s',
-                        datefmt='%Y/%m/%d %I:%M:%S %p', level=logging.INFO)
 
 #
 # convert comma separated currency annotation to its floating number
@@ -34,8 +150,14 @@ def comma_separated_amount_to_float(amt_str):
 # lead with "匯率"
 #
 def find_currency_exchange_rate(sourceRow):
+    return exchange_rate_of_remark(sourceRow[constant.COL_INVOICE_REMARK].value)
+
+
+#
+# Value-based version of find_currency_exchange_rate(), applied to the remark of an invoice
+#
+def exchange_rate_of_remark(remark):
     ex_rate = 1.0
-    remark = sourceRow[constant.COL_INVOICE_REMARK].value
     idxEx = remark.find(constant.EXCHANGE_RATE_LEADING_CHRS)
     idxUsdAmt = remark.find(constant.USD_AMOUNT_CHRS)
     # it is an transaction of USD if both exchange_rate and USD sales amount found
@@ -49,7 +171,13 @@ def find_currency_exchange_rate(sourceRow):
 # Claim it is a USD transaction if "註記欄" includes both "匯率" and "美金未稅"
 #
 def is_source_a_usd_transaction(source_row):
-    remark = source_row[constant.COL_INVOICE_REMARK].value
+    return is_usd_remark(source_row[constant.COL_INVOICE_REMARK].value)
+
+
+#
+# Value-based version of is_source_a_usd_transaction(), applied to the remark of an invoice
+#
+def is_usd_remark(remark):
     idx_ex = remark.find(constant.EXCHANGE_RATE_LEADING_CHRS)
     idx_usd_amt = remark.find(constant.USD_AMOUNT_CHRS)
     if idx_ex >= 0 and idx_usd_amt >= 0:
@@ -64,6 +192,10 @@ def is_source_a_usd_transaction(source_row):
 def is_target_a_usd_transaction(targetRow):
     # pdb.set_trace()
     currency_exchange_rate = targetRow[constant.COL_ES_EXCHANGE_RATE].value
+    return is_usd_exchange_rate(currency_exchange_rate)
+
+
+def is_usd_exchange_rate(currency_exchange_rate):
     ex_rate = float(currency_exchange_rate)
     if ex_rate > 1.0:
         return True
@@ -79,22 +211,28 @@ def is_target_a_usd_transaction(targetRow):
 #   ToDo's : needs to implement specified accounting period; CLI done, GUI's date validation yet
 #
 def is_target_account_receivable(targetRow):
-    targetCell = targetRow[constant.COL_ES_ACCOUNT_DESCRIPTION]
-    account = targetCell.value
+    account = targetRow[constant.COL_ES_ACCOUNT_DESCRIPTION].value
+    amount = targetRow[constant.COL_ES_AMOUNT].value
+    return is_account_receivable(account, amount)
+
+
+#
+# Value-based version of is_target_account_receivable(), applied to the account description and
+# the amount read from a general ledger record
+#
+def is_account_receivable(account, amount):
     idxAccount = account.find(constant.TARGET_ACCOUNT_IN_GL)
     if idxAccount < 0:
         # print("Not an Account Receivable transaction")
         return False
-    targetCell = targetRow[constant.COL_ES_AMOUNT]
-    amount = targetCell.value
     #
     # IFS output empty strings or blank strings of length 1 sometimes
     # This is a hack to resolve this kind of issue
     #
-    if targetCell.value is None:
+    if amount is None:
         # print("Empty Account Receivable")
         return False
-    if type(targetCell.value) is str:
+    if type(amount) is str:
         # print("Invalid Account Receivable Amount")
         return False
     if float(amount) < 0.0:
@@ -0,0 +1,195 @@
+#
+# File: xlsrw_batch.py
+# Subject: Reconcile many invoice details/general ledger pairs, e.g. monthly pairs of several entities
+#          at quarter or year end, in one invocation
+# Brief: Entry of command line batch reconciliation
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+# Note:
+#   1. Jobs are listed in a CSV manifest with columns invoice,ledger,output[,begin,end], relative
+#      paths are relative to the manifest; or found in a job directory, in which every sub-folder
+#      holds one invoice .xls and one general ledger .xlsx, and gets its External_Sales.xlsx; the
+#      outputs of earlier runs in the sub-folder are skipped, see is_output_file()
+#   2. Each distinct general ledger is parsed only once, without date range, in a worker process;
+#      the jobs referring to it are then narrowed down to their own date ranges and run
+#      concurrently in the same bounded pool of worker processes
+#   3. Matching results of invoice details are saved with the annotation mode, as xlsrw_oop.py does
+#   4. The date range of a job applies to the invoices as well as the general ledger rows
+#   5. With a cache directory, parsed general ledgers are taken from and kept in the ledger cache,
+#      see class_ledger_cache.py
+#   6. Worker processes log to the log file of the batch, BATCH_LOG_FILE, see utility.worker_logging()
+#
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import class_invoice_annotation
+import class_ledger_cache
+import class_opts
+import constant
+import utility
+import xlsrw_oop
+
+EXTERNAL_SALES_FILE = "External_Sales.xlsx"
+# external sales files, e.g. External_Sales.xlsx or External_Sales_GUI.xlsx, are outputs, not exports
+EXTERNAL_SALES_PREFIX = "external_sales"
+BATCH_LOG_FILE = "./log/excel_lookup_batch.log"
+SUMMARY_FIELDS = ("invoice", "ledger", "output", "begin", "end", "status", "invoices", "void", "invalid",
+                  "out_of_range", "matched", "unmatched", "ledger_records", "ledger_records_matched", "seconds")
+
+
+#
+# Read jobs from the CSV manifest
+#
+def load_manifest(manifest_file):
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    jobs = []
+    with open(manifest_file, newline="", encoding="utf-8-sig") as f:
+        for record in csv.DictReader(f):
+            job = {"begin": "", "end": ""}
+            for field in ("invoice", "ledger", "output", "begin", "end"):
+                value = (record.get(field) or "").strip()
+                if field in ("invoice", "ledger", "output") and value != "":
+                    value = os.path.join(base_dir, value)
+                if value != "":
+                    job[field] = value
+            if "output" not in job and "invoice" in job:
+                job["output"] = os.path.join(os.path.dirname(job["invoice"]), EXTERNAL_SALES_FILE)
+            jobs.append(job)
+    return jobs
+
+
+#
+# Find jobs in the sub-folders of the job directory
+#
+def scan_job_dir(job_dir):
+    jobs = []
+    for entry in sorted(os.listdir(job_dir)):
+        folder = os.path.join(job_dir, entry)
+        if not os.path.isdir(folder):
+            continue
+        names = [n for n in sorted(os.listdir(folder)) if not is_output_file(n)]
+        invoices = [n for n in names if n.lower().endswith(".xls")]
+        ledgers = [n for n in names if n.lower().endswith(".xlsx")]
+        if len(invoices) != 1 or len(ledgers) != 1:
+            print("略過 %s: 需要恰好一個 .xls 發票檔與一個 .xlsx 總帳檔" % folder)
+            continue
+        jobs.append({"invoice": os.path.join(folder, invoices[0]),
+                     "ledger": os.path.join(folder, ledgers[0]),
+                     "output": os.path.join(folder, EXTERNAL_SALES_FILE),
+                     "begin": "", "end": ""})
+    return jobs
+
+
+#
+# Outputs of an earlier run in a job folder, i.e. external sales files and matching results saved
+# beside the invoice details, see class_invoice_annotation.py, as well as lock files of Excel, are
+# neither invoices nor general ledgers, so that a job directory can be run again
+#
+def is_output_file(name):
+    name = name.lower()
+    return name.startswith(("~$", EXTERNAL_SALES_PREFIX)) or \
+        name.endswith(tuple(class_invoice_annotation.ANNOTATION_FILE_SUFFIXES.values()))
+
+
+#
+# Run the jobs in a pool of worker processes, returns one summary record per job in job order
+#
+def run_batch(jobs, workers, matcher, cache_dir="", annotation_mode=constant.ANNOTATION_XLSX):
+    summary = [dict(job, status="", seconds="") for job in jobs]
+    ledger_jobs = {}
+    for k, job in enumerate(jobs):
+        if "invoice" not in job or "ledger" not in job:
+            summary[k]["status"] = "error: invoice and ledger are required"
+            continue
+        try:
+            job["date_range"] = class_opts.parse_date_range(job["begin"], job["end"])
+        except ValueError as e:
+            summary[k]["status"] = "error: %s" % e
+            continue
+        ledger_key = os.path.normcase(os.path.abspath(job["ledger"]))
+        ledger_jobs.setdefault(ledger_key, []).append(k)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=utility.worker_logging,
+                             initargs=utility.worker_logging_args()) as executor:
+        pending = {}
+        for ledger_key, job_ids in ledger_jobs.items():
+            pending[executor.submit(_parse_ledger, jobs[job_ids[0]]["ledger"], cache_dir)] = ("ledger", job_ids)
+        while pending:
+            done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, target = pending.pop(future)
+                if kind == "ledger":
+                    try:
+                        header, gl_rows = future.result()
+                    except Exception as e:
+                        for k in target:
+                            summary[k]["status"] = "error: %s" % e
+                        continue
+                    for k in target:
+                        start_date, end_date = jobs[k]["date_range"]
+                        job_rows = xlsrw_oop.filter_general_ledger_rows_by_date(gl_rows, start_date, end_date)
+                        pending[executor.submit(_run_job, jobs[k], header, job_rows, matcher,
+                                                 annotation_mode)] = ("job", k)
+                else:
+                    try:
+                        job_summary, seconds = future.result()
+                    except Exception as e:
+                        summary[target]["status"] = "error: %s" % e
+                        continue
+                    summary[target].update(job_summary or {})
+                    summary[target]["status"] = "ok" if job_summary is not None else "no ledger records"
+                    summary[target]["seconds"] = "%.2f" % seconds
+    return summary
+
+
+def write_summary(summary, summary_file):
+    with open(summary_file, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for record in summary:
+            writer.writerow(record)
+
+
+def _parse_ledger(gl_excel, cache_dir):
+    ledger_cache = class_ledger_cache.LedgerCache(cache_dir) if cache_dir != "" else None
+    return xlsrw_oop.filter_general_ledger(gl_excel, "", "", ledger_cache)
+
+
+def _run_job(job, header, gl_rows, matcher, annotation_mode):
+    start_time = time.time()
+    start_date, end_date = job["date_range"]
+    job_summary = xlsrw_oop.reconcile_general_ledger_rows(job["invoice"], header, gl_rows, job["output"], None,
+                                                          matcher, annotation_mode=annotation_mode,
+                                                          start_date=start_date, end_date=end_date)
+    return job_summary, time.time() - start_time
+
+
+#
+# main entry of batch reconciliation
+#
+def main(argv):
+    opts_args = class_opts.BatchOpts(argv)
+    os.makedirs(os.path.dirname(BATCH_LOG_FILE), exist_ok=True)
+    utility.initialization(BATCH_LOG_FILE)
+    if opts_args.manifest_file != "":
+        jobs = load_manifest(opts_args.manifest_file)
+    else:
+        jobs = scan_job_dir(opts_args.job_dir)
+    print("批次對帳: 共 %d 組發票與總帳" % len(jobs))
+    start_time = time.time()
+    summary = run_batch(jobs, opts_args.workers, opts_args.matcher, opts_args.cache_dir, opts_args.annotation_mode)
+    write_summary(summary, opts_args.summary_file)
+    number_of_ok = sum(1 for record in summary if record["status"] == "ok")
+    print("批次對帳完成: %d/%d 組成功, 耗時 %.1f 秒, 摘要儲存於 %s" %
+          (number_of_ok, len(jobs), time.time() - start_time, opts_args.summary_file))
+    utility.shutdown_logging()
+
+
+if __name__ == "__main__":
+    main(sys.argv[0:])
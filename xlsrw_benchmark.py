@@ -0,0 +1,157 @@
+#
+# File: xlsrw_benchmark.py
+# Subject: Measure how the general ledger pre-process and the invoice matching scale with the size
+#          of the input files, on synthetic data
+# Brief: Entry of the benchmark suite
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+# Note:
+#   1. For every size, a general ledger of that many rows and invoice details of a quarter of
+#      that many invoices, at most synthetic_data.XLS_MAX_DATA_ROWS, are generated once into the
+#      data directory by synthetic_data.py, and reused by later runs
+#   2. The stages are those of preproc_general_ledger_with_date() followed by
+#      match_invoice_and_external_sales(), run one by one so that each is measured on its own.
+#      Matching works on a copy of the invoice details, since results are annotated in place
+#   3. Every stage reports wall time, rows per second and, with tracemalloc, peak memory allocated
+#      by Python during the stage. tracemalloc slows the stages down, run with -x for timing only
+#   4. Results are printed, and appended to the results file as one JSON object per stage, along
+#      with the git revision, to track regressions and speedups from run to run
+#
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import class_ledger
+import class_opts
+import constant
+import synthetic_data
+import utility
+import xlsrw_oop
+
+
+class StageTimer:
+    # Class StageTimer measures the stages of one benchmark run and keeps their results
+    #
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.results = []
+
+    #
+    # run() calls function(*args) as the named stage, number_of_rows(result) gives the number of
+    # rows the stage processed. Returns the result of the function
+    #
+    def run(self, stage, number_of_rows, function, *args):
+        if self.trace_memory:
+            tracemalloc.start()
+        start_time = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start_time
+        peak_bytes = None
+        if self.trace_memory:
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        rows = number_of_rows(result)
+        self.results.append({"stage": stage,
+                             "seconds": round(seconds, 4),
+                             "rows": rows,
+                             "rows_per_second": round(rows / seconds, 1) if seconds > 0 else None,
+                             "peak_bytes": peak_bytes})
+        return result
+
+
+#
+# Generate the synthetic data of the size if it is not in the data directory yet, returns the
+# invoice details and general ledger file names
+#
+def prepare_data(data_dir, size):
+    number_of_invoices = min(max(size // 4, 1), synthetic_data.XLS_MAX_DATA_ROWS)
+    invoice_excel = os.path.join(data_dir, "invoice_%d.xls" % number_of_invoices)
+    gl_excel = os.path.join(data_dir, "general_ledger_%d.xlsx" % size)
+    if not os.path.exists(invoice_excel) or not os.path.exists(gl_excel):
+        print("產生測試資料: 發票 %d 筆, 總帳 %d 列" % (number_of_invoices, size))
+        synthetic_data.generate(invoice_excel, number_of_invoices, gl_excel, size)
+    return invoice_excel, gl_excel
+
+
+#
+# Run the stages of the two stage reconciliation on the data of one size
+#
+def benchmark_size(data_dir, size, matcher, jobs, trace_memory, annotation_mode=constant.ANNOTATION_XLSX):
+    invoice_src, gl_excel = prepare_data(data_dir, size)
+    invoice_excel = os.path.join(data_dir, "run_" + os.path.basename(invoice_src))
+    ext_sales_excel = os.path.join(data_dir, "run_external_sales_%d.xlsx" % size)
+    shutil.copyfile(invoice_src, invoice_excel)
+    timer = StageTimer(trace_memory)
+    # 1. 總帳前處理
+    header, gl_rows = timer.run("filter_general_ledger", lambda result: size,
+                                xlsrw_oop.filter_general_ledger, gl_excel, "", "")
+    timer.run("save_external_sales", lambda result: len(gl_rows),
+              xlsrw_oop.save_external_sales, header, gl_rows, {}, ext_sales_excel)
+    # 2. 原始發票資料檔比對
+    header, gl_rows, annotations = timer.run("load_external_sales", lambda result: len(result[1]),
+                                             xlsrw_oop.load_external_sales, ext_sales_excel)
+    ledger = timer.run("load_ledger_snapshot", lambda result: len(gl_rows),
+                       class_ledger.load_general_ledger_rows, gl_rows)
+    invoice_annotations, new_annotations, summary = timer.run("match_invoice_records",
+                                                              lambda result: result[2]["invoices"],
+                                                              xlsrw_oop.match_invoice_records, invoice_excel, ledger,
+                                                              matcher, jobs)
+    timer.run("save_invoice_details", lambda result: summary["invoices"], invoice_annotations.save, annotation_mode)
+    annotations.update(new_annotations)
+    timer.run("save_external_sales_results", lambda result: len(gl_rows),
+              xlsrw_oop.save_external_sales, header, gl_rows, annotations, ext_sales_excel)
+    return timer.results, summary
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def print_results(size, results, summary):
+    print("總帳 %d 列, 發票 %d 筆(作廢 %d), 應收帳款 %d 筆, 配對發票 %d 筆" %
+          (size, summary["invoices"], summary["void"], summary["ledger_records"], summary["matched"]))
+    print("\t%-28s %10s %10s %12s %10s" % ("stage", "seconds", "rows", "rows/s", "peak MB"))
+    for result in results:
+        peak = "%.1f" % (result["peak_bytes"] / 1024 / 1024) if result["peak_bytes"] is not None else "-"
+        rows_per_second = "%.0f" % result["rows_per_second"] if result["rows_per_second"] is not None else "-"
+        print("\t%-28s %10.3f %10d %12s %10s" % (result["stage"], result["seconds"], result["rows"],
+                                                 rows_per_second, peak))
+
+
+#
+# main entry of the benchmark suite
+#
+def main(argv):
+    opts_args = class_opts.BenchmarkOpts(argv)
+    os.makedirs("./log", exist_ok=True)
+    os.makedirs(opts_args.data_dir, exist_ok=True)
+    utility.initialization("./log/excel_lookup_benchmark.log")
+    run_record = {"run": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  "revision": git_revision(),
+                  "python": sys.version.split()[0],
+                  "matcher": opts_args.matcher,
+                  "jobs": opts_args.jobs,
+                  "annotation": opts_args.annotation_mode}
+    with open(opts_args.results_file, "a", encoding="utf-8") as f:
+        for size in opts_args.sizes:
+            results, summary = benchmark_size(opts_args.data_dir, size, opts_args.matcher, opts_args.jobs,
+                                              opts_args.trace_memory, opts_args.annotation_mode)
+            print_results(size, results, summary)
+            for result in results:
+                f.write(json.dumps(dict(run_record, size=size, **result), ensure_ascii=False) + "\n")
+    print("結果已附加至 %s" % opts_args.results_file)
+
+
+if __name__ == "__main__":
+    main(sys.argv[0:])
@@ -0,0 +1,144 @@
+#
+# File: xlsrw_difftest.py
+# Subject: Randomized differential test of the matching engines against the reference engine
+# Brief: Entry of the differential test, exits with status 1 on any divergence
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+# Note:
+#   1. Every round generates invoices and ledger records in memory, with the seed of the round, so
+#      that a divergent round is reproduced with -s <seed> -r 1
+#   2. Inputs are generated around the edges of the match criteria: buyer's names written in
+#      full-width characters, with spaces, suffixes or aliases in the ledger, keys shorter than
+#      the n-grams of the buyer index, amounts right at and just over the 1% allowance, USD records,
+#      invoice dates up to two days apart, and many invoices competing for the same records
+#   3. The decisions of an engine, the ledger positions each invoice matches in row order, must be
+#      identical to those of class_matching_engine.ReferenceEngine
+#
+import datetime
+import random
+import sys
+
+import class_ledger
+import class_matching_engine
+import class_opts
+import class_parallel_matcher
+import class_transaction
+import constant
+
+# buyer's names of the invoices, along with the ways they are written in the ledger texts
+BUYER_VARIANTS = (("志邦精密有限公司", ("至邦精密有限公司", "至邦精密")),
+                  ("台灣積體電路製造股份有限公司", ("台灣積體電路製造股份有限公司", "台灣積體電路製造(股)公司", "台灣 積體電路")),
+                  ("ＡＢＣ科技股份有限公司", ("ABC科技股份有限公司", "abc科技", "ＡＢＣ 科技")),
+                  ("宏碁股份有限公司", ("宏碁股份有限公司", "宏碁公司")),
+                  ("聯發科技股份有限公司", ("聯發科技股份有限公司", "聯發科技")),
+                  ("聯發工業有限公司", ("聯發工業",)),
+                  ("AB", ("AB貿易", "ab")),
+                  ("Ｑ", ("Q公司", "q")))
+# ratios of ledger amount to invoice amount, around the edges of AMOUNT_DIFF_THRESHOLD_RATIO
+AMOUNT_RATIOS = (1.0, 1.0, 1.01, 0.99, 1.0099, 0.9901, 1.0101, 0.9899, 1.02, 1.004)
+DATE_OFFSETS = (0, 0, 0, 1, -1, 2, -2)
+FIRST_DATE = datetime.date(2021, 3, 1)
+DAYS = 10
+BOOKED_RATIO = 0.7
+USD_RATIO = 0.25
+# largest number of divergent invoices printed per engine
+MAX_REPORTED = 10
+
+
+#
+# Generate the invoices and the ledger records of a round, returns the source transactions and the
+# ledger snapshot
+#
+def generate_round(seed, max_invoices, max_ledger_records):
+    rnd = random.Random(seed)
+    # a small pool of amounts, so that invoices compete for the same records
+    amounts = [rnd.choice((0, rnd.randrange(100, 100000), round(rnd.uniform(100, 100000), 2)))
+               for _ in range(rnd.randint(1, 8))]
+    invoices = []
+    source_transactions = []
+    for k in range(rnd.randint(1, max_invoices)):
+        buyer = rnd.choice(BUYER_VARIANTS)
+        invoice_date = FIRST_DATE + datetime.timedelta(days=rnd.randrange(DAYS))
+        total = rnd.choice(amounts)
+        if rnd.random() < USD_RATIO:
+            function_currency = constant.FUNCTION_CURRENCY_USD
+            exchange_rate = round(rnd.uniform(27.5, 31.5), 2)
+        else:
+            function_currency = constant.FUNCTION_CURRENCY_NTD
+            exchange_rate = 1.0
+        invoices.append((buyer, invoice_date, total, exchange_rate))
+        source_transactions.append(class_transaction.Transaction("DT%08d" % k, buyer[0],
+                                                                 invoice_date.strftime(constant.DATE_FORMAT_INVOICE),
+                                                                 total, 0.0, function_currency, exchange_rate,
+                                                                 constant.DATA_SOURCE_INVOICE_DETAIL))
+    ledger = class_ledger.LedgerSnapshot()
+    for jt in range(2, rnd.randint(0, max_ledger_records) + 2):
+        if rnd.random() < BOOKED_RATIO:
+            buyer, voucher_date, amount, exchange_rate = rnd.choice(invoices)
+            voucher_date += datetime.timedelta(days=rnd.choice(DATE_OFFSETS))
+            amount *= rnd.choice(AMOUNT_RATIOS)
+        else:
+            buyer = rnd.choice(BUYER_VARIANTS)
+            voucher_date = FIRST_DATE + datetime.timedelta(days=rnd.randrange(DAYS))
+            amount = rnd.choice(amounts)
+            exchange_rate = round(rnd.uniform(27.5, 31.5), 2) if rnd.random() < USD_RATIO else 1.0
+        buyer_text = "%d %s 銷貨" % (rnd.randrange(1000), rnd.choice(buyer[1]))
+        amount = round(amount, 2)
+        amount_us = amount / exchange_rate if exchange_rate > 1.0 else 0.0
+        ledger.append_record(jt, "GL%08d" % jt, buyer_text, voucher_date.toordinal(), round(amount * 100),
+                             exchange_rate, amount_us)
+    return source_transactions, ledger
+
+
+def run_engine(engine, ledger, source_transactions, jobs):
+    if jobs > 1:
+        return class_parallel_matcher.match_all(ledger, source_transactions, engine, jobs)
+    return class_matching_engine.matching_engine(engine).match_all(ledger, source_transactions)
+
+
+#
+# Compare the decisions of an engine with the reference decisions, prints the divergent invoices
+# and returns the number of them
+#
+def report_divergence(seed, engine, ledger, source_transactions, expected, actual):
+    divergent = [k for k in range(len(source_transactions)) if expected[k] != actual[k]]
+    for k in divergent[:MAX_REPORTED]:
+        source_transaction = source_transactions[k]
+        print("[seed %d] %s 與 reference 不一致: 發票 %s %s %s %s %s, reference 總帳列 %s, %s 總帳列 %s" %
+              (seed, engine, source_transaction.invoice_number, source_transaction.buyer_name,
+               source_transaction.invoice_date, source_transaction.function_currency,
+               source_transaction.invoice_amount_NT, [ledger.row[i] for i in expected[k]], engine,
+               [ledger.row[i] for i in actual[k]]))
+    return len(divergent)
+
+
+#
+# main entry of the differential test
+#
+def main(argv):
+    opts_args = class_opts.DiffTestOpts(argv)
+    engines = [engine for engine in opts_args.engines if engine != constant.MATCHER_REFERENCE]
+    unavailable = [engine for engine in engines if engine not in class_matching_engine.available_engines()]
+    if len(unavailable) > 0:
+        print("無法執行的比對引擎: %s" % ",".join(unavailable))
+        sys.exit(1)
+    number_of_divergent = 0
+    number_of_decisions = 0
+    for seed in range(opts_args.seed, opts_args.seed + opts_args.rounds):
+        source_transactions, ledger = generate_round(seed, opts_args.invoices, opts_args.ledger_records)
+        expected = class_matching_engine.ReferenceEngine().match_all(ledger, source_transactions)
+        number_of_decisions += len(source_transactions)
+        for engine in engines:
+            actual = run_engine(engine, ledger, source_transactions, opts_args.jobs)
+            number_of_divergent += report_divergence(seed, engine, ledger, source_transactions, expected, actual)
+    print("%d 回合, %d 筆發票, 比對引擎 %s, 不一致 %d 筆" % (opts_args.rounds, number_of_decisions,
+                                                 ",".join(engines), number_of_divergent))
+    if number_of_divergent > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[0:])
@@ -16,6 +16,23 @@
 #           - progress bar displayed when traversing the source invoice details data
 #   5. 2021/4/6: v. 1.1
 #           - support both CLI and GUI
+#   6. 2026/10/18: v. 1.2
+#           - match invoices against a candidate index of external sales instead of
+#             traversing the whole worksheet per invoice
+#           - on-disk general ledger cache, SQLite ledger store and incremental matching options
+#           - per-stage timing and counters saved as metrics JSON, throttled progress
+#           - background log writer, log verbosity and one line per matching decision
+#           - matching results of invoice details saved as a sidecar .xlsx/CSV or a single-column
+#             patch, the formatting preserving copy of the invoice details is an option
+#           - invoice details read on demand, only the columns needed for matching
+#           - one-to-one assignment mode between invoices and ledger records
+#           - matchers behind the matching engine interface, with the reference engine
+#           - invoice details read in a worker process while the general ledger is filtered, and
+#             saved there while the external sales file is written
+#           - rows of invoice details which can not be parsed are reported, not matched
+#           - configurable general ledger filter of voucher types, account patterns and date range,
+#             with the rows each predicate eliminated reported; invoices filtered by date range too
+#           - ledger snapshot of the general ledger rows may be given, see class_reconcile_service.py
 #
 # ToDo's:
 #   1) Add invoice date range; CLI done, GUI's date validation needs to be implemented
@@ -30,18 +47,24 @@
 #   is .xlsx. Pandas might be a flexible and more versatile alternative.
 #
 import sys
-from datetime import datetime
 import openpyxl
-from openpyxl.styles import Alignment
-from openpyxl.styles import Font
 import xlsxwriter
-import pdb
-import xlrd
-from xlutils.copy import copy as xlutils_copy
-import progressbar
 
 import constant
-import class_transaction
+import class_ledger
+import class_external_sales_writer
+import class_matching_engine
+import class_parallel_matcher
+import class_ledger_cache
+import class_ledger_store
+import class_match_state
+import class_metrics
+import class_invoice_annotation
+import class_invoice_details
+import class_invoice_parser
+import class_assignment
+import class_side_process
+import class_row_filter
 import utility
 import logging
 import class_opts
@@ -62,7 +85,6 @@ import class_opts
 #       - a tuple
 #
 def match_row(sourceRow, targetWs):
-    # pdb.set_trace()
     invoice_status = sourceRow[constant.COL_INVOICE_STATUS].value
     matchRow_in_targetWs = 0
     if invoice_status == "作廢":
@@ -86,71 +108,17 @@ def match_row(sourceRow, targetWs):
 # Filter general ledger file and leave Account Receivables only in external sales in the
 # target Excel file
 #
-def preproc_general_ledger_with_date(gl_excel, ext_sales_excel, start_date, end_date, GUI_caller):
+def preproc_general_ledger_with_date(gl_excel, ext_sales_excel, start_date, end_date, GUI_caller, ledger_cache=None,
+                                     ledger_store=None, metrics=None, gl_filter=None):
     if GUI_caller:
         print("preproc_general_ledger is called from GUI")
         print("\tGeneral ledger selected: " + gl_excel)
         print("\tStart date: ", start_date)
         print("\tEnd date: ", end_date)
 
-    wb_src= openpyxl.load_workbook(gl_excel, read_only=True)    # open source general ledger workbook
-    ws_name = wb_src.sheetnames[0]
-    ws_src = wb_src[ws_name]
-    wb_tgt = openpyxl.Workbook()                                # prepare target external sales Excel workbook
-    ws_tgt = wb_tgt.create_sheet("Sheet0", 0)
-    ws_tgt.sheet_format.defaultColWidth = 12
-    ws_tgt.column_dimensions["C"].width = 16
-    ws_tgt.column_dimensions["O"].width = 28
-    # This date sanity check was performed earlier before entering this function
-    if start_date != "" or end_date != "":
-        check_invoice_date = True
-    else:
-        check_invoice_date = False
-
-    header_row = True
-    bar = progressbar.ProgressBar(maxval=100, widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage()])
-    bar.start()
-    cur_row = 1
-    for r in ws_src.iter_rows(min_row=1, max_row=ws_src.max_row):
-        p = (cur_row/ws_src.max_row) * 100
-        bar.update(p)
-        if header_row:
-            header_row = False
-            ws_tgt.append(cell.value for cell in r)
-            continue
-        # only transactions with voucher type = "F" and account description includes "Accounts Receivable"
-        # are required
-        voucher_type = r[constant.COL_GL_VOUCHER_TYPE].value
-        voucher_date = r[constant.COL_GL_INVOICE_DATE].value
-        accnt_desc = r[constant.COL_GL_ACCOUNT_DESCRIPTION].value
-        idx_accnt_desc = accnt_desc.find(constant.TARGET_ACCOUNT_IN_GL)
-        if idx_accnt_desc > 0 and voucher_type == "F":
-            if check_invoice_date:
-                # compose voucher date object according to voucher_date string
-                voucher_date_obj = datetime.strptime(voucher_date, "%m/%d/%Y")
-                if (voucher_date_obj >= start_date) and (voucher_date_obj <= end_date):
-                    ws_tgt.append(cell.value for cell in r)
-            else:
-                ws_tgt.append(cell.value for cell in r)
-        cur_row = cur_row + 1
-
-    bar.finish()
-    wb_src.close()
-    num_of_col = ws_tgt.max_column
-    num_of_row = ws_tgt.max_row
-    ws_tgt.auto_filter.ref = "A1:Z1"
-    ws_tgt.insert_cols(4, 3)
-    ws_tgt.cell(row=1, column=4, value="統一發票號碼")
-    ws_tgt.cell(row=1, column=5, value="發票稅後\t台幣總金額\t(美金報價)")
-    ws_tgt.cell(row=1, column=6, value="比對")
-    ws_tgt.column_dimensions["D"].width = 20
-    ws_tgt.column_dimensions["E"].alignment = Alignment(wrapText=True)
-    for r in range(1, ws_tgt.max_row+1):
-        for c in range(1, ws_tgt.max_column+1):
-            ws_tgt.cell(row=r, column=c).font = Font(name="Calibri")
-    ws_tgt.freeze_panes = "E2"
-    wb_tgt.save(ext_sales_excel)
-    wb_tgt.close()
+    header, gl_rows = filter_general_ledger(gl_excel, start_date, end_date, ledger_cache, ledger_store, metrics,
+                                            gl_filter)
+    save_external_sales(header, gl_rows, {}, ext_sales_excel, metrics)
     # Notify GUI that general ledger pre-process is done
     if GUI_caller:
         GUI_caller.gl_prep_done_ev.set()
@@ -158,144 +126,462 @@ def preproc_general_ledger_with_date(gl_excel, ext_sales_excel, start_date, end_
     return True
 
 
+#
+# Read the general ledger and return its header row and the rows kept by the general ledger
+# filter(class_row_filter.GeneralLedgerFilter), the Account Receivables of voucher type "F" by
+# default, in the specified invoice date range, both as tuples of cell values in general ledger
+# layout. The rows eliminated by each predicate of the filter are counted in metrics.
+# With a ledger cache(class_ledger_cache.LedgerCache), rows filtered without date range are
+# taken from the cache if the general ledger is unchanged, the general ledger is parsed and
+# cached otherwise. With a ledger store(class_ledger_store.LedgerStore), the rows of the general
+# ledger, if any, are appended to the store first, and the rows in the date range are then queried
+# from all of the rows accumulated in the store under the same general ledger filter
+#
+def filter_general_ledger(gl_excel, start_date, end_date, ledger_cache=None, ledger_store=None, metrics=None,
+                          gl_filter=None):
+    if metrics is None:
+        metrics = class_metrics.RunMetrics()
+    if gl_filter is None:
+        gl_filter = class_row_filter.GeneralLedgerFilter()
+    if ledger_store is not None:
+        if gl_excel != "":
+            header, gl_rows = filter_general_ledger(gl_excel, "", "", ledger_cache, None, metrics, gl_filter)
+            with metrics.stage("ledger_store_append", len(gl_rows)):
+                number_of_new_rows = ledger_store.append(header, gl_rows, gl_filter.key())
+            metrics.count("ledger_store_rows_added", number_of_new_rows)
+            logging.info("總帳 %s 新增 %d 筆應收帳款資料至 %s" % (gl_excel, number_of_new_rows, ledger_store.db_file))
+        with metrics.stage("ledger_store_query"):
+            header, gl_rows = ledger_store.query(start_date, end_date, gl_filter.key())
+        metrics.set_rows("ledger_store_query", len(gl_rows))
+        other_rows = sum(n for key, n in ledger_store.filter_keys().items() if key != gl_filter.key())
+        if other_rows > 0:
+            logging.warning("總帳資料庫 %s 有 %d 筆以其他傳票類別或會計科目篩選的資料，不列入比對",
+                            ledger_store.db_file, other_rows)
+        return header, gl_rows
+    if ledger_cache is not None:
+        with metrics.stage("ledger_cache_load"):
+            cached = ledger_cache.load(gl_excel, gl_filter.key())
+        if cached is None:
+            header, gl_rows = filter_general_ledger(gl_excel, "", "", None, None, metrics, gl_filter)
+            with metrics.stage("ledger_cache_store", len(gl_rows)):
+                ledger_cache.store(gl_excel, header, gl_rows, gl_filter.key())
+        else:
+            header, gl_rows = cached
+            metrics.count("ledger_cache_hits")
+            metrics.set_rows("ledger_cache_load", len(gl_rows))
+        with metrics.stage("filter_by_date", len(gl_rows)):
+            return header, filter_general_ledger_rows_by_date(gl_rows, start_date, end_date, metrics)
+    with metrics.stage("filter_general_ledger"):
+        wb_src= openpyxl.load_workbook(gl_excel, read_only=True)    # open source general ledger workbook
+        ws_name = wb_src.sheetnames[0]
+        ws_src = wb_src[ws_name]
+        # This date sanity check was performed earlier before entering this function. The
+        # predicates test the voucher type, account description and voucher date columns only,
+        # cheapest first, the rows kept are kept whole for the external sales file
+        row_filter = class_row_filter.RowFilter(gl_filter.predicates(start_date, end_date))
+        accepts = row_filter.accepts
+
+        header = None
+        gl_rows = []
+        cur_row = 1
+        for r in ws_src.iter_rows(min_row=1, max_row=ws_src.max_row, values_only=True):
+            metrics.progress("filter_general_ledger", cur_row, ws_src.max_row)
+            if header is None:
+                header = r
+                continue
+            if accepts(r):
+                gl_rows.append(r)
+            cur_row = cur_row + 1
+
+        metrics.progress("filter_general_ledger", ws_src.max_row, ws_src.max_row)
+        wb_src.close()
+    metrics.set_rows("filter_general_ledger", cur_row - 1)
+    metrics.count("gl_rows_read", cur_row - 1)
+    metrics.count("gl_rows_receivable", len(gl_rows))
+    row_filter.report(metrics, "gl_rows_eliminated_", "總帳篩選 %s" % gl_excel)
+    return header, gl_rows
+
+
+#
+# Narrow down the filtered general ledger rows to the specified invoice date range, so that one
+# parse of the general ledger, filtered without date range, serves several date ranges
+#
+def filter_general_ledger_rows_by_date(gl_rows, start_date, end_date, metrics=None):
+    if start_date == "" and end_date == "":
+        return gl_rows
+    row_filter = class_row_filter.RowFilter([class_row_filter.general_ledger_date_predicate(start_date, end_date)])
+    gl_rows = row_filter.filter(gl_rows)
+    if metrics is not None:
+        row_filter.report(metrics, "gl_rows_eliminated_", "總帳日期篩選")
+    return gl_rows
+
+
+#
+# Save the filtered general ledger rows as the external sales Excel file, with the 3 columns of
+# matching results inserted in front of the 4th column. The matching results, annotations, map
+# the row number in the external sales worksheet to (unified invoice number, invoice amount)
+#
+def save_external_sales(header, gl_rows, annotations, ext_sales_excel, metrics=None):
+    if metrics is None:
+        metrics = class_metrics.RunMetrics()
+    with metrics.stage("save_external_sales", len(gl_rows)):
+        writer = class_external_sales_writer.ExternalSalesWriter(ext_sales_excel)
+        writer.write_header(header)
+        for jt, r in enumerate(gl_rows, start=2):
+            writer.write_row(r, annotations.get(jt))
+            metrics.progress("save_external_sales", jt - 1, len(gl_rows))
+        writer.close()
+
+
+#
+# Read the external sales Excel file back into the header and rows of general ledger layout,
+# along with the matching results already annotated in it
+#
+def load_external_sales(ext_sales_excel, metrics=None):
+    if metrics is None:
+        metrics = class_metrics.RunMetrics()
+    with metrics.stage("load_external_sales"):
+        ext_sales_wb = openpyxl.load_workbook(ext_sales_excel, read_only=True)
+        # 0-based index, index of worksheet #1 is 0
+        ext_sales_ws = ext_sales_wb[ext_sales_wb.sheetnames[0]]
+        header = None
+        gl_rows = []
+        annotations = {}
+        insert_at = constant.COL_ES_UNIFIED_INVOICE_NO
+        for jt, r in enumerate(ext_sales_ws.iter_rows(values_only=True), start=1):
+            metrics.progress("load_external_sales", jt, ext_sales_ws.max_row)
+            gl_row = r[:insert_at] + r[insert_at+constant.COL_GL_ES_OFFSET:]
+            if header is None:
+                header = gl_row
+                continue
+            gl_rows.append(gl_row)
+            if r[constant.COL_ES_INVOICE_MATCHED] == "配對":
+                annotations[jt] = (r[constant.COL_ES_UNIFIED_INVOICE_NO], r[constant.COL_ES_UINV_AMT])
+        ext_sales_wb.close()
+    metrics.set_rows("load_external_sales", len(gl_rows))
+    return header, gl_rows, annotations
+
+
 #
 # match invoice details(sourceWb, source workbook) to external sales
 # records(processed General ledger)
 #
-def match_invoice_and_external_sales(invoice_excel, ext_sales_excel, GUI_caller):
-    # Open source invoice details Excel file, which is of .xls format
-    sourceWb = xlrd.open_workbook(invoice_excel, formatting_info=True)
-    sheetName = "Sheet0"
-    sourceWs = sourceWb.sheet_by_name(sheetName)
-    sourceWb_temp = xlutils_copy(sourceWb)
-    sourceWs_temp = sourceWb_temp.get_sheet(0)
+def match_invoice_and_external_sales(invoice_excel, ext_sales_excel, GUI_caller, matcher=constant.MATCHER_INDEX,
+                                     jobs=1, match_state=None, annotation_mode=constant.ANNOTATION_XLSX,
+                                     assignment=constant.ASSIGNMENT_ALL, metrics=None, side_process=None,
+                                     start_date="", end_date=""):
     # check caller type
     if GUI_caller:
         print("match_invoice_and_external_sales is called from GUI")
+    if metrics is None:
+        metrics = class_metrics.RunMetrics()
 
     #
-    # openpyxl to read external sales Excel file in order to read/modify/write .xlsx files
-    # External sales Excel file was created in the stage 總帳前處理
+    # External sales Excel file was created in the stage 總帳前處理, it is read back in read-only
+    # mode and written again as a whole with the matching results
     #
-    # targetWb = openpyxl.load_workbook(ext_sales_excel)
-    ext_sales_wb = openpyxl.load_workbook(ext_sales_excel)
-    # 0-based index, index of worksheet #1 is 0
-    ext_sales_ws_name = ext_sales_wb.sheetnames[0]
-    ext_sales_ws = ext_sales_wb[ext_sales_ws_name]
+    header, gl_rows, annotations = load_external_sales(ext_sales_excel, metrics)
+    if len(gl_rows) == 0:
+        report_progress(GUI_caller, "總帳無應收帳款資料，不進行比對")
+        save_metrics(GUI_caller, metrics, ext_sales_excel)
+        return False
     #
-    # Traverse the source invoice records
-    # pdb.set_trace()
-    number_of_matched_found = 0
+    # Load the account receivable records into a columnar snapshot, which is what the matching
+    # works on
+    with metrics.stage("load_ledger_snapshot", len(gl_rows)):
+        ledger = class_ledger.load_general_ledger_rows(gl_rows)
+    invoice_annotations, new_annotations, summary = match_invoice_records(invoice_excel, ledger, matcher, jobs,
+                                                                          match_state, assignment, metrics,
+                                                                          side_process, start_date, end_date)
+    annotations.update(new_annotations)
+    save_results(GUI_caller, invoice_annotations, annotation_mode, header, gl_rows, annotations, ext_sales_excel,
+                 metrics, side_process)
+    if match_state is not None:
+        match_state.save()
+    save_metrics(GUI_caller, metrics, ext_sales_excel)
+    return True
+
+
+#
+# Pipeline mode: filter the general ledger and match the invoice details in memory, the
+# external sales Excel file is written only once after matching is done. The invoice details are
+# read in a worker process while the general ledger is filtered, if worth it, see
+# class_side_process.py. The date range applies to both the general ledger and the invoices
+#
+def reconcile_invoice_and_general_ledger(invoice_excel, gl_excel, ext_sales_excel, start_date, end_date,
+                                         GUI_caller, matcher=constant.MATCHER_INDEX, jobs=1, ledger_cache=None,
+                                         ledger_store=None, match_state=None, annotation_mode=constant.ANNOTATION_XLSX,
+                                         assignment=constant.ASSIGNMENT_ALL, metrics=None, gl_filter=None):
+    if metrics is None:
+        metrics = class_metrics.RunMetrics()
+    with class_side_process.SideProcess(class_side_process.worth_a_side_process(invoice_excel)) as side_process:
+        side_process.submit("read_invoice_details", class_invoice_details.read_invoice_details, invoice_excel)
+        report_progress(GUI_caller, "1. 進行總帳前處理")
+        header, gl_rows = filter_general_ledger(gl_excel, start_date, end_date, ledger_cache, ledger_store, metrics,
+                                                gl_filter)
+        summary = reconcile_general_ledger_rows(invoice_excel, header, gl_rows, ext_sales_excel, GUI_caller,
+                                                matcher, jobs, match_state, annotation_mode, assignment, metrics,
+                                                side_process, start_date, end_date)
+    return summary is not None
+
+
+#
+# Match the invoice details against the filtered general ledger rows and write both result files.
+# Returns the matching summary of match_invoice_records(), or None if there is no ledger row.
+# With a side process(class_side_process.SideProcess), the invoice details read in it are matched,
+# if submitted, and the results of the invoice details are saved in it. Only the invoices dated in
+# the date range, if given, are matched. The ledger snapshot of gl_rows is loaded unless given, e.g.
+# kept from a previous run by class_reconcile_service.py
+#
+def reconcile_general_ledger_rows(invoice_excel, header, gl_rows, ext_sales_excel, GUI_caller,
+                                  matcher=constant.MATCHER_INDEX, jobs=1, match_state=None,
+                                  annotation_mode=constant.ANNOTATION_XLSX, assignment=constant.ASSIGNMENT_ALL,
+                                  metrics=None, side_process=None, start_date="", end_date="", ledger=None):
+    if metrics is None:
+        metrics = class_metrics.RunMetrics()
+    if len(gl_rows) == 0:
+        save_external_sales(header, gl_rows, {}, ext_sales_excel, metrics)
+        report_progress(GUI_caller, "總帳無應收帳款資料，不進行比對")
+        save_metrics(GUI_caller, metrics, ext_sales_excel)
+        return None
+    report_progress(GUI_caller, "2. 進行原始發票資料檔比對")
+    if ledger is None:
+        with metrics.stage("load_ledger_snapshot", len(gl_rows)):
+            ledger = class_ledger.load_general_ledger_rows(gl_rows)
+    invoice_annotations, annotations, summary = match_invoice_records(invoice_excel, ledger, matcher, jobs,
+                                                                      match_state, assignment, metrics, side_process,
+                                                                      start_date, end_date)
+    save_results(GUI_caller, invoice_annotations, annotation_mode, header, gl_rows, annotations, ext_sales_excel,
+                 metrics, side_process)
+    if match_state is not None:
+        match_state.save()
+    save_metrics(GUI_caller, metrics, ext_sales_excel)
+    return summary
 
-    sourceWs_temp.write(0,constant.COL_INVOICE_CHECKED, "發票配對")
-    bar = progressbar.ProgressBar(maxval=100, widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage()])
-    bar.start()
-    for js in range(1, sourceWs.nrows):
-        p = (js/sourceWs.nrows) * 100
-        bar.update(p)
-        invoice_status = sourceWs.cell_value(js, constant.COL_INVOICE_STATUS)
-        if invoice_status == "作廢":
-            sourceWs_temp.write(js, constant.COL_INVOICE_CHECKED, "作廢")
-            continue
-        invoice_number = sourceWs.cell_value(js, constant.COL_INVOICE_NO)
-        buyer_name = sourceWs.cell_value(js, constant.COL_INVOICE_BUYER)
-        invoice_date = sourceWs.cell_value(js, constant.COL_INVOICE_DATE)
-        amount_nt_str = sourceWs.cell_value(js, constant.COL_INVOICE_TOTAL)
-        invoice_amount_nt = utility.comma_separated_amount_to_float(amount_nt_str)
-        # determine if it is a USD transaction, extract the exchange rate if
-        # it is a USD transaction
-        if utility.is_source_a_usd_transaction(sourceWs.row(js)):
-            function_currency = constant.FUNCTION_CURRENCY_USD
-            exchange_rate = utility.find_currency_exchange_rate(sourceWs.row(js))
-        else:
-            function_currency = constant.FUNCTION_CURRENCY_NTD
-            exchange_rate = 1.00
-        source = constant.DATA_SOURCE_INVOICE_DETAIL
-        source_transaction = class_transaction.Transaction(invoice_number,
-                                                          buyer_name,
-                                                          invoice_date,
-                                                          invoice_amount_nt,
-                                                          0.0,
-                                                          function_currency,
-                                                          exchange_rate,
-                                                          source)
-        # call the class method to display the object contents
-        source_transaction.display_transaction()
-        # traverse the target worksheet and identify the record correspondent to the
-        # source transaction
-        match_found = False
-
-        # for jt in range(2, targetWs.max_row+1):
-        # for debug purpose
-        # ToDo: need to check if the ext_sales_ws is empty before continuing
-        if ext_sales_ws.max_row == 1:
-            ext_sales_wb.save(ext_sales_excel)
-            sys.exit()
 
-        for jt in range(2, ext_sales_ws.max_row+1):
-            if not utility.is_target_account_receivable(ext_sales_ws[jt]):
+#
+# Match every invoice in the invoice details Excel file against the ledger snapshot. Returns
+#   1. the '發票配對' results of the invoice details(class_invoice_annotation.InvoiceAnnotations)
+#   2. the matching results keyed by row number in the external sales worksheet
+#   3. the summary of numbers of invoices, void, invalid, out of the date range, matched and
+#      unmatched invoices, and ledger records
+# which is also merged into the counters of metrics. With constant.ASSIGNMENT_ONE_TO_ONE, each
+# invoice keeps one ledger record at most and vice versa, and the ambiguous clusters are saved next
+# to the invoice details file, see class_assignment.py. The invoice details are taken from the side
+# process if they are being read there. With a date range, the invoices dated out of it are
+# marked '期間外' and not matched, as the general ledger records out of it are not there to match
+#
+def match_invoice_records(invoice_excel, ledger, matcher=constant.MATCHER_INDEX, jobs=1, match_state=None,
+                          assignment=constant.ASSIGNMENT_ALL, metrics=None, side_process=None, start_date="",
+                          end_date=""):
+    if metrics is None:
+        metrics = class_metrics.RunMetrics()
+    if side_process is not None and side_process.submitted("read_invoice_details"):
+        invoice_details = side_process.result("read_invoice_details", metrics)
+    else:
+        with metrics.stage("read_invoice_details"):
+            invoice_details = class_invoice_details.read_invoice_details(invoice_excel)
+    with metrics.stage("read_invoice_details"):
+        # Only the columns of the invoice details Excel file needed for matching are read, which is
+        # of .xls format. Formatting is read only if the results are saved as an annotated copy of
+        # it, see class_invoice_annotation.py
+        invoice_annotations = class_invoice_annotation.InvoiceAnnotations(invoice_excel, invoice_details.invoice_no)
+        #
+        # Collect the valid source invoice records
+        if start_date != "" or end_date != "":
+            in_date_range = class_row_filter.invoice_date_predicate(start_date, end_date).test
+        else:
+            in_date_range = None
+        number_of_out_of_range = 0
+        source_rows = []
+        source_transactions = []
+        for k in range(len(invoice_details)):
+            js = k + 1
+            metrics.progress("read_invoice_details", js, len(invoice_details))
+            if invoice_details.is_void(k):
+                invoice_annotations.mark(js, "作廢")
+                continue
+            if not invoice_details.is_valid(k):
+                # left unannotated, see the parse error report
                 continue
-            invoice_number = ext_sales_ws.cell(row=jt, column=constant.COL_ES_INVOICE_NO+1).value
-            buyer_name = ext_sales_ws.cell(row=jt, column=constant.COL_ES_TEXT+1).value
-            invoice_date = ext_sales_ws.cell(row=jt, column=constant.COL_ES_INVOICE_DATE+1).value
-            invoice_amount_nt = ext_sales_ws.cell(row=jt, column=constant.COL_ES_AMOUNT+1).value
-            if utility.is_target_a_usd_transaction(ext_sales_ws[jt]):
-                function_currency = constant.FUNCTION_CURRENCY_USD
-                exchange_rate = ext_sales_ws.cell(row=jt, column=constant.COL_ES_EXCHANGE_RATE+1).value
-                invoice_amount_us = invoice_amount_nt / exchange_rate
-            else:
-                function_currency = constant.FUNCTION_CURRENCY_NTD
-                exchange_rate = 1.0
-                invoice_amount_us = 0.0
-            source = constant.DATA_SOURCE_GENERAL_LEDGER
-            target_transaction = class_transaction.Transaction(invoice_number,
-                                                               buyer_name,
-                                                               invoice_date,
-                                                               invoice_amount_nt,
-                                                               invoice_amount_us,
-                                                               function_currency,
-                                                               exchange_rate,
-                                                               source)
-            if source_transaction.match_transaction(target_transaction):
-                match_found = True
-                logging.info(">>>>>>>>>>>>>> 找到匹配交易紀錄 <<<<<<<<<<<<<<<")
+            if in_date_range is not None and not in_date_range(invoice_details.invoice_date[k]):
+                invoice_annotations.mark(js, "期間外")
+                number_of_out_of_range += 1
+                continue
+            source_rows.append(js)
+            source_transactions.append(invoice_details.transaction(k))
+    metrics.set_rows("read_invoice_details", len(invoice_details))
+    if len(invoice_details.parse_errors) > 0:
+        save_parse_errors(invoice_excel, invoice_details, metrics)
+    #
+    # Match all the source transactions against the ledger at once, or only the changes since the
+    # previous run if its match state is given
+    with metrics.stage("match_invoices", len(source_transactions)):
+        if match_state is not None:
+            match_results, rematched = match_state.find_matches(
+                ledger, source_transactions, lambda l, s: find_matches(l, s, matcher, jobs, metrics))
+        else:
+            match_results = find_matches(ledger, source_transactions, matcher, jobs, metrics)
+            rematched = [True] * len(source_transactions)
+    if assignment == constant.ASSIGNMENT_ONE_TO_ONE:
+        with metrics.stage("assign_one_to_one", len(source_transactions)):
+            match_results, ambiguous_clusters = class_assignment.assign_one_to_one(ledger, source_transactions,
+                                                                                   match_results, metrics)
+            report_file = class_assignment.ambiguous_cluster_file(invoice_excel)
+            class_assignment.save_ambiguous_clusters(report_file, ambiguous_clusters, ledger, source_transactions)
+        logging.info("一對一配對: 多重候選群組 %d 組，儲存於 %s", len(ambiguous_clusters), report_file)
+    #
+    # Traverse the source invoice records and annotate the matching results. Decisions are
+    # logged one line each, and in detail only if the log level is debug, see utility.initialization()
+    annotations = {}
+    number_of_matched_found = 0
+    log_decisions = logging.getLogger().isEnabledFor(logging.INFO)
+    log_details = logging.getLogger().isEnabledFor(logging.DEBUG)
+    with metrics.stage("annotate_invoices", len(source_rows)):
+        for k, js in enumerate(source_rows):
+            metrics.progress("annotate_invoices", k + 1, len(source_rows))
+            source_transaction = source_transactions[k]
+            # results kept from the previous run are annotated without being logged again
+            if rematched[k] and log_decisions:
+                log_decision(source_transaction, ledger, match_results[k])
+            if rematched[k] and log_details:
+                # call the class method to display the object contents
+                source_transaction.display_transaction()
+            for it in match_results[k]:
                 number_of_matched_found += 1
-                logging.info("已匹配交易數量: %d", number_of_matched_found)
-                target_transaction.display_transaction()
-                logging.info("==========================================================")
-                sourceWs_temp.write(js, constant.COL_INVOICE_CHECKED, "是")
-                ext_sales_ws.cell(row=jt,
-                                  column=constant.COL_ES_UNIFIED_INVOICE_NO+1,
-                                  value=source_transaction.invoice_number)
-                # if source_transaction.exchange_rate != 1.0:
-                #     ext_sales_ws.cell(row=jt,
-                #                       column=constant.COL_ES_UINV_AMT+1,
-                #                       value=source_transaction.invoice_amount_NT)
-                #     ext_sales_ws.cell(row=jt, column=constant.COL_ES_UINV_AMT+1).number_format='"$"#,##0_-'
-                ext_sales_ws.cell(row=jt,
-                                  column=constant.COL_ES_UINV_AMT+1,
-                                  value=source_transaction.invoice_amount_NT)
-                ext_sales_ws.cell(row=jt, column=constant.COL_ES_UINV_AMT+1).number_format='"$"#,##0_-'
-                ext_sales_ws.cell(row=jt,
-                                  column=constant.COL_ES_INVOICE_MATCHED+1,
-                                  value="配對")
-
-        if jt == ext_sales_ws.max_row and match_found is False:
-            logging.info(">>>>>>>>>>>>>> 無法找到匹配交易紀錄 <<<<<<<<<<<<<<<, ext_sales_ws.max_row %s", ext_sales_ws.max_row)
-            logging.info("==========================================================")
-            sourceWs_temp.write(js, constant.COL_INVOICE_CHECKED, "否")
-    bar.finish()
-    if GUI_caller:
-        GUI_caller.print_log("3. 原始發票資料檔比對完成，比對結果註記在 %s 的'發票配對'欄位" % invoice_excel)
+                if rematched[k] and log_details:
+                    logging.debug(">>>>>>>>>>>>>> 找到匹配交易紀錄 <<<<<<<<<<<<<<<")
+                    logging.debug("已匹配交易數量: %d", number_of_matched_found)
+                    ledger.transaction(it).display_transaction()
+                    logging.debug("==========================================================")
+                invoice_annotations.mark(js, "是")
+                annotations[ledger.row[it]] = (source_transaction.invoice_number,
+                                               source_transaction.invoice_amount_NT)
+
+            if len(match_results[k]) == 0:
+                if rematched[k] and log_details:
+                    logging.debug(">>>>>>>>>>>>>> 無法找到匹配交易紀錄 <<<<<<<<<<<<<<<, 總帳應收帳款筆數 %s", len(ledger))
+                    logging.debug("==========================================================")
+                invoice_annotations.mark(js, "否")
+    number_of_unmatched = sum(1 for matched in match_results if len(matched) == 0)
+    number_of_invalid = len(set(k for k, field, value, reason in invoice_details.parse_errors))
+    number_of_counted = invoice_details.number_of_void + number_of_invalid + number_of_out_of_range + len(source_rows)
+    if number_of_counted != len(invoice_details):
+        logging.warning("發票筆數不符: 作廢、無效、期間外與比對發票共 %d 筆, 發票明細 %d 筆",
+                        number_of_counted, len(invoice_details))
+    summary = {"invoices": len(invoice_details),
+               "void": invoice_details.number_of_void,
+               "invalid": number_of_invalid,
+               "out_of_range": number_of_out_of_range,
+               "matched": len(source_rows) - number_of_unmatched,
+               "unmatched": number_of_unmatched,
+               "ledger_records": len(ledger),
+               "ledger_records_matched": len(annotations),
+               "rematched": sum(1 for flag in rematched if flag)}
+    metrics.update_counters(summary)
+    metrics.count("matches", number_of_matched_found)
+    # a ledger record matched by more than one invoice keeps the annotation of the last one only
+    metrics.count("ledger_annotations_overwritten", number_of_matched_found - len(annotations))
+    return invoice_annotations, annotations, summary
+
+
+#
+# Log and save the rows of the invoice details which can not be parsed, which are not matched
+#
+def save_parse_errors(invoice_excel, invoice_details, metrics):
+    report_file = class_invoice_parser.parse_error_file(invoice_excel)
+    class_invoice_parser.save_parse_errors(report_file, invoice_details.parse_errors, invoice_details.invoice_no)
+    for k, field, value, reason in invoice_details.parse_errors:
+        logging.warning("發票明細第 %d 列 %s %s: %s '%s'，不列入比對", k + 2, invoice_details.invoice_no[k], reason,
+                        field, value)
+    logging.warning("發票明細無法解析 %d 列，儲存於 %s", len(invoice_details.parse_errors), report_file)
+    metrics.count("invoice_parse_errors", len(invoice_details.parse_errors))
+
+
+#
+# Log one matching decision in one line of tab separated fields:
+#   比對, invoice number, buyer, invoice date, currency, NTD amount, 是/否, rows of the matched
+#   records in the external sales worksheet
+# The rows lead to the matched ledger records, so that the decision can be expanded for audits
+#
+def log_decision(source_transaction, ledger, matched_positions):
+    logging.info("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s", constant.LOG_DECISION_TAG,
+                 source_transaction.invoice_number, source_transaction.buyer_name,
+                 source_transaction.invoice_date, source_transaction.function_currency,
+                 source_transaction.invoice_amount_NT, "是" if len(matched_positions) > 0 else "否",
+                 ",".join(str(ledger.row[it]) for it in matched_positions))
+
+
+#
+# Match the source transactions against the ledger snapshot with the selected matching engine,
+# see class_matching_engine.py
+#   1. constant.MATCHER_INDEX: probe the candidate index per invoice
+#   2. constant.MATCHER_NUMPY: range queries on sorted NumPy arrays per batch of invoices,
+#      falls back to MATCHER_INDEX if NumPy is not installed
+#   3. constant.MATCHER_REFERENCE: check every pair of invoice and ledger record
+# With jobs > 1, the work is partitioned by buyer and matched by the selected matcher in a pool of
+# jobs worker processes
+#
+def find_matches(ledger, source_transactions, matcher, jobs=1, metrics=None):
+    if jobs > 1:
+        return class_parallel_matcher.match_all(ledger, source_transactions, matcher, jobs, metrics)
+    return class_matching_engine.matching_engine(matcher).match_all(ledger, source_transactions, metrics)
+
+
+#
+# Save the '發票配對' results of the invoice details with the annotation mode, constant.ANNOTATION_*
+#
+def save_invoice_annotations(GUI_caller, invoice_annotations, annotation_mode, metrics):
+    with metrics.stage("save_invoice_details", len(invoice_annotations) - 1):
+        annotation_excel = invoice_annotations.save(annotation_mode)
+    report_invoice_annotations(GUI_caller, annotation_excel, annotation_mode)
+    return annotation_excel
+
+
+#
+# Save both result files, the results of the invoice details and the external sales Excel file. With
+# a side process, the results of the invoice details are saved in it while the external sales Excel
+# file is written
+#
+def save_results(GUI_caller, invoice_annotations, annotation_mode, header, gl_rows, annotations, ext_sales_excel,
+                 metrics, side_process=None):
+    if side_process is None:
+        save_invoice_annotations(GUI_caller, invoice_annotations, annotation_mode, metrics)
+        report_progress(GUI_caller, "4. 總帳濾出應收帳款資料，儲存於 %s" % ext_sales_excel)
+        save_external_sales(header, gl_rows, annotations, ext_sales_excel, metrics)
+        return
+    side_process.submit("save_invoice_details", invoice_annotations.save, annotation_mode)
+    save_external_sales(header, gl_rows, annotations, ext_sales_excel, metrics)
+    annotation_excel = side_process.result("save_invoice_details", metrics, len(invoice_annotations) - 1)
+    report_invoice_annotations(GUI_caller, annotation_excel, annotation_mode)
+    report_progress(GUI_caller, "4. 總帳濾出應收帳款資料，儲存於 %s" % ext_sales_excel)
+
+
+def report_invoice_annotations(GUI_caller, annotation_excel, annotation_mode):
+    if annotation_mode == constant.ANNOTATION_COPY:
+        report_progress(GUI_caller, "3. 原始發票資料檔比對完成，比對結果註記在 %s 的'發票配對'欄位" % annotation_excel)
     else:
-        print("3. 原始發票資料檔比對完成，比對結果註記在 %s 的'發票配對'欄位" % invoice_excel)
-    sourceWb_temp.save(invoice_excel)
+        report_progress(GUI_caller, "3. 原始發票資料檔比對完成，比對結果儲存於 %s" % annotation_excel)
+
+
+#
+# Progress messages go to the log widget if called from GUI, or to the console otherwise
+#
+def report_progress(GUI_caller, msg):
     if GUI_caller:
-        GUI_caller.print_log("4. 總帳濾出應收帳款資料，儲存於 %s" % ext_sales_excel)
+        GUI_caller.print_log(msg)
     else:
-        print("4. 總帳濾出應收帳款資料，儲存於 %s" % ext_sales_excel)
-    ext_sales_wb.save(ext_sales_excel)
-    return True
+        print(msg)
+
+
+#
+# Save the metrics of the run next to the external sales Excel file, and report the time taken
+#
+def save_metrics(GUI_caller, metrics, ext_sales_excel):
+    metrics_file = class_metrics.metrics_file(ext_sales_excel)
+    metrics.save(metrics_file)
+    logging.info("執行效能: %s", "; ".join(metrics.summary()))
+    report_progress(GUI_caller, "執行時間 %.1f 秒，效能紀錄儲存於 %s" % (metrics.as_dict()["elapsed_seconds"], metrics_file))
 
 
 #
@@ -305,7 +591,7 @@ def main(argv):
     # process argv and opts
     opts_args = class_opts.Opts(argv)
     # Initialize the execution
-    utility.initialization()
+    utility.initialization(verbosity=opts_args.verbosity)
     #
     # Fetch target general ledger Excel file, external sales Excel file and invoice duration
     #
@@ -320,11 +606,45 @@ def main(argv):
     if invoice_end_date != "":
         print("對帳截止日期: ", invoice_end_date.strftime("%Y/%m/%d"))
 
-    print("1. 進行總帳前處理")
-    # preproc_general_ledger(general_ledger, external_sales, None)
-    preproc_general_ledger_with_date(general_ledger, external_sales, invoice_start_date, invoice_end_date, None)
-    print("2. 進行原始發票資料檔比對")
-    match_invoice_and_external_sales(invoice_details, external_sales, None)
+    if opts_args.cache_dir != "":
+        ledger_cache = class_ledger_cache.LedgerCache(opts_args.cache_dir)
+    else:
+        ledger_cache = None
+    if opts_args.store_file != "":
+        try:
+            ledger_store = class_ledger_store.LedgerStore(opts_args.store_file)
+        except ValueError as e:
+            print(e)
+            sys.exit()
+    else:
+        ledger_store = None
+    gl_filter = class_row_filter.GeneralLedgerFilter(opts_args.voucher_types, opts_args.account_patterns)
+    if opts_args.incremental:
+        match_state = class_match_state.MatchState(class_match_state.match_state_file(external_sales),
+                                                   class_match_state.config_key(gl_filter))
+    else:
+        match_state = None
+    metrics = class_metrics.console_metrics()
+    if opts_args.pipeline:
+        reconcile_invoice_and_general_ledger(invoice_details, general_ledger, external_sales,
+                                             invoice_start_date, invoice_end_date, None, opts_args.matcher,
+                                             opts_args.jobs, ledger_cache, ledger_store, match_state,
+                                             opts_args.annotation_mode, opts_args.assignment, metrics, gl_filter)
+    else:
+        # the invoice details are read in a side process while the general ledger is pre-processed
+        with class_side_process.SideProcess(class_side_process.worth_a_side_process(invoice_details)) as side_process:
+            side_process.submit("read_invoice_details", class_invoice_details.read_invoice_details, invoice_details)
+            print("1. 進行總帳前處理")
+            # preproc_general_ledger(general_ledger, external_sales, None)
+            preproc_general_ledger_with_date(general_ledger, external_sales, invoice_start_date, invoice_end_date,
+                                             None, ledger_cache, ledger_store, metrics, gl_filter)
+            print("2. 進行原始發票資料檔比對")
+            match_invoice_and_external_sales(invoice_details, external_sales, None, opts_args.matcher,
+                                             opts_args.jobs, match_state, opts_args.annotation_mode,
+                                             opts_args.assignment, metrics, side_process, invoice_start_date,
+                                             invoice_end_date)
+    for line in metrics.summary():
+        print("\t" + line)
 
 
 def generate_excel(spread_sheet):
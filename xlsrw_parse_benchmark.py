@@ -0,0 +1,114 @@
+#
+# File: xlsrw_parse_benchmark.py
+# Subject: Micro-benchmark of parsing the totals and remarks of the invoice details, the per-row
+#          functions of utility.py against the column parser of class_invoice_parser.py
+# Brief: Entry of the parsing micro-benchmark
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#
+# Note:
+#   1. The columns are read from an invoice details .xls if given, or generated in memory in the
+#      format of synthetic_data.py otherwise, so that only the parsing is measured
+#   2. Both parsers are run REPEAT times on the same columns and the best time is reported; their
+#      results are compared on every row the per-row functions can parse
+#
+import random
+import sys
+import time
+
+import class_invoice_details
+import class_invoice_parser
+import constant
+import utility
+
+REPEAT = 5
+DEFAULT_ROWS = 100000
+USD_RATIO = 0.2
+VOID_RATIO = 0.03
+
+
+#
+# Status, remark and total columns of number_of_rows generated invoices
+#
+def generate_columns(number_of_rows, seed=1):
+    rnd = random.Random(seed)
+    statuses, remarks, totals = [], [], []
+    for _ in range(number_of_rows):
+        sales = rnd.randrange(1000, 2000000)
+        total = sales + round(sales * 0.05)
+        if rnd.random() < USD_RATIO:
+            exchange_rate = round(rnd.uniform(27.5, 31.5), 2)
+            remarks.append("%s %.2f, %s USD %s" % (constant.EXCHANGE_RATE_LEADING_CHRS, exchange_rate,
+                                                   constant.USD_AMOUNT_CHRS, "{:,.2f}".format(sales / exchange_rate)))
+        else:
+            remarks.append("")
+        statuses.append("作廢" if rnd.random() < VOID_RATIO else "開立")
+        totals.append("{:,}".format(total))
+    return statuses, remarks, totals
+
+
+def read_columns(invoice_excel):
+    details = class_invoice_details.read_invoice_details(invoice_excel)
+    totals = []
+    for k in range(len(details)):
+        # the text of the total is not kept by InvoiceDetails, it is written back for the benchmark
+        totals.append("{:,}".format(details.total[k]) if details.is_valid(k) else "")
+    return details.status, details.remark, totals
+
+
+#
+# The per-row parsing of the invoice details before the column parser, see utility.py
+#
+def parse_per_row(statuses, remarks, totals):
+    results = []
+    for status, remark, total in zip(statuses, remarks, totals):
+        if status == class_invoice_parser.VOID_STATUS:
+            results.append((0.0, 0, 1.0))
+            continue
+        try:
+            amount = total if type(total) is float else utility.comma_separated_amount_to_float(total)
+            if utility.is_usd_remark(remark):
+                results.append((amount, 1, utility.exchange_rate_of_remark(remark)))
+            else:
+                results.append((amount, 0, 1.0))
+        except ValueError:
+            results.append(None)
+    return results
+
+
+def best_seconds(function, *args):
+    best = None
+    result = None
+    for _ in range(REPEAT):
+        start_time = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start_time
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main(argv):
+    if len(argv) > 1:
+        statuses, remarks, totals = read_columns(argv[1])
+    else:
+        statuses, remarks, totals = generate_columns(DEFAULT_ROWS)
+    per_row_seconds, per_row = best_seconds(parse_per_row, statuses, remarks, totals)
+    column_seconds, parsed = best_seconds(class_invoice_parser.parse_invoice_columns, statuses, remarks, totals)
+    number_of_rows = len(statuses)
+    mismatched = 0
+    for k, result in enumerate(per_row):
+        if result is not None and parsed.valid[k] and \
+                result != (parsed.total[k], parsed.is_usd[k], parsed.exchange_rate[k]):
+            mismatched += 1
+    print("發票 %d 列, 最佳 %d 次" % (number_of_rows, REPEAT))
+    print("\t%-24s %10s %14s" % ("parser", "seconds", "rows/s"))
+    for name, seconds in (("per-row (utility.py)", per_row_seconds), ("column", column_seconds)):
+        print("\t%-24s %10.4f %14.0f" % (name, seconds, number_of_rows / seconds if seconds > 0 else 0))
+    print("加速 %.1f 倍, 結果不一致 %d 列, 無法解析 %d 列" %
+          (per_row_seconds / column_seconds if column_seconds > 0 else 0, mismatched, len(parsed.errors)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[0:])
@@ -0,0 +1,65 @@
+#
+# File: xlsrw_service.py
+# Subject: Keep general ledgers and invoice details parsed in memory between reconciliations, so that
+#          re-running the same period after small edits only matches and writes the results
+# Brief: Entry of the local reconciliation service
+# Coder: alfan-ntu
+# Created Date: 2026/10/18
+# Revision:
+#   1. 2026/10/18: v. 0.1 1st creation
+#   2. 2026/10/18: v. 0.2 token of the service written at start and removed at stop
+#
+# Note:
+#   1. The service listens on constant.SERVICE_HOST, i.e. this computer only, see
+#      class_reconcile_service.py for its HTTP/JSON API, and class_service_client.py for its client
+#   2. Jobs are submitted with file paths, which are read by the service; relative paths of the
+#      invoice details and the general ledger are relative to the directory the service is started
+#      in, the output is relative to, and restricted to, the folder of the invoice details
+#   3. Ctrl-C stops the service; the running job is cancelled
+#   4. Clients authenticate with the token written to constant.SERVICE_TOKEN_FILE at each start,
+#      which class_service_client.py reads
+#
+import os
+import sys
+
+import class_ledger_cache
+import class_opts
+import class_reconcile_service
+import constant
+import utility
+
+SERVICE_LOG_FILE = "./log/excel_lookup_service.log"
+
+
+#
+# main entry of the local reconciliation service
+#
+def main(argv):
+    opts_args = class_opts.ServiceOpts(argv)
+    os.makedirs(os.path.dirname(SERVICE_LOG_FILE), exist_ok=True)
+    utility.initialization(SERVICE_LOG_FILE)
+    if opts_args.cache_dir != "":
+        ledger_cache = class_ledger_cache.LedgerCache(opts_args.cache_dir)
+    else:
+        ledger_cache = None
+    service = class_reconcile_service.ReconcileService(opts_args.max_entries, ledger_cache, opts_args.watch_dir,
+                                                       opts_args.poll_seconds)
+    server = class_reconcile_service.service_server(service, class_reconcile_service.write_service_token(),
+                                                    constant.SERVICE_HOST, opts_args.port)
+    service.start()
+    print("對帳服務: http://%s:%d" % (constant.SERVICE_HOST, opts_args.port))
+    if opts_args.watch_dir != "":
+        print("監看資料夾: %s" % os.path.abspath(opts_args.watch_dir))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("對帳服務停止")
+    finally:
+        server.server_close()
+        service.stop()
+        class_reconcile_service.remove_service_token()
+        utility.shutdown_logging()
+
+
+if __name__ == "__main__":
+    main(sys.argv[0:])